@@ -0,0 +1,366 @@
+import threading
+from collections import Counter, OrderedDict
+from datetime import date, datetime, timedelta
+import numpy as np
+from analytics import run_lengths
+from records import HabitRecords
+from schedule import compile_habit
+from storage import get_storage
+
+# Materialized per-user completion aggregates.
+# For every user we keep, over a window of dates [lo, hi]:
+#   scheduled[day] - number of habits due that day
+#   done[day]      - number of those that were marked done
+# plus per-habit streak and completion-rate figures. The window starts at the
+# earliest habit start date (nothing is due before it) and ends HORIZON_DAYS
+# after today, so a calendar page reads O(days displayed). Months past the
+# window are counted on the fly and not kept.
+#
+# The write paths in habit_data keep the aggregates current incrementally:
+# a mark touches one day and one habit's figures; adding, editing or removing a
+# habit only subtracts / adds that habit's occurrences. Each habit keeps a
+# histogram of its streak lengths, so a mark only looks at the run of done
+# occurrences around the marked day (a mark for today not even that) and the
+# longest streak is the largest length left in the histogram. Entries are tagged with
+# the storage stamp and rebuilt from scratch if another process changed the data.
+# The writers pass the stamps the backend read under its write lock just before
+# and after their write: a change is only applied to an entry tagged with the
+# "before" stamp, and the entry is only re-tagged while the user's stamp is
+# still the "after" one. Anything else means another process wrote in between,
+# and the entry is dropped. Backends without a stamp are not cached at all.
+# verify() compares an entry against a full recompute (see /stats?verify=1).
+
+HORIZON_DAYS = 400
+MAX_USERS = 1000
+
+def _day(value):
+    return value if isinstance(value, date) else datetime.strptime(value, "%Y-%m-%d").date()
+
+class HabitAggregate:
+    """One habit's compiled recurrence, the days it was marked done (a bitmap) and its streak figures."""
+
+    def __init__(self, habit, records):
+        self.habit = dict(habit)
+        self.recurrence = compile_habit(habit)
+        if isinstance(records, HabitRecords):
+            self.done = HabitRecords(records.origin, records.bits)
+        else:
+            # Records with a bad date are never due; maintenance.py reports and removes them.
+            self.done = HabitRecords.from_dict(records, strict=False)
+        self.stats = None
+        self.today = None
+        # Over the counted occurrences: every occurrence up to today, except today's while it is still open.
+        self.scheduled = 0
+        self.completed = 0
+        self.current = 0
+        self.runs = Counter()  # streak length -> number of streaks that long
+
+    def compute_stats(self, today):
+        """Recompute scheduled/done totals, completion rate and streaks over occurrences up to today (full scan)."""
+        self.today = today
+        occurrences = np.array([self.done.is_done(d) for d in self.recurrence.occurrences(self.recurrence.start, today)],
+                               dtype=bool)
+        if len(occurrences) and self.recurrence.occurs_on(today) and not occurrences[-1]:
+            # Today's occurrence is still open: it neither counts nor breaks the streak.
+            occurrences = occurrences[:-1]
+        lengths = run_lengths(occurrences)
+        self.runs = Counter(lengths.tolist())
+        self.current = int(lengths[-1]) if len(occurrences) and occurrences[-1] else 0
+        self.scheduled = len(occurrences)
+        self.completed = int(occurrences.sum())
+        self._update_stats()
+
+    def _update_stats(self):
+        total = self.scheduled
+        self.stats = {"name": self.habit["name"], "scheduled": total, "done": self.completed,
+                      "rate": round(self.completed / total, 4) if total else None,
+                      "current_streak": self.current, "longest_streak": max(self.runs, default=0)}
+
+    def _run(self, day, forward, last=None):
+        """Count the done occurrences next to `day`, walking back to the start or forward to `last`.
+
+        Returns (count, reached): reached is True if every occurrence up to the end of the walk was done.
+        """
+        count = 0
+        span = 32  # days per step, doubled every step
+        if forward:
+            begin, stop = day.toordinal() + 1, last.toordinal()
+            while begin <= stop:
+                end = min(begin + span - 1, stop)
+                for occurrence in self.recurrence.occurrences(date.fromordinal(begin), date.fromordinal(end)):
+                    if not self.done.is_done(occurrence):
+                        return count, False
+                    count += 1
+                begin, span = end + 1, span * 2
+            return count, True
+        end, stop = day.toordinal() - 1, self.recurrence.start.toordinal()
+        while end >= stop:
+            begin = max(end - span + 1, stop)
+            for occurrence in reversed(list(self.recurrence.occurrences(date.fromordinal(begin), date.fromordinal(end)))):
+                if not self.done.is_done(occurrence):
+                    return count, False
+                count += 1
+            end, span = begin - 1, span * 2
+        return count, True
+
+    def _count_run(self, length, sign):
+        if length:
+            self.runs[length] += sign
+            if not self.runs[length]:
+                del self.runs[length]
+
+    def mark(self, day, done):
+        """Set or clear one day and update the figures from it and its neighbouring occurrences.
+
+        Returns False if the day already had that value.
+        """
+        if self.done.is_done(day) == bool(done):
+            return False
+        self.done.set_done(day, done)
+        if self.stats is None or day > self.today or not self.recurrence.occurs_on(day):
+            return True
+        sign = 1 if done else -1
+        self.completed += sign
+        if day == self.today:
+            # Today's occurrence joins (or leaves) the counted ones at the end, right after the current streak.
+            self.scheduled += sign
+            left, right, reached = self.current - (0 if done else 1), 0, True
+        else:
+            left, _ = self._run(day, False)
+            today_counted = self.done.is_done(self.today) or not self.recurrence.occurs_on(self.today)
+            right, reached = self._run(day, True, self.today if today_counted else self.today - timedelta(days=1))
+        joined = left + 1 + right
+        for length in ((left, right) if done else (joined,)):
+            self._count_run(length, -1)
+        for length in ((joined,) if done else (left, right)):
+            self._count_run(length, 1)
+        if reached:
+            # The changed run reaches the last counted occurrence: it is the current streak.
+            self.current = joined if done else (left if day == self.today else right)
+        self._update_stats()
+        return True
+
+class UserAggregates:
+    """Day counts and habit aggregates for one user."""
+
+    def __init__(self, data, today):
+        self.lock = threading.Lock()
+        self.today = today
+        # name -> [HabitAggregate]; a list because older data may hold several habits with one name
+        self.habits = {}
+        for habit in data["habits"]:
+            self.habits.setdefault(habit["name"], []).append(
+                HabitAggregate(habit, data["records"].get(habit["name"], {})))
+        starts = [h.recurrence.start for h in self.all_habits()]
+        self.lo = min(starts) if starts else today
+        self.hi = self.lo - timedelta(days=1)
+        self.scheduled = {}
+        self.done = {}
+        self.extend(today + timedelta(days=HORIZON_DAYS))
+        for habit in self.all_habits():
+            habit.compute_stats(today)
+
+    def all_habits(self):
+        """Return every HabitAggregate."""
+        return [habit for same_name in self.habits.values() for habit in same_name]
+
+    def _apply(self, habit, sign, first, last):
+        """Add (sign=1) or subtract (sign=-1) a habit's occurrences in first..last to the day counts."""
+        for day in habit.recurrence.occurrences(first, last):
+            self.scheduled[day] = self.scheduled.get(day, 0) + sign
+            if habit.done.is_done(day):
+                self.done[day] = self.done.get(day, 0) + sign
+
+    def extend(self, hi):
+        """Materialize day counts up to hi."""
+        if hi <= self.hi:
+            return
+        first = self.hi + timedelta(days=1)
+        for habit in self.all_habits():
+            self._apply(habit, 1, first, hi)
+        self.hi = hi
+
+    def advance(self, today):
+        """Refresh date-dependent figures (streaks, horizon) when the current date moves on."""
+        if today != self.today:
+            self.today = today
+            self.extend(today + timedelta(days=HORIZON_DAYS))
+            for habit in self.all_habits():
+                habit.compute_stats(today)
+
+    def add_habit(self, habit, records):
+        aggregate = HabitAggregate(habit, records)
+        if aggregate.recurrence.start < self.lo:
+            # Nothing else is due before the old window start, so the window can simply grow.
+            self.lo = aggregate.recurrence.start
+        self._apply(aggregate, 1, self.lo, self.hi)
+        aggregate.compute_stats(self.today)
+        self.habits.setdefault(habit["name"], []).append(aggregate)
+
+    def remove_habits(self, name):
+        """Remove every habit with the given name."""
+        for aggregate in self.habits.pop(name, []):
+            self._apply(aggregate, -1, self.lo, self.hi)
+
+    def mark(self, name, day, done):
+        for aggregate in self.habits.get(name, []):
+            if aggregate.mark(day, done) and self.lo <= day <= self.hi and aggregate.recurrence.occurs_on(day):
+                self.done[day] = self.done.get(day, 0) + (1 if done else -1)
+
+    def day_counts(self, first, last):
+        """Return [(day, scheduled, done)] for every day in first..last."""
+        beyond = {}  # day -> [scheduled, done] for days past the window
+        if last > self.hi:
+            for habit in self.all_habits():
+                for day in habit.recurrence.occurrences(max(first, self.hi + timedelta(days=1)), last):
+                    counts = beyond.setdefault(day, [0, 0])
+                    counts[0] += 1
+                    counts[1] += habit.done.is_done(day)
+        counts = []
+        for ordinal in range(first.toordinal(), last.toordinal() + 1):
+            day = date.fromordinal(ordinal)
+            if day > self.hi:
+                counts.append((day, *beyond.get(day, (0, 0))))
+            else:
+                counts.append((day, self.scheduled.get(day, 0), self.done.get(day, 0)))
+        return counts
+
+class AggregateStore:
+    """Thread-safe LRU of UserAggregates, kept in step with the storage stamp.
+
+    The store lock only guards the LRU itself; each UserAggregates has its own
+    lock for reads and incremental changes.
+    """
+
+    def __init__(self, max_users=MAX_USERS):
+        self.max_users = max_users
+        self._entries = OrderedDict()  # username -> (stamp, UserAggregates)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def stamp(username):
+        """Return the storage stamp for the user (None if the backend has none)."""
+        storage = get_storage()
+        return storage.stamp(username) if hasattr(storage, "stamp") else None
+
+    def _get(self, username):
+        """Return the user's aggregates, rebuilding them if missing or stale.
+
+        The rebuild (storage load plus full recompute) runs outside the store
+        lock, so it only holds up this user; the result is installed unless an
+        entry with the same stamp got there first.
+        """
+        today = datetime.now().date()
+        stamp = self.stamp(username)
+        if stamp is None:
+            return UserAggregates(get_storage().load(username), today)
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None and entry[0] == stamp:
+                self._entries.move_to_end(username)
+                return entry[1]
+        aggregates = UserAggregates(get_storage().load(username), today)
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None and entry[0] == stamp:
+                aggregates = entry[1]
+            else:
+                self._entries[username] = (stamp, aggregates)
+                while len(self._entries) > self.max_users:
+                    self._entries.popitem(last=False)
+            self._entries.move_to_end(username)
+        return aggregates
+
+    def _read(self, username, read):
+        """Return read(aggregates) for the user's current aggregates, under their lock."""
+        aggregates = self._get(username)
+        with aggregates.lock:
+            aggregates.advance(datetime.now().date())
+            return read(aggregates)
+
+    def _updated(self, username, stamps, change):
+        """Apply an incremental change to a cached entry and re-stamp it (no-op if nothing is cached).
+
+        stamps: the (before, after) stamps around the write. The entry is dropped
+        if it is not tagged with `before` or the user's stamp is no longer `after`.
+        """
+        before, after = stamps or (None, None)
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return
+            if before is None or entry[0] != before:
+                del self._entries[username]
+                return
+        aggregates = entry[1]
+        with aggregates.lock:
+            change(aggregates)
+        with self._lock:
+            # Re-tag only our own entry: a concurrent rebuild or another write may have replaced it.
+            if self._entries.get(username) is entry:
+                if self.stamp(username) == after:
+                    self._entries[username] = (after, aggregates)
+                else:
+                    del self._entries[username]
+
+    def day_counts(self, username, first, last):
+        """Return [(day, scheduled, done)] for first..last (dates)."""
+        return self._read(username, lambda aggregates: aggregates.day_counts(first, last))
+
+    def habit_stats(self, username):
+        """Return per-habit completion and streak figures."""
+        return self._read(username, lambda aggregates: [dict(h.stats) for h in aggregates.all_habits()])
+
+    def record_mark(self, username, habit_name, day, done, stamps):
+        """Incrementally apply a mark written by habit_data.mark_habit (stamps: around the write)."""
+        self._updated(username, stamps, lambda a: a.mark(habit_name, _day(day), done))
+
+    def habits_changed(self, username, before, data, stamps):
+        """Incrementally apply a change of habit definitions.
+
+        before: old habit list, data: the saved document, stamps: around the write.
+        """
+        def change(aggregates):
+            old, new = {}, {}
+            for habit in before:
+                old.setdefault(habit["name"], []).append(habit)
+            for habit in data["habits"]:
+                new.setdefault(habit["name"], []).append(habit)
+            for name in set(old) | set(new):
+                if old.get(name) != new.get(name) or name not in aggregates.habits:
+                    aggregates.remove_habits(name)
+                    for habit in new.get(name, []):
+                        aggregates.add_habit(habit, data["records"].get(name, {}))
+        self._updated(username, stamps, change)
+
+    def invalidate(self, username):
+        """Drop the user's aggregates; they are rebuilt on next read."""
+        with self._lock:
+            self._entries.pop(username, None)
+
+    def verify(self, username):
+        """Compare the user's aggregates with a full recompute. Returns a list of mismatch descriptions."""
+        def compare(current):
+            fresh = UserAggregates(get_storage().load(username), current.today)
+            fresh.extend(current.hi)
+            problems = []
+            first = min(current.lo, fresh.lo)
+            for (day, sched, done), (_, fresh_sched, fresh_done) in zip(
+                    current.day_counts(first, current.hi), fresh.day_counts(first, current.hi)):
+                if (sched, done) != (fresh_sched, fresh_done):
+                    problems.append(f"{day}: scheduled/done {sched}/{done}, expected {fresh_sched}/{fresh_done}")
+            if set(current.habits) != set(fresh.habits):
+                problems.append(f"habits {sorted(current.habits)}, expected {sorted(fresh.habits)}")
+            for name, same_name in fresh.habits.items():
+                expected = sorted(str(h.stats) for h in same_name)
+                actual = sorted(str(h.stats) for h in current.habits.get(name, []))
+                if name in current.habits and actual != expected:
+                    problems.append(f"{name}: stats {actual}, expected {expected}")
+            return problems
+        return self._read(username, compare)
+
+_store = AggregateStore()
+
+def get_aggregates():
+    """Return the process-wide AggregateStore."""
+    return _store
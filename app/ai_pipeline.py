@@ -0,0 +1,238 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from habit_data import apply_batch
+from metrics import OPENAI_PROMPT_TOKENS, OPENAI_SECONDS
+
+# AI planning pipeline for /ai_planning.
+# A chat turn makes two model calls: the conversational answer and the action
+# extractor. The extractor only needs the chat history (up to the user's new
+# message) and the current habits, so it runs on a small thread pool while the
+# answer is generated (and optionally streamed token by token). The extracted
+# actions are applied once both calls have finished.
+#
+# The OpenAI client is passed in, so the pipeline can be pointed at any
+# OpenAI-compatible server (e.g. a local stub via OPENAI_BASE_URL).
+# get_openai_client() returns one process-wide client whose HTTP connection
+# pool keeps connections alive between turns.
+#
+# Prompt size is bounded by a token budget (HABIT_AI_CONTEXT_TOKENS): the most
+# recent messages are sent verbatim, older ones are folded into a short
+# summary, and habits are sent as one compact line each instead of indented JSON.
+
+MODEL = "gpt-4.1-nano-2025-04-14"
+CONTEXT_TOKENS = int(os.getenv("HABIT_AI_CONTEXT_TOKENS", 2000))
+SUMMARY_TOKENS = CONTEXT_TOKENS // 4
+SUMMARY_SNIPPET_CHARS = 80
+
+logger = logging.getLogger("habit_tracker.ai")
+
+_client = None
+_client_lock = threading.Lock()
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("HABIT_AI_THREADS", 8)),
+                               thread_name_prefix="ai-extractor")
+
+def get_openai_client():
+    """Return the process-wide OpenAI client, created on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                # openai (and httpx/pydantic under it) is slow to import, so it is only
+                # loaded by the first AI request rather than at worker start-up.
+                import openai
+                # The client owns a thread-safe HTTP connection pool; sharing it across
+                # requests keeps connections (and their TLS sessions) alive.
+                _client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    return _client
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token for English text)."""
+    return len(text) // 4 + 1
+
+def encode_habits(habits):
+    """Compact one-line-per-habit encoding: 'name | schedule | start_date'."""
+    if not habits:
+        return "(no habits)"
+    return "\n".join(f"{h['name']} | {h.get('schedule', '')} | {h.get('start_date', '')}" for h in habits)
+
+def build_context(chat_history, budget=CONTEXT_TOKENS):
+    """Split chat history into (summary, recent) within a token budget.
+
+    recent is the longest suffix of the history that fits in the budget (always at
+    least the last message); summary condenses the older messages into short
+    snippets, keeping the newest ones, capped at SUMMARY_TOKENS ('' if none).
+    """
+    recent = []
+    used = 0
+    for msg in reversed(chat_history):
+        cost = estimate_tokens(msg["text"])
+        if recent and used + cost > budget:
+            break
+        recent.append(msg)
+        used += cost
+    recent.reverse()
+    older = chat_history[:len(chat_history) - len(recent)]
+    snippets = []
+    used = 0
+    for msg in reversed(older):
+        text = " ".join(msg["text"].split())
+        snippet = f"{'User' if msg['sender'] == 'user' else 'AI'}: {text[:SUMMARY_SNIPPET_CHARS]}"
+        cost = estimate_tokens(snippet)
+        if used + cost > SUMMARY_TOKENS:
+            break
+        snippets.append(snippet)
+        used += cost
+    snippets.reverse()
+    return "\n".join(snippets), recent
+
+def format_history(chat_history):
+    """Compact transcript: one 'User: ...' / 'AI: ...' line per message."""
+    return "\n".join(f"{'User' if m['sender'] == 'user' else 'AI'}: {m['text']}" for m in chat_history)
+
+def build_chat_messages(chat_history, habits_text):
+    """Build the messages for the conversational assistant."""
+    summary, recent = build_context(chat_history)
+    messages = [{"role": "system", "content": "You are a helpful assistant for a habit tracker app."}]
+    if summary:
+        messages.append({"role": "system", "content": f"Summary of earlier conversation:\n{summary}"})
+    for msg in recent:
+        if msg["sender"] == "user":
+            messages.append({"role": "user", "content": msg["text"]})
+        elif msg["sender"] == "ai":
+            messages.append({"role": "assistant", "content": msg["text"]})
+    # Add context about habits
+    messages.append({"role": "system", "content": f"Here are the user's current habits (name | schedule | start date):\n{habits_text}"})
+    return messages
+
+def build_extractor_messages(chat_history, habits_text):
+    """Build the messages for the action extraction assistant."""
+    summary, recent = build_context(chat_history)
+    extractor_prompt = (
+        "You are an expert at extracting structured actions from a chat history. "
+        "Given the following chat history and the user's current habits, extract a JSON array of actions to add, edit, remove, or remove all habits. "
+        "Each action must be an object with fields: action (add, remove, edit, or remove_all), name, schedule, start_date, old_name (if editing). "
+        "For a 'remove_all' action, only the action field is required. Respond ONLY with a JSON array, no explanations, no markdown, no extra text. "
+        "If the user requests to remove all habits, output: [ {\"action\": \"remove_all\"} ]\n"
+        "If the user confirms, asks you to choose, or refers to a previous suggestion, infer the habits to add from the previous assistant messages and extract them as add actions. "
+        "If you can't extract any actions, respond with an empty array: [].\n"
+        + ("Summary of earlier conversation:\n" + summary + "\n" if summary else "")
+        + "Chat history:\n" + format_history(recent) + "\n"
+        "Current habits (name | schedule | start date):\n" + habits_text + "\n"
+    )
+    return [{"role": "system", "content": "You extract structured actions from chat history."},
+            {"role": "user", "content": extractor_prompt}]
+
+def record_call(metrics, call, messages, started, usage=None):
+    """Append prompt-token and latency figures for one model call to metrics and log them."""
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    entry = {"call": call,
+             "prompt_tokens": prompt_tokens if prompt_tokens is not None
+             else sum(estimate_tokens(m["content"]) for m in messages),
+             "estimated": prompt_tokens is None,
+             "latency_ms": round((time.perf_counter() - started) * 1000, 1)}
+    metrics.append(entry)
+    OPENAI_SECONDS.observe(entry["latency_ms"] / 1000, call=call)
+    OPENAI_PROMPT_TOKENS.inc(entry["prompt_tokens"], call=call)
+    logger.info("openai %s: %s prompt tokens%s, %.1f ms", call, entry["prompt_tokens"],
+                " (estimated)" if entry["estimated"] else "", entry["latency_ms"])
+
+def extract_actions(openai_client, chat_history, habits_text, metrics):
+    """Run the extractor and return the parsed list of actions (empty on any error)."""
+    messages = build_extractor_messages(chat_history, habits_text)
+    started = time.perf_counter()
+    response = openai_client.chat.completions.create(
+        model=MODEL,
+        messages=messages
+    )
+    record_call(metrics, "extract", messages, started, response.usage)
+    try:
+        actions = json.loads(response.choices[0].message.content)
+    except Exception:
+        actions = []
+    return actions if isinstance(actions, list) else []
+
+def apply_actions(actions, username):
+    """Apply extracted actions to the user's habits in one batch. Returns a list of human-readable results."""
+    operations = [a for a in actions if isinstance(a, dict) and a.get("action") in ("add", "edit", "remove", "remove_all")]
+    if not operations:
+        return []
+    return [r["message"] for r in apply_batch(operations, username=username)]
+
+def apply_fallback(chat_history, username):
+    """If nothing was extracted but the last AI message was a confirmation, add the habits listed in the suggestion before it."""
+    operations = []
+    if len(chat_history) > 2:
+        last_ai = chat_history[-2]["text"].lower()
+        if any(word in last_ai for word in ["added", "set up", "successfully added"]):
+            habit_lines = re.findall(r"\d+\.\s*([A-Za-z0-9\s\-]+)[—-](.*)", chat_history[-3]["text"])
+            for habit in habit_lines:
+                name = habit[0].strip()
+                desc = habit[1].strip()
+                if name and desc:
+                    operations.append({"action": "add", "name": name, "schedule": "Daily"})
+    if not operations:
+        return []
+    return [r["message"] for r in apply_batch(operations, username=username)]
+
+class ChatTurn:
+    """One /ai_planning turn: starts the extractor in the background as soon as it is created."""
+
+    def __init__(self, openai_client, username, chat_history, user_habits):
+        self.openai_client = openai_client
+        self.username = username
+        self.chat_history = chat_history
+        self.user_habits = user_habits
+        self.habits_text = encode_habits(user_habits)
+        self.metrics = []
+        self.extraction = _executor.submit(extract_actions, openai_client, list(chat_history), self.habits_text,
+                                           self.metrics)
+
+    def answer(self):
+        """Return the full assistant answer."""
+        messages = build_chat_messages(self.chat_history, self.habits_text)
+        started = time.perf_counter()
+        response = self.openai_client.chat.completions.create(
+            model=MODEL,
+            messages=messages
+        )
+        record_call(self.metrics, "chat", messages, started, response.usage)
+        return response.choices[0].message.content
+
+    def stream_answer(self):
+        """Yield the assistant answer in chunks as the model produces them."""
+        messages = build_chat_messages(self.chat_history, self.habits_text)
+        started = time.perf_counter()
+        stream = self.openai_client.chat.completions.create(
+            model=MODEL,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        usage = None
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+        record_call(self.metrics, "chat", messages, started, usage)
+
+    def finish(self, answer):
+        """Record the answer, wait for the extractor and apply its actions. Returns the action results."""
+        self.chat_history.append({"sender": "ai", "text": answer})
+        try:
+            actions = self.extraction.result()
+        except Exception:
+            actions = []
+        results = apply_actions(actions, self.username)
+        if not results:
+            results = apply_fallback(self.chat_history, self.username)
+        # If any actions were performed, add a summary message to chat history
+        if results:
+            self.chat_history.append({"sender": "ai", "text": "<br>".join(results)})
+        return results
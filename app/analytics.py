@@ -0,0 +1,109 @@
+from datetime import date, datetime
+import numpy as np
+from records import HabitRecords
+from schedule import MonthlyRecurrence, PeriodicRecurrence, WeekdayRecurrence, compile_habit
+from storage import get_storage
+
+# Vectorized completion statistics for long date ranges (year heatmaps, stats).
+# Instead of looping days x habits in Python, we build two habits x days
+# boolean matrices in one pass:
+#   scheduled[h, d] - habit h is due on day d
+#   done[h, d]      - habit h was marked done on day d
+# and derive day colors, completion rates and streaks from them.
+
+COLORS = np.array(['gray', 'red', 'orange', 'green'])
+
+def scheduled_row(recurrence, days):
+    """Return a boolean array telling on which of `days` (datetime64[D]) the recurrence occurs."""
+    start = np.datetime64(recurrence.start, 'D')
+    offsets = (days - start).astype(np.int64)
+    active = offsets >= 0
+    if isinstance(recurrence, PeriodicRecurrence):
+        return active & (offsets % recurrence.period == 0)
+    if isinstance(recurrence, MonthlyRecurrence):
+        day_of_month = (days - days.astype('datetime64[M]')).astype(np.int64) + 1
+        return active & (day_of_month == recurrence.day)
+    if isinstance(recurrence, WeekdayRecurrence):
+        # 1970-01-01 was a Thursday (weekday 3 with Monday = 0).
+        weekday = (days.astype(np.int64) + 3) % 7
+        return active & np.isin(weekday, list(recurrence.weekdays))
+    # Unknown recurrence kinds fall back to their own occurrence generator.
+    row = np.zeros(len(days), dtype=bool)
+    first = days[0].astype(date)
+    for day in recurrence.occurrences(first, days[-1].astype(date)):
+        row[(day - first).days] = True
+    return row
+
+def completion_matrix(habits, records, first, last):
+    """Build the habits x days `scheduled` and `done` matrices for first..last (inclusive dates).
+
+    Returns (days, scheduled, done) where days is a datetime64[D] array.
+    """
+    days = np.arange(np.datetime64(first, 'D'), np.datetime64(last, 'D') + 1)
+    scheduled = np.zeros((len(habits), len(days)), dtype=bool)
+    done = np.zeros((len(habits), len(days)), dtype=bool)
+    for i, habit in enumerate(habits):
+        scheduled[i] = scheduled_row(compile_habit(habit), days)
+        habit_records = records.get(habit["name"])
+        if habit_records is None:
+            continue
+        if not isinstance(habit_records, HabitRecords):
+            habit_records = HabitRecords.from_dict(habit_records, strict=False)
+        if habit_records.origin is not None:
+            # The bitmap already is a done row, just shifted to start at its origin.
+            bits = np.unpackbits(np.frombuffer(habit_records.to_bytes(), dtype=np.uint8), bitorder='little')
+            index = np.arange(len(bits)) + (np.datetime64(habit_records.origin, 'D') - days[0]).astype(np.int64)
+            keep = (index >= 0) & (index < len(days)) & bits.astype(bool)
+            done[i, index[keep]] = True
+    return days, scheduled, done
+
+def day_colors(scheduled, done):
+    """Return the calendar color of every day column (same rules as habit_data.completion_color)."""
+    due = scheduled.sum(axis=0)
+    completed = (scheduled & done).sum(axis=0)
+    level = np.where(due == 0, 0, np.where(completed >= due, 3, np.where(completed > 0, 2, 1)))
+    return COLORS[level]
+
+def run_lengths(occurrences):
+    """Return the lengths of the runs of True values in a 1-D boolean array, in order."""
+    edges = np.diff(np.concatenate(([0], occurrences.astype(np.int8), [0])))
+    return np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+
+def streaks(occurrences):
+    """Return (current, longest) run of True values in a 1-D boolean array of a habit's occurrences."""
+    lengths = run_lengths(occurrences)
+    if not len(lengths):
+        return 0, 0
+    current = int(lengths[-1]) if occurrences[-1] else 0
+    return current, int(lengths.max())
+
+def completion_summary(first, last, username=None, today=None):
+    """Return per-day colors and per-habit completion rates and streaks for first..last (date objects).
+
+    Rates and streaks only consider occurrences up to `today` (default: the current date);
+    an occurrence due today that is not yet done does not break the current streak.
+    """
+    today = np.datetime64(today or datetime.now().date(), 'D')
+    data = get_storage().load_range(first.isoformat(), last.isoformat(), username)
+    habits = data["habits"]
+    days, scheduled, done = completion_matrix(habits, data["records"], first, last)
+    colors = day_colors(scheduled, done)
+    past = days <= today
+    stats = []
+    for i, habit in enumerate(habits):
+        due = scheduled[i] & past
+        occurrences = done[i][due]
+        if len(occurrences) and days[due][-1] == today and not occurrences[-1]:
+            occurrences = occurrences[:-1]
+        current, longest = streaks(occurrences)
+        total = len(occurrences)
+        completed = int(occurrences.sum())
+        stats.append({"name": habit["name"], "scheduled": total, "done": completed,
+                      "rate": round(completed / total, 4) if total else None,
+                      "current_streak": current, "longest_streak": longest})
+    return {"days": [{"date": str(d), "color": str(c)} for d, c in zip(days, colors)],
+            "habits": stats}
+
+def get_yearly_completion(year, username=None):
+    """Return completion_summary for every day of the given year."""
+    return completion_summary(date(year, 1, 1), date(year, 12, 31), username)
@@ -1,62 +1,134 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session
-from habit_data import add_habit, get_habits, mark_habit, get_agenda, get_monthly_completion, edit_habit, remove_habit
-import threading
-from datetime import datetime
+from flask import Blueprint, Flask, Response, g, make_response, render_template as flask_render_template, request, jsonify, redirect, url_for, session, stream_with_context
+from habit_data import valid_date, add_habit, get_habits, mark_habit, get_agenda, get_monthly_completion, edit_habit, remove_habit, apply_batch, get_habit_stats
+from aggregates import get_aggregates
+from analytics import get_yearly_completion
+from ai_pipeline import ChatTurn, get_openai_client
+from chat_log import get_chat_log
+from user_store import get_user_store
+from versions import get_versions
+from cache import DataCache
+from maintenance import start_maintenance_worker
+from events import get_events, sse_event
+import metrics
+import hashlib
+from datetime import date, datetime
 import calendar
+import time
 import os
-import json
-import openai
+import logging
 from dotenv import load_dotenv
-import hashlib
 
 load_dotenv()
 
-app = Flask(__name__, template_folder='templates', static_folder='static')
-app.secret_key = os.getenv('FLASK_SECRET_KEY', 'dev_secret')
+# Routes live on a blueprint; create_app() builds a configured Flask app around it
+# (wsgi.py for gunicorn, the __main__ block below for the development server).
+bp = Blueprint('habits', __name__)
+logger = logging.getLogger('habit_tracker')
+
+CHAT_PAGE_SIZE = 50
+CHAT_MAX_PAGE_SIZE = 200
+CHAT_CONTEXT_MESSAGES = 100  # messages handed to the AI pipeline, which trims them further by token budget
+
+# Rendered calendar months, keyed by (user, year, month) and stamped with the page's ETag.
+calendar_cache = DataCache(int(os.getenv('HABIT_RENDER_CACHE_MAX_BYTES', 8 * 1024 * 1024)), name='calendar')
+
+def template_stamp():
+    """Return a fingerprint of the templates, so rendered pages get new ETags after a deploy."""
+    template_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+    parts = []
+    for name in sorted(os.listdir(template_dir)):
+        st = os.stat(os.path.join(template_dir, name))
+        parts.append(f"{name}:{st.st_mtime_ns}:{st.st_size}")
+    return hashlib.sha1(",".join(parts).encode()).hexdigest()[:12]
+
+TEMPLATE_STAMP = template_stamp()
+
+def render_template(template_name, **context):
+    """flask.render_template, timed as the 'template_render' phase."""
+    with metrics.PHASE_SECONDS.time(phase='template_render'):
+        return flask_render_template(template_name, **context)
+
+@bp.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.profiler = metrics.profiler.start()
+
+@bp.after_app_request
+def record_status(response):
+    g.status = response.status_code
+    return response
+
+@bp.teardown_app_request
+def record_request(exc=None):
+    """Record the request latency per endpoint and finish a sampled profile."""
+    if 'request_started' not in g:
+        return
+    metrics.HTTP_SECONDS.observe(time.perf_counter() - g.request_started, endpoint=request.endpoint or 'unmatched',
+                                 method=request.method, status=g.get('status', 500))
+    if g.profiler is not None:
+        metrics.profiler.stop(g.profiler, request.endpoint or 'unmatched')
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text metrics for this worker process. Set HABIT_METRICS_TOKEN to require a bearer token."""
+    token = os.getenv('HABIT_METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 def get_current_user():
     """Return the username of the currently logged-in user from the session, or None if not logged in."""
     return session.get('username')
 
-def get_user_data_path(username):
-    """Return the path to the user's data.json file."""
-    return f"user_data/{username}/data.json"
+def current_etag(kinds, *extra):
+    """Return the ETag of a read endpoint for the current user: their data/chat versions plus request inputs (None if unversioned)."""
+    return get_versions().etag(get_current_user(), kinds, *extra)
 
-def get_user_chat_path(username):
-    """Return the path to the user's chat.json file, creating the directory if needed."""
-    user_dir = f"user_data/{username}"
-    os.makedirs(user_dir, exist_ok=True)
-    return f"{user_dir}/chat.json"
+def not_modified(etag):
+    """Return True if the request's If-None-Match already names this ETag."""
+    return etag is not None and request.if_none_match.contains(etag)
 
-@app.route('/')
+def with_etag(response, etag):
+    """Attach the ETag to a response and ask clients to revalidate it on every use."""
+    response = make_response(response)
+    if etag is None:
+        return response
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@bp.route('/')
 def index():
     if not get_current_user():
-        return redirect(url_for('login'))
+        return redirect(url_for('.login'))
     habits = get_habits(get_current_user())
     default_start_date = datetime.now().strftime('%Y-%m-%d')
     return render_template('index.html', habits=habits, default_start_date=default_start_date, username=get_current_user())
 
-@app.route('/add_habit', methods=['POST'])
+@bp.route('/add_habit', methods=['POST'])
 def add_habit_route():
     if not get_current_user():
-        return redirect(url_for('login'))
+        return redirect(url_for('.login'))
     name = request.form['name']
     schedule = request.form['schedule']
     start_date = request.form.get('start_date')
-    if not name or not schedule:
-        return redirect(url_for('index'))
+    if not name or not schedule or (start_date and not valid_date(start_date)):
+        return redirect(url_for('.index'))
     add_habit(name, schedule, start_date, username=get_current_user())
-    return redirect(url_for('index'))
+    return redirect(url_for('.index'))
 
-@app.route('/agenda')
+@bp.route('/agenda')
 def agenda():
     if not get_current_user():
-        return redirect(url_for('login'))
+        return redirect(url_for('.login'))
     date = request.args.get('date', datetime.now().strftime('%Y-%m-%d'))
+    etag = current_etag(('data',), 'agenda', date, TEMPLATE_STAMP)
+    if not_modified(etag):
+        return with_etag(Response(status=304), etag)
     agenda = get_agenda(date, username=get_current_user())
-    return render_template('agenda.html', agenda=agenda, date=date)
+    return with_etag(render_template('agenda.html', agenda=agenda, date=date), etag)
 
-@app.route('/mark', methods=['POST'])
+@bp.route('/mark', methods=['POST'])
 def mark():
     """API endpoint to mark a habit as done or not done for a specific date."""
     if not get_current_user():
@@ -64,16 +136,36 @@ def mark():
     habit = request.json['habit']
     date = request.json['date']
     done = request.json['done']
+    if not valid_date(date):
+        return jsonify({'success': False, 'error': 'date must be YYYY-MM-DD'}), 400
     mark_habit(habit, date, done, username=get_current_user())
     return jsonify({'success': True})
 
-@app.route('/calendar')
+@bp.route('/calendar')
 def calendar_view():
     if not get_current_user():
-        return redirect(url_for('login'))
+        return redirect(url_for('.login'))
     now = datetime.now()
-    year = int(request.args.get('year', now.year))
-    month = int(request.args.get('month', now.month))
+    try:
+        year = int(request.args.get('year', now.year))
+        month = int(request.args.get('month', now.month))
+        date(year, month, 1)
+    except (OverflowError, ValueError):
+        return 'year must be 1-9999 and month 1-12', 400
+    etag = current_etag(('data',), 'calendar', year, month, TEMPLATE_STAMP)
+    if not_modified(etag):
+        return with_etag(Response(status=304), etag)
+    if etag is None:
+        return render_calendar(year, month)
+    key = (get_current_user(), year, month)
+    page = calendar_cache.get(key, etag)
+    if page is None:
+        page = render_calendar(year, month)
+        calendar_cache.put(key, etag, page, len(page))
+    return with_etag(page, etag)
+
+def render_calendar(year, month):
+    """Render the calendar page for the current user's month."""
     days = get_monthly_completion(year, month, username=get_current_user())
     # Arrange days into weeks for calendar display
     first_weekday, num_days = calendar.monthrange(year, month)
@@ -103,7 +195,33 @@ def calendar_view():
     return render_template('calendar.html', weeks=weeks, year=year, month=month, month_name=month_name,
                            prev_month=prev_month, next_month=next_month, prev_year=prev_year, next_year=next_year)
 
-@app.route('/edit_habit', methods=['POST'])
+@bp.route('/calendar/year')
+def calendar_year():
+    """API endpoint returning every day's completion color for a year, plus per-habit rates and streaks."""
+    if not get_current_user():
+        return jsonify({'success': False, 'error': 'Not logged in'})
+    try:
+        year = int(request.args.get('year', datetime.now().year))
+        date(year, 1, 1)
+    except (OverflowError, ValueError):
+        return jsonify({'success': False, 'error': 'year must be 1-9999'}), 400
+    summary = get_yearly_completion(year, username=get_current_user())
+    return jsonify({'success': True, 'year': year, 'days': summary['days'], 'habits': summary['habits']})
+
+@bp.route('/stats')
+def stats():
+    """API endpoint returning each habit's completion rate and streaks from the materialized aggregates.
+
+    With ?verify=1 the aggregates are also checked against a full recompute and any mismatches are listed.
+    """
+    if not get_current_user():
+        return jsonify({'success': False, 'error': 'Not logged in'})
+    result = {'success': True, 'habits': get_habit_stats(get_current_user())}
+    if request.args.get('verify'):
+        result['mismatches'] = get_aggregates().verify(get_current_user())
+    return jsonify(result)
+
+@bp.route('/edit_habit', methods=['POST'])
 def edit_habit_route():
     """API endpoint to edit an existing habit's details."""
     if not get_current_user():
@@ -113,10 +231,13 @@ def edit_habit_route():
     name = data['name']
     schedule = data['schedule']
     start_date = data['start_date']
-    edit_habit(old_name, name, schedule, start_date, username=get_current_user())
+    if start_date and not valid_date(start_date):
+        return jsonify({'success': False, 'error': 'start_date must be YYYY-MM-DD'}), 400
+    if edit_habit(old_name, name, schedule, start_date, username=get_current_user()) is False:
+        return jsonify({'success': False, 'error': f"A habit named '{name}' already exists"})
     return jsonify({'success': True})
 
-@app.route('/remove_habit', methods=['POST'])
+@bp.route('/remove_habit', methods=['POST'])
 def remove_habit_route():
     """API endpoint to remove a habit for the current user."""
     if not get_current_user():
@@ -126,215 +247,192 @@ def remove_habit_route():
     remove_habit(name, username=get_current_user())
     return jsonify({'success': True})
 
-@app.route('/clear_chat_history', methods=['POST'])
+@bp.route('/habits/batch', methods=['POST'])
+def habits_batch():
+    """API endpoint to apply many habit operations (add, edit, remove, remove_all) with a single write.
+
+    Body: {"operations": [...], "all_or_nothing": false}. See habit_data.apply_batch for the operation format.
+    """
+    if not get_current_user():
+        return jsonify({'success': False, 'error': 'Not logged in'})
+    data = request.get_json()
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not all(isinstance(op, dict) for op in operations):
+        return jsonify({'success': False, 'error': 'operations must be a list of objects'}), 400
+    all_or_nothing = bool(data.get('all_or_nothing', False))
+    results = apply_batch(operations, username=get_current_user(), all_or_nothing=all_or_nothing)
+    applied = all(r['success'] for r in results) if all_or_nothing else any(r['success'] for r in results)
+    return jsonify({'success': applied, 'results': results})
+
+@bp.route('/clear_chat_history', methods=['POST'])
 def clear_chat_history():
     """API endpoint to clear the current user's chat history."""
     if not get_current_user():
         return jsonify({'success': False})
-    chat_path = get_user_chat_path(get_current_user())
     try:
-        with open(chat_path, 'w') as f:
-            json.dump([], f)
+        get_chat_log(get_current_user()).clear()
+        get_versions().bump(get_current_user(), 'chat')
         return jsonify({'success': True})
     except Exception:
         return jsonify({'success': False})
 
-@app.route('/get_habits', methods=['GET'])
+@bp.route('/get_habits', methods=['GET'])
 def get_habits_api():
     """API endpoint to get the current user's habits as JSON."""
     if not get_current_user():
         return jsonify({'habits': []})
-    return jsonify({'habits': get_habits(get_current_user())})
+    etag = current_etag(('data',), 'habits')
+    if not_modified(etag):
+        return with_etag(Response(status=304), etag)
+    return with_etag(jsonify({'habits': get_habits(get_current_user())}), etag)
 
-@app.route('/get_chat_history', methods=['GET'])
+@bp.route('/get_chat_history', methods=['GET'])
 def get_chat_history():
-    """API endpoint to get the current user's chat history as JSON."""
+    """API endpoint to get a page of the current user's chat history as JSON.
+
+    ?limit=N returns the newest N messages (default 50); ?before=<id> returns the N messages before that id.
+    The response's next_before is the cursor for the previous page (null when there is none).
+    """
     if not get_current_user():
         return jsonify({'history': []})
-    chat_path = get_user_chat_path(get_current_user())
-    if not os.path.exists(chat_path):
-        return jsonify({'history': []})
-    with open(chat_path, 'r') as f:
-        try:
-            history = json.load(f)
-        except Exception:
-            history = []
-    return jsonify({'history': history})
+    try:
+        before = int(request.args['before']) if request.args.get('before') else None
+        limit = min(max(int(request.args.get('limit', CHAT_PAGE_SIZE)), 1), CHAT_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'history': [], 'error': 'before and limit must be integers'}), 400
+    etag = current_etag(('chat',), 'history', before, limit)
+    if not_modified(etag):
+        return with_etag(Response(status=304), etag)
+    history, next_before = get_chat_log(get_current_user()).page(before, limit)
+    return with_etag(jsonify({'history': history, 'next_before': next_before}), etag)
 
-@app.route('/ai_planning', methods=['POST'])
+def start_chat_turn(username, user_message):
+    """Load the user's recent chat history, add the new message and start the AI turn (the extractor runs in the background).
+
+    Returns (turn, first_new): turn.chat_history[first_new:] are the messages this turn adds to the log.
+    """
+    openai_client = get_openai_client()
+    chat_history = get_chat_log(username).recent(CHAT_CONTEXT_MESSAGES)
+    first_new = len(chat_history)
+    # Add the new user message to chat history
+    chat_history.append({"sender": "user", "text": user_message})
+    return ChatTurn(openai_client, username, chat_history, get_habits(username)), first_new
+
+@bp.route('/ai_planning', methods=['POST'])
 def ai_planning():
     """AI endpoint: Handles user chat, returns AI response, and applies extracted habit actions (add, edit, remove, remove_all)."""
     if not get_current_user():
         return jsonify({'success': False, 'status': 'Not logged in'})
-    user_message = request.json['message']
     username = get_current_user()
-    openai_client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-    user_habits = get_habits(username)
-    habits_json = json.dumps(user_habits, indent=2)
-    chat_path = get_user_chat_path(username)
-    # Load chat history
-    if os.path.exists(chat_path):
-        try:
-            with open(chat_path, 'r') as f:
-                chat_history = json.load(f)
-        except Exception:
-            chat_history = []
-    else:
-        chat_history = []
-    # Add the new user message to chat history
-    chat_history.append({"sender": "user", "text": user_message})
-    # Build OpenAI messages from chat history
-    messages = [{"role": "system", "content": "You are a helpful assistant for a habit tracker app."}]
-    for msg in chat_history:
-        if msg["sender"] == "user":
-            messages.append({"role": "user", "content": msg["text"]})
-        elif msg["sender"] == "ai":
-            messages.append({"role": "assistant", "content": msg["text"]})
-    # Add context about habits
-    messages.append({"role": "system", "content": f"Here is the user's current habit data (in JSON):\n{habits_json}"})
-
-    # 1. Main assistant: respond conversationally with full context
-    chat_response = openai_client.chat.completions.create(
-        model="gpt-4.1-nano-2025-04-14",
-        messages=messages
-    )
-    answer = chat_response.choices[0].message.content
-    chat_history.append({"sender": "ai", "text": answer})
-
-    # 2. Action extraction assistant: extract and apply actions from the full chat history
-    # Forward the entire chat history and habits to the extractor
-    extractor_prompt = (
-        "You are an expert at extracting structured actions from a chat history. "
-        "Given the following chat history and the user's current habits, extract a JSON array of actions to add, edit, remove, or remove all habits. "
-        "Each action must be an object with fields: action (add, remove, edit, or remove_all), name, schedule, start_date, old_name (if editing). "
-        "For a 'remove_all' action, only the action field is required. Respond ONLY with a JSON array, no explanations, no markdown, no extra text. "
-        "If the user requests to remove all habits, output: [ {\"action\": \"remove_all\"} ]\n"
-        "If the user confirms, asks you to choose, or refers to a previous suggestion, infer the habits to add from the previous assistant messages and extract them as add actions. "
-        "If you can't extract any actions, respond with an empty array: [].\n"
-        "Chat history (JSON):\n" + json.dumps(chat_history, indent=2) + "\n"
-        "Current habits (JSON):\n" + habits_json + "\n"
-    )
-    extractor_response = openai_client.chat.completions.create(
-        model="gpt-4.1-nano-2025-04-14",
-        messages=[{"role": "system", "content": "You extract structured actions from chat history."},
-                  {"role": "user", "content": extractor_prompt}]
-    )
-    raw = extractor_response.choices[0].message.content
-    try:
-        actions = json.loads(raw)
-    except Exception:
-        actions = []
-    from habit_data import add_habit, edit_habit, remove_habit
-    results = []
-    for action_obj in actions if isinstance(actions, list) else []:
-        action = action_obj.get("action")
-        name = action_obj.get("name")
-        schedule = action_obj.get("schedule")
-        start_date = action_obj.get("start_date")
-        old_name = action_obj.get("old_name")
-        if action == "remove_all":
-            # Remove all habits for the user
-            from habit_data import save_data
-            save_data({"habits": [], "records": {}}, username=username)
-            results.append("All habits have been removed.")
-        elif action == "remove" and name:
-            match = next((h["name"] for h in user_habits if h["name"].lower() == name.lower()), None)
-            if match:
-                remove_habit(match, username=username)
-                results.append(f"Habit '{match}' removed.")
-            else:
-                results.append(f"No habit found matching '{name}' for removal.")
-        elif action == "edit" and old_name:
-            match = next((h["name"] for h in user_habits if h["name"].lower() == old_name.lower()), None)
-            if match:
-                habit = next(h for h in user_habits if h["name"] == match)
-                new_name = name if name else habit["name"]
-                new_schedule = schedule if schedule else habit["schedule"]
-                new_start_date = start_date if start_date else habit.get("start_date")
-                edit_habit(match, new_name, new_schedule, new_start_date, username=username)
-                results.append(f"Habit '{match}' updated.")
-            else:
-                results.append(f"No habit found matching '{old_name}' for editing.")
-        elif action == "add" and name and schedule:
-            add_habit(name, schedule, start_date, username=username)
-            results.append(f"Habit '{name}' added with schedule '{schedule}'.")
-
-    # If no actions were extracted but the last AI message was a confirmation, try to parse the previous AI suggestion for habits
-    if not results and len(chat_history) > 2:
-        last_ai = chat_history[-2]["text"].lower()
-        if any(word in last_ai for word in ["added", "set up", "successfully added"]):
-            # Try to parse the previous AI suggestion for habits
-            import re
-            habit_lines = re.findall(r"\d+\.\s*([A-Za-z0-9\s\-]+)[—-](.*)", chat_history[-3]["text"])
-            for habit in habit_lines:
-                name = habit[0].strip()
-                desc = habit[1].strip()
-                if name and desc:
-                    add_habit(name, "Daily", None, username=username)
-                    results.append(f"Habit '{name}' added with schedule 'Daily'.")
-    # If any actions were performed, add a summary message to chat history
-    if results:
-        ai_msg = "<br>".join(results)
-        chat_history.append({"sender": "ai", "text": ai_msg})
-    # Save chat history
-    threading.Thread(target=lambda: save_chat_history(chat_path, chat_history)).start()
+    turn, first_new = start_chat_turn(username, request.json['message'])
+    # The conversational answer and the action extractor run concurrently
+    answer = turn.answer()
+    results = turn.finish(answer)
+    # Save chat history (appending only this turn's messages is cheap, so it is done before responding)
+    save_chat_history(username, turn.chat_history[first_new:])
     # Return both the main answer and any action summary
-    return jsonify({"success": True, "response": answer + ("<br>" + ai_msg if results else "")})
+    return jsonify({"success": True, "response": answer + ("<br>" + "<br>".join(results) if results else ""),
+                    "metrics": turn.metrics})
 
-def save_chat_history(chat_path, chat_history):
-    """Save the last 100 chat messages to the user's chat file."""
+@bp.route('/ai_planning/stream', methods=['POST'])
+def ai_planning_stream():
+    """Streaming variant of /ai_planning: sends the answer as Server-Sent Events while it is generated.
+
+    Events: 'token' (a chunk of the answer), 'actions' (list of applied action results), 'done'.
+    """
+    if not get_current_user():
+        return jsonify({'success': False, 'status': 'Not logged in'})
+    username = get_current_user()
+    turn, first_new = start_chat_turn(username, request.json['message'])
+
+    def finish(chunks):
+        results = turn.finish("".join(chunks))
+        save_chat_history(username, turn.chat_history[first_new:])
+        return results
+
+    def events():
+        chunks = []
+        finished = False
+        try:
+            try:
+                for chunk in turn.stream_answer():
+                    chunks.append(chunk)
+                    yield sse_event('token', chunk)
+            except Exception:
+                yield sse_event('error', 'Error getting response.')
+            finished = True
+            results = finish(chunks)
+            yield sse_event('actions', results)
+            yield sse_event('done', True)
+        finally:
+            # The client went away mid-answer (the server closes the generator at a yield):
+            # still apply the turn's actions and save what was said, once.
+            if not finished:
+                finish(chunks)
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@bp.route('/events')
+def events_stream():
+    """Live updates for the current user's open pages as Server-Sent Events (see events.py).
+
+    Events: 'hello', 'mark' ({habit, date, done}), 'habits' and 'resync' (reload everything).
+    """
+    if not get_current_user():
+        return Response(status=401)
+    last_event_id = request.headers.get('Last-Event-ID')
+    return Response(stream_with_context(get_events().stream(get_current_user(), last_event_id)),
+                    mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def save_chat_history(username, messages):
+    """Append a turn's new messages to the user's chat log and bump their chat version."""
     try:
-        with open(chat_path, 'w') as f:
-            json.dump(chat_history[-100:], f, indent=2)  # Keep last 100 messages
+        get_chat_log(username).append(messages)
+        get_versions().bump(username, 'chat')
     except Exception:
         pass
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        # Ensure users.json exists
-        if not os.path.exists('users.json'):
-            with open('users.json', 'w') as f:
-                json.dump([], f)
-        with open('users.json', 'r+') as f:
-            users = json.load(f)
-            if any(u['username'] == username for u in users):
-                return render_template('register.html', error='Username already exists')
-            hashed = hashlib.sha256(password.encode()).hexdigest()
-            users.append({'username': username, 'password': hashed})
-            f.seek(0)
-            json.dump(users, f)
-            f.truncate()
+        if not get_user_store().register(username, password):
+            return render_template('register.html', error='Username already exists')
         session['username'] = username
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
     return render_template('register.html')
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        # Ensure users.json exists
-        if not os.path.exists('users.json'):
-            with open('users.json', 'w') as f:
-                json.dump([], f)
-        with open('users.json', 'r') as f:
-            users = json.load(f)
-            hashed = hashlib.sha256(password.encode()).hexdigest()
-            user = next((u for u in users if u['username'] == username and u['password'] == hashed), None)
-            if user:
-                session['username'] = username
-                return redirect(url_for('index'))
-            else:
-                return render_template('login.html', error='Invalid credentials')
+        if get_user_store().verify(username, password):
+            session['username'] = username
+            return redirect(url_for('.index'))
+        else:
+            return render_template('login.html', error='Invalid credentials')
     return render_template('login.html')
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     session.pop('username', None)
-    return redirect(url_for('login'))
+    return redirect(url_for('.login'))
+
+def create_app(config=None):
+    """Build the Flask app. config overrides settings read from the environment (FLASK_SECRET_KEY)."""
+    app = Flask(__name__, template_folder='templates', static_folder='static')
+    app.secret_key = os.getenv('FLASK_SECRET_KEY', 'dev_secret')
+    if config:
+        app.config.update(config)
+    if app.secret_key == 'dev_secret':
+        # Every worker process must share one secret, or sessions break when requests land on another worker.
+        logger.warning("FLASK_SECRET_KEY is not set; using the insecure development key")
+    app.register_blueprint(bp)
+    start_maintenance_worker()
+    return app
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', debug=True)
+    create_app().run(host='0.0.0.0', debug=True)
@@ -0,0 +1,158 @@
+import copy
+import threading
+from collections import OrderedDict
+from metrics import CACHE_BYTES, CACHE_EVICTIONS, CACHE_LOOKUPS
+
+# In-process cache of parsed user documents.
+# Entries are keyed by username and tagged with a "stamp" taken *before* the
+# document was read: the backend's stamp (file mtimes and size) plus a per-user write version
+# that save_data bumps. A stale stamp means the entry is ignored and reloaded,
+# so writes from this process and from other processes are both picked up.
+# Hits, misses, evictions and size are exported on /metrics, labelled with the cache name.
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+class DataCache:
+    """Thread-safe LRU cache of user documents with a memory cap (measured in source bytes)."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, name="data"):
+        self.max_bytes = max_bytes
+        self.name = name
+        self._entries = OrderedDict()  # username -> (stamp, data, size)
+        self._versions = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def version(self, username):
+        """Return the current write version for the user."""
+        with self._lock:
+            return self._versions.get(username, 0)
+
+    def bump(self, username):
+        """Record a write for the user and drop their cached document."""
+        with self._lock:
+            self._versions[username] = self._versions.get(username, 0) + 1
+            self._drop(username)
+
+    def get(self, username, stamp):
+        """Return the cached document if it was stored under the same stamp, else None."""
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or entry[0] != stamp:
+                self.misses += 1
+                CACHE_LOOKUPS.inc(cache=self.name, result="miss")
+                return None
+            self._entries.move_to_end(username)
+            self.hits += 1
+        CACHE_LOOKUPS.inc(cache=self.name, result="hit")
+        return entry[1]
+
+    def put(self, username, stamp, data, size):
+        """Store a document, evicting least recently used users to stay under max_bytes."""
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._drop(username)
+            self._entries[username] = (stamp, data, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, old_size) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+                CACHE_EVICTIONS.inc(cache=self.name)
+            CACHE_BYTES.set(self._bytes, cache=self.name)
+
+    def clear(self):
+        """Drop every cached document (versions are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            CACHE_BYTES.set(0, cache=self.name)
+
+    def stats(self):
+        """Return hit/miss/eviction counters and current usage."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+    def _drop(self, username):
+        entry = self._entries.pop(username, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+            CACHE_BYTES.set(self._bytes, cache=self.name)
+
+class CachedStorage:
+    """Wraps a storage backend that supports stamp() and serves reads from a DataCache.
+
+    get_habits and load_range return the shared cached document and must be
+    treated as read-only; load returns a private copy that callers may mutate.
+    """
+
+    def __init__(self, storage, cache=None):
+        self.storage = storage
+        self.cache = cache or DataCache()
+        self.name = storage.name
+
+    def stamp(self, username=None):
+        """Return the wrapped backend's stamp for the user."""
+        return self.storage.stamp(username)
+
+    def usernames(self):
+        """Return the wrapped backend's usernames."""
+        return self.storage.usernames()
+
+    def _stamp(self, username):
+        return (self.cache.version(username),) + self.storage.stamp(username)
+
+    def _cached(self, username):
+        stamp = self._stamp(username)
+        data = self.cache.get(username, stamp)
+        if data is None:
+            data = self.storage.load(username)
+            self.cache.put(username, stamp, data, stamp[-1])
+        return data
+
+    def load(self, username=None):
+        """Load a private (mutable) copy of the user's document."""
+        return copy.deepcopy(self._cached(username))
+
+    def save(self, data, username=None):
+        """Save the document and invalidate the user's cache entry."""
+        try:
+            self.storage.save(data, username)
+        finally:
+            self.cache.bump(username)
+
+    def update(self, mutate, username=None, written=None):
+        """Atomic read-modify-write; starts from a copy of the cached document when the backend supports CAS."""
+        try:
+            if not hasattr(self.storage, "compare_and_save"):
+                return self.storage.update(mutate, username, written)
+            for _ in range(self.storage.MAX_RETRIES):
+                expected = self.storage.stamp(username)
+                data = copy.deepcopy(self._cached(username))
+                result = mutate(data)
+                if result is False or self.storage.compare_and_save(data, expected, username, written):
+                    return result
+                self.cache.bump(username)
+            return self.storage.update(mutate, username, written)
+        finally:
+            self.cache.bump(username)
+
+    def get_habits(self, username=None):
+        """Return the user's habits from the cache (read-only)."""
+        return self._cached(username)["habits"]
+
+    def set_record(self, habit_name, date, done, username=None):
+        """Mark a habit for a date and invalidate the user's cache entry. Returns the backend's (before, after) stamps."""
+        try:
+            return self.storage.set_record(habit_name, date, done, username)
+        finally:
+            self.cache.bump(username)
+
+    def load_range(self, start, end, username=None):
+        """Return the cached document (read-only); it covers every date range."""
+        return self._cached(username)
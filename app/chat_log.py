@@ -0,0 +1,232 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from locking import file_lock
+from metrics import record_read, record_write
+from layout import get_user_dir
+
+# Append-only chat history.
+# Each user's messages live in <user dir>/chat/ (see layout.py) as JSON-lines
+# segments named after the id of their first message (000000000000.ndjson,
+# 000000000100.ndjson, ...). Message ids are consecutive, so a message's
+# position in its segment follows from its id. A chat turn appends only its new
+# messages; once the newest segment holds SEGMENT_MESSAGES messages a new one
+# is started and segments beyond MAX_SEGMENTS are deleted (retention by
+# rotation instead of rewriting the history). Clearing the chat starts an empty
+# segment at the next id, so ids (and pagination cursors) never go back.
+#
+# Readers keep an in-memory index of line offsets per segment, extended by
+# reading only the bytes appended since the last read, so a page of messages
+# costs O(page) regardless of how long the history is. Indexes are kept for
+# the MAX_USERS most recently used chats; an evicted one is rebuilt on demand.
+
+SEGMENT_MESSAGES = int(os.getenv("HABIT_CHAT_SEGMENT_MESSAGES", 100))
+MAX_SEGMENTS = int(os.getenv("HABIT_CHAT_SEGMENTS", 3))
+SEGMENT_SUFFIX = ".ndjson"
+MAX_USERS = 1000
+
+def get_chat_dir(username):
+    """Return the directory holding the user's chat segments."""
+    return os.path.join(get_user_dir(username), "chat") if username else "chat"
+
+def get_legacy_chat_file(username):
+    """Return the path of the user's pre-segment chat.json."""
+    return os.path.join(get_user_dir(username), "chat.json") if username else "chat.json"
+
+class ChatLog:
+    """One user's segmented chat history."""
+
+    def __init__(self, directory, segment_messages=SEGMENT_MESSAGES, max_segments=MAX_SEGMENTS):
+        self.directory = directory
+        self.segment_messages = segment_messages
+        self.max_segments = max_segments
+        self._offsets = {}  # segment path -> (inode, bytes indexed, [line start offsets])
+        self._lock = threading.Lock()
+
+    def _lock_path(self):
+        return os.path.join(self.directory, "log")
+
+    def _segment_path(self, first_id):
+        return os.path.join(self.directory, f"{first_id:012d}{SEGMENT_SUFFIX}")
+
+    def _segments(self):
+        """Return [(first id, path)] of every segment, oldest first."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted((int(name[:-len(SEGMENT_SUFFIX)]), os.path.join(self.directory, name))
+                      for name in names if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit())
+
+    def _index(self, path):
+        """Return (start offsets of the complete lines, bytes indexed) for a segment, reading only newly appended bytes."""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return [], 0
+        with self._lock:
+            inode, indexed, starts = self._offsets.get(path, (None, 0, []))
+            if inode != st.st_ino or st.st_size < indexed:
+                indexed, starts = 0, []
+            if st.st_size > indexed:
+                with open(path, "rb") as f:
+                    f.seek(indexed)
+                    chunk = f.read(st.st_size - indexed)
+                record_read(path, len(chunk))
+                # Only complete lines are indexed; a partial last line is picked up next time.
+                starts = list(starts)
+                position = 0
+                while True:
+                    end = chunk.find(b"\n", position)
+                    if end < 0:
+                        break
+                    starts.append(indexed + position)
+                    position = end + 1
+                indexed += position
+            self._offsets[path] = (st.st_ino, indexed, starts)
+            return starts, indexed
+
+    def _read_lines(self, path, starts, end_offset, first, last):
+        """Return the decoded messages at line positions first..last-1 of a segment."""
+        if first >= last:
+            return []
+        stop = starts[last] if last < len(starts) else end_offset
+        with open(path, "rb") as f:
+            f.seek(starts[first])
+            raw = f.read(stop - starts[first])
+        record_read(path, len(raw))
+        lines = raw.splitlines()
+        messages = []
+        for line in lines:
+            try:
+                messages.append(json.loads(line))
+            except ValueError:
+                messages.append({"sender": "ai", "text": ""})
+        return messages
+
+    def page(self, before=None, limit=50):
+        """Return (messages, next_before): up to `limit` messages with id < before (default: the newest), oldest first.
+
+        Every message carries its "id"; next_before is the cursor for the previous page, or None at the start.
+        """
+        messages = []
+        segments = self._segments()
+        for first_id, path in reversed(segments):
+            if len(messages) >= limit:
+                break
+            if before is not None and first_id >= before:
+                continue
+            starts, end_offset = self._index(path)
+            last = len(starts) if before is None else min(len(starts), before - first_id)
+            first = max(0, last - (limit - len(messages)))
+            chunk = self._read_lines(path, starts, end_offset, first, last)
+            for i, message in enumerate(chunk):
+                message["id"] = first_id + first + i
+            messages = chunk + messages
+        oldest = segments[0][0] if segments else 0
+        next_before = messages[0]["id"] if messages and messages[0]["id"] > oldest else None
+        return messages, next_before
+
+    def recent(self, limit):
+        """Return the newest `limit` messages, oldest first."""
+        return self.page(None, limit)[0]
+
+    def append(self, messages):
+        """Append messages (dicts with sender and text) in order, rotating segments as needed."""
+        if not messages:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with file_lock(self._lock_path()):
+            segments = self._segments()
+            if segments:
+                first_id, path = segments[-1]
+                self._drop_partial_line(path)
+                count = len(self._index(path)[0])
+            else:
+                first_id, path, count = 0, self._segment_path(0), 0
+            pending = list(messages)
+            while pending:
+                if count >= self.segment_messages:
+                    first_id, count = first_id + count, 0
+                    path = self._segment_path(first_id)
+                take = pending[:self.segment_messages - count]
+                pending = pending[len(take):]
+                text = "".join(json.dumps({"sender": m["sender"], "text": m["text"]}) + "\n" for m in take)
+                with open(path, "a") as f:
+                    f.write(text)
+                    f.flush()
+                    os.fsync(f.fileno())
+                record_write(path, len(text))
+                count += len(take)
+            self._prune()
+
+    def clear(self):
+        """Drop the whole history; later messages continue after the last id."""
+        os.makedirs(self.directory, exist_ok=True)
+        with file_lock(self._lock_path()):
+            segments = self._segments()
+            next_id = 0
+            if segments:
+                first_id, path = segments[-1]
+                self._drop_partial_line(path)
+                next_id = first_id + len(self._index(path)[0])
+            open(self._segment_path(next_id), "a").close()
+            for _, path in segments:
+                if path != self._segment_path(next_id):
+                    self._remove(path)
+
+    def migrate(self, legacy_path):
+        """Import a legacy chat.json list once (then delete it). Returns the number of messages imported."""
+        if not os.path.exists(legacy_path):
+            return 0
+        os.makedirs(self.directory, exist_ok=True)
+        with file_lock(self._lock_path()):
+            if not os.path.exists(legacy_path):
+                return 0
+            imported = 0
+            if not self._segments():
+                try:
+                    with open(legacy_path, "r") as f:
+                        history = json.load(f)
+                except ValueError:
+                    history = []
+                history = [m for m in history if isinstance(m, dict) and "sender" in m and "text" in m]
+                self.append(history)
+                imported = len(history)
+            os.remove(legacy_path)
+            return imported
+
+    def _drop_partial_line(self, path):
+        """Cut off a torn last line left by a crash during append."""
+        starts, indexed = self._index(path)
+        if os.path.getsize(path) > indexed:
+            with open(path, "r+b") as f:
+                f.truncate(indexed)
+
+    def _prune(self):
+        for _, path in self._segments()[:-self.max_segments]:
+            self._remove(path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self._offsets.pop(path, None)
+
+_logs = OrderedDict()  # username -> ChatLog, least recently used first
+_logs_lock = threading.Lock()
+
+def get_chat_log(username):
+    """Return the user's ChatLog, importing their legacy chat.json on first use."""
+    with _logs_lock:
+        log = _logs.get(username)
+        if log is None:
+            log = _logs[username] = ChatLog(get_chat_dir(username))
+            log.migrate(get_legacy_chat_file(username))
+            while len(_logs) > MAX_USERS:
+                _logs.popitem(last=False)
+        _logs.move_to_end(username)
+        return log
@@ -0,0 +1,204 @@
+import itertools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from metrics import EVENT_STREAMS, EVENTS_PUBLISHED
+from versions import get_versions
+
+# Live change events for a user's open pages, served as Server-Sent Events on /events.
+# The habit_data write functions publish one event per write:
+#   mark    {"habit", "date", "done"}   - a habit was marked for a day
+#   habits  {}                          - habits were added, edited or removed
+# and every page of that user applies it to its DOM.
+#
+# EventBus is an in-process pub/sub: per user, a ring of the last
+# HABIT_EVENTS_BUFFER events (default 64), tagged with a process-wide sequence
+# number. Subscribers keep no queue of their own, only their position in the
+# ring (the SSE Last-Event-ID), so an idle or slow page costs nothing while it
+# is not connected. A page that fell behind by more than the ring gets a
+# single "resync" event instead of the backlog and reloads its data.
+#
+# Streams wait up to HABIT_EVENTS_HOLD seconds (default 25) for events, then
+# end with a quick-reconnect hint. Under the gevent worker class
+# (HABIT_WORKER_CLASS=gevent, see gunicorn.conf.py) a waiting stream is a
+# greenlet, so every open page gets one. Under gthread a waiting stream takes
+# one of the worker's request threads, so at most HABIT_EVENTS_STREAMS streams
+# per process wait (default a quarter of HABIT_THREADS, at least 1); every
+# other stream gets what is pending and ends at once, and the browser
+# reconnects after HABIT_EVENTS_RETRY_MS (default 5000). That keeps 3 of 4
+# threads for requests, at the price of up to 5 s latency for pages beyond the
+# cap; raise HABIT_THREADS (or switch to gevent) for many open pages.
+#
+# Events only reach pages connected to the worker process that handled the
+# write. Every event id carries the user's data version (versions.py), so a
+# stream that sees the version move without an event here (a write in another
+# worker) sends "resync" too.
+
+BUFFER = int(os.getenv("HABIT_EVENTS_BUFFER", 64))
+HOLD = float(os.getenv("HABIT_EVENTS_HOLD", 25))
+
+def _cooperative():
+    """Return True if threading is gevent-patched (gunicorn's gevent worker class)."""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("threading")
+
+# None: no limit.
+MAX_STREAMS = (int(os.environ["HABIT_EVENTS_STREAMS"]) if "HABIT_EVENTS_STREAMS" in os.environ
+               else None if _cooperative() else max(1, int(os.getenv("HABIT_THREADS", 4)) // 4))
+RETRY_MS = int(os.getenv("HABIT_EVENTS_RETRY_MS", 5000))
+HELD_RETRY_MS = 1000
+# How often a waiting stream checks for writes in other processes and pings the client.
+POLL = 5.0
+MAX_USERS = 1000
+
+def sse_event(event, data, event_id=None):
+    """Format one Server-Sent Event with a JSON payload."""
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def version_token(versions):
+    """Return the part of a user's versions that changes with every habit write."""
+    return f"{versions['epoch']}:{versions['data']}"
+
+class Channel:
+    """One user's ring of recent events."""
+
+    def __init__(self, dropped):
+        self.events = deque()  # (seq, type, payload, version token)
+        self.dropped = dropped  # events up to this sequence number are no longer available
+
+class EventBus:
+    """Thread-safe in-process pub/sub of per-user change events."""
+
+    def __init__(self, buffer=BUFFER, max_streams=MAX_STREAMS, max_users=MAX_USERS):
+        self.buffer = buffer
+        self.max_users = max_users
+        self.pid = os.getpid()
+        self._channels = OrderedDict()  # username -> Channel
+        self._seq = itertools.count(1)
+        self._last = 0
+        self._changed = threading.Condition()
+        self.max_streams = max_streams
+        self._slots = threading.BoundedSemaphore(max_streams) if max_streams else None
+
+    def _channel(self, username):
+        """Return the user's channel, creating it (and evicting the least recently used) if needed. Caller holds the lock."""
+        channel = self._channels.get(username)
+        if channel is None:
+            channel = self._channels[username] = Channel(self._last)
+            while len(self._channels) > self.max_users:
+                self._channels.popitem(last=False)
+        self._channels.move_to_end(username)
+        return channel
+
+    def publish(self, username, event, payload, versions):
+        """Append an event to the user's ring and wake waiting streams. versions: the user's versions after the write."""
+        with self._changed:
+            channel = self._channel(username)
+            self._last = next(self._seq)
+            channel.events.append((self._last, event, payload, version_token(versions)))
+            while len(channel.events) > self.buffer:
+                channel.dropped = channel.events.popleft()[0]
+            self._changed.notify_all()
+        EVENTS_PUBLISHED.inc(type=event)
+
+    def since(self, username, seq):
+        """Return (events after seq, missed): missed is True if some were already dropped from the ring."""
+        with self._changed:
+            channel = self._channels.get(username)
+            if channel is None:
+                # Evicted: whatever it held is gone.
+                return [], True
+            return [e for e in channel.events if e[0] > seq], seq < channel.dropped
+
+    def wait(self, username, seq, timeout):
+        """Block until the user has an event after seq or the timeout expires."""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                channel = self._channels.get(username)
+                if channel is not None and channel.events and channel.events[-1][0] > seq:
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                self._changed.wait(remaining)
+
+    def _event_id(self, seq, token):
+        return f"{self.pid}-{seq}-{token}"
+
+    def _parse_id(self, event_id):
+        """Return (seq in this process or None, version token) from a Last-Event-ID."""
+        try:
+            pid, seq, token = event_id.split("-", 2)
+            return (int(seq) if int(pid) == self.pid else None), token
+        except (AttributeError, ValueError):
+            return None, None
+
+    def stream(self, username, last_event_id=None):
+        """Yield the SSE text for one /events connection.
+
+        Starts after last_event_id (or with a "hello" event), then waits for new
+        events while a stream slot is free, or ends at once when none is.
+        """
+        if self.max_streams is None:
+            held = True
+        else:
+            held = self._slots is not None and self._slots.acquire(blocking=False)
+        EVENT_STREAMS.inc(mode="held" if held else "short")
+        try:
+            yield f"retry: {HELD_RETRY_MS if held else RETRY_MS}\n\n"
+            with self._changed:
+                self._channel(username)
+                current = self._last
+            token = version_token(get_versions().get(username))
+            seq, seen = self._parse_id(last_event_id)
+            if seen is None:
+                seq, seen = current, token
+                yield sse_event("hello", {}, self._event_id(seq, token))
+            elif seq is None:
+                # The page was connected to another process: only the data version can be compared.
+                seq = current
+                if seen != token:
+                    yield sse_event("resync", {}, self._event_id(seq, token))
+                seen = token
+            deadline = time.monotonic() + (HOLD if held else 0)
+            while True:
+                events, missed = self.since(username, seq)
+                if missed:
+                    with self._changed:
+                        seq = events[-1][0] if events else self._last
+                    token = version_token(get_versions().get(username))
+                    if token != seen:
+                        yield sse_event("resync", {}, self._event_id(seq, token))
+                        seen = token
+                    events = []
+                for seq, event, payload, token in events:
+                    yield sse_event(event, payload, self._event_id(seq, token))
+                    seen = token
+                if not events:
+                    token = version_token(get_versions().get(username))
+                    if token != seen:
+                        # Written by another process (or this one, between bump and publish).
+                        yield sse_event("resync", {}, self._event_id(seq, token))
+                        seen = token
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                self.wait(username, seq, min(remaining, POLL))
+                # Comment line: keeps proxies from timing out and detects closed connections.
+                yield ": ping\n\n"
+        finally:
+            if held and self._slots is not None:
+                self._slots.release()
+
+_bus = EventBus()
+
+def get_events():
+    """Return the process-wide EventBus."""
+    return _bus
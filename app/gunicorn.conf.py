@@ -0,0 +1,37 @@
+import multiprocessing
+import os
+
+# gunicorn settings for the habit tracker (see wsgi.py):
+#   gunicorn -c app/gunicorn.conf.py wsgi:app
+# Workers are separate processes; every piece of per-user state they keep in
+# memory (data cache, aggregates, versions, chat index) is validated against
+# the files on disk, and writers coordinate through file locks, so any number
+# of workers can serve the same users. Threads per worker let one worker
+# overlap slow OpenAI calls and SSE streams.
+#
+# Live update streams (/events, see events.py) that wait for events hold a
+# thread under gthread, so only a quarter of the threads are used for them.
+# With many pages open at once, HABIT_WORKER_CLASS=gevent (pip install gevent)
+# serves every stream from a greenlet instead; blocking file locks and SQLite
+# calls then pause the worker's other requests while they wait.
+#
+#   HABIT_BIND     address to listen on (default 0.0.0.0:5000)
+#   HABIT_WORKERS  worker processes (default 2 x CPUs + 1)
+#   HABIT_THREADS  threads per worker (default 4, gthread only)
+#   HABIT_WORKER_CLASS          gthread (default) or gevent
+#   HABIT_WORKER_CONNECTIONS    concurrent connections per gevent worker (default 1000)
+#   HABIT_TIMEOUT  seconds a worker may stay silent before it is restarted (default 120)
+
+pythonpath = os.path.dirname(os.path.abspath(__file__))
+bind = os.getenv("HABIT_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("HABIT_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv("HABIT_THREADS", 4))
+worker_class = os.getenv("HABIT_WORKER_CLASS", "gthread")
+worker_connections = int(os.getenv("HABIT_WORKER_CONNECTIONS", 1000))
+# AI answers are streamed for up to a few tens of seconds.
+timeout = int(os.getenv("HABIT_TIMEOUT", 120))
+keepalive = 5
+# Storage backends, the journal compactor and OpenAI clients are created lazily
+# inside each worker, so the app is not preloaded in the master process.
+preload_app = False
+accesslog = "-"
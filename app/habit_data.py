@@ -1,153 +1,261 @@
-import json
-import os
-from datetime import datetime, timedelta
+from datetime import date, datetime
 import calendar
+from aggregates import get_aggregates
+from events import get_events
+from metrics import timed
+from schedule import compile_habit, is_known_schedule
+from storage import get_storage
+from versions import get_versions
 
-# Helper to get user-specific data file
-
-import os
-
-def get_data_file(username=None):
-    """Return the path to the user's data file, creating the directory if needed. Defaults to global data if username is None."""
-    if username:
-        user_dir = f"user_data/{username}"
-        os.makedirs(user_dir, exist_ok=True)
-        return f"{user_dir}/data.json"
-    return "habits_data.json"
+# All reads and writes go through the storage backend selected by HABIT_STORAGE
+# (see storage.py). Every write bumps the user's data version (versions.py), which the read
+# endpoints use as their ETag, and publishes a live update event (events.py).
 
+@timed
 def load_data(username=None):
     """Load habit and record data for the given user. Returns default structure if file does not exist."""
-    data_file = get_data_file(username)
-    if not os.path.exists(data_file):
-        return {"habits": [], "records": {}}
-    with open(data_file, "r") as f:
-        return json.load(f)
+    return get_storage().load(username)
 
+@timed
 def save_data(data, username=None):
     """Save the given data dict to the user's data file."""
-    data_file = get_data_file(username)
-    with open(data_file, "w") as f:
-        json.dump(data, f, indent=2)
+    get_storage().save(data, username)
+    get_aggregates().invalidate(username)
+    get_events().publish(username, "habits", {}, get_versions().bump(username))
+
+@timed
+def update_data(mutate, username=None):
+    """Apply mutate(data) to the user's data as one atomic read-modify-write and return its result.
+
+    mutate may be called more than once if another writer gets in first; returning False skips the write.
+    Habit definition changes are passed on to the materialized aggregates.
+    """
+    applied = {}
+    def tracked(data):
+        before = [dict(h) for h in data["habits"]]
+        result = mutate(data)
+        applied["before"], applied["data"] = before, data
+        return result
+    def written(before, after):
+        applied["stamps"] = (before, after)
+    result = get_storage().update(tracked, username, written)
+    if result is not False and applied:
+        get_aggregates().habits_changed(username, applied["before"], applied["data"], applied.get("stamps"))
+        get_events().publish(username, "habits", {}, get_versions().bump(username))
+    return result
 
+@timed
 def add_habit(name, schedule, start_date=None, username=None):
     """Add a new habit for the user. Returns False if a habit with the same name exists."""
-    data = load_data(username)
-    if any(h["name"] == name for h in data["habits"]):
-        return False
-    habit = {"name": name, "schedule": schedule}
-    if start_date:
-        habit["start_date"] = start_date
-    else:
-        habit["start_date"] = datetime.now().strftime("%Y-%m-%d")
-    data["habits"].append(habit)
-    save_data(data, username)
-    return True
+    def apply(data):
+        if any(h["name"] == name for h in data["habits"]):
+            return False
+        habit = {"name": name, "schedule": schedule}
+        if start_date:
+            habit["start_date"] = start_date
+        else:
+            habit["start_date"] = datetime.now().strftime("%Y-%m-%d")
+        data["habits"].append(habit)
+        return True
+    return update_data(apply, username)
 
+@timed
 def edit_habit(old_name, name, schedule, start_date, username=None):
-    """Edit an existing habit's details. Updates records if the name changes."""
-    data = load_data(username)
-    for habit in data["habits"]:
-        if habit["name"] == old_name:
-            habit["name"] = name
-            habit["schedule"] = schedule
-            habit["start_date"] = start_date
-            break
-    # Also update records if name changed
-    if old_name != name and old_name in data["records"]:
-        data["records"][name] = data["records"].pop(old_name)
-    save_data(data, username)
-    return True
+    """Edit an existing habit's details. Updates records if the name changes.
 
+    Returns False (and changes nothing) if the new name belongs to another habit,
+    like a batch edit: the two habits' records would otherwise be merged.
+    """
+    def apply(data):
+        if old_name != name and any(h["name"] == name for h in data["habits"]):
+            return False
+        for habit in data["habits"]:
+            if habit["name"] == old_name:
+                habit["name"] = name
+                habit["schedule"] = schedule
+                habit["start_date"] = start_date
+                break
+        # Also update records if name changed
+        if old_name != name and old_name in data["records"]:
+            data["records"][name] = data["records"].pop(old_name)
+        return True
+    return update_data(apply, username)
+
+@timed
 def remove_habit(name, username=None):
     """Remove a habit and its records for the user."""
-    data = load_data(username)
-    data["habits"] = [h for h in data["habits"] if h["name"] != name]
-    if name in data["records"]:
-        del data["records"][name]
-    save_data(data, username)
-    return True
+    def apply(data):
+        data["habits"] = [h for h in data["habits"] if h["name"] != name]
+        if name in data["records"]:
+            del data["records"][name]
+        return True
+    return update_data(apply, username)
+
+class HabitIndex:
+    """Case-insensitive name index over a data document, kept in sync as batch operations are applied."""
+
+    def __init__(self, data):
+        self.data = data
+        self.by_name = {h["name"].lower(): h for h in data["habits"]}
+
+    def find(self, name):
+        return self.by_name.get(name.lower()) if isinstance(name, str) and name else None
+
+    def add(self, habit):
+        self.data["habits"].append(habit)
+        self.by_name[habit["name"].lower()] = habit
 
+    def rename(self, habit, new_name):
+        del self.by_name[habit["name"].lower()]
+        records = self.data["records"]
+        if habit["name"] in records:
+            records[new_name] = records.pop(habit["name"])
+        habit["name"] = new_name
+        self.by_name[new_name.lower()] = habit
+
+    def remove(self, habit):
+        del self.by_name[habit["name"].lower()]
+        self.data["habits"] = [h for h in self.data["habits"] if h is not habit]
+        self.data["records"].pop(habit["name"], None)
+
+    def clear(self):
+        self.by_name.clear()
+        self.data["habits"] = []
+        self.data["records"] = {}
+
+def valid_date(value):
+    """Return True if value is a date string in YYYY-MM-DD form."""
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d") == value
+    except (TypeError, ValueError):
+        return False
+
+def field_error(op):
+    """Return why an add/edit operation's name, schedule or start_date cannot be used, or None (missing fields are not checked)."""
+    for field in ("name", "old_name"):
+        if op.get(field) is not None and not isinstance(op[field], str):
+            return f"Invalid {field} {op[field]!r}: expected text."
+    if op.get("schedule") and not is_known_schedule(op["schedule"]):
+        return f"Unknown schedule '{op['schedule']}'."
+    if op.get("start_date") and not valid_date(op["start_date"]):
+        return f"Invalid start date '{op['start_date']}': expected YYYY-MM-DD."
+    return None
+
+def apply_operation(index, op):
+    """Apply one batch operation to the index. Returns (success, message)."""
+    action = op.get("action")
+    name = op.get("name")
+    schedule = op.get("schedule")
+    start_date = op.get("start_date")
+    if action == "remove_all":
+        index.clear()
+        return True, "All habits have been removed."
+    if action in ("add", "edit"):
+        # Checked before anything is changed: a bad value would break every later read of the habit.
+        error = field_error(op)
+        if error:
+            return False, error
+    if action == "add":
+        if not name or not schedule:
+            return False, "An added habit needs a name and a schedule."
+        if index.find(name):
+            return False, f"Habit '{name}' already exists."
+        index.add({"name": name, "schedule": schedule,
+                   "start_date": start_date or datetime.now().strftime("%Y-%m-%d")})
+        return True, f"Habit '{name}' added with schedule '{schedule}'."
+    if action == "remove":
+        habit = index.find(name)
+        if not habit:
+            return False, f"No habit found matching '{name}' for removal."
+        index.remove(habit)
+        return True, f"Habit '{habit['name']}' removed."
+    if action == "edit":
+        old_name = op.get("old_name") or name
+        habit = index.find(old_name)
+        if not habit:
+            return False, f"No habit found matching '{old_name}' for editing."
+        matched = habit["name"]
+        if name and name != habit["name"]:
+            other = index.find(name)
+            if other and other is not habit:
+                return False, f"Cannot rename '{matched}': habit '{name}' already exists."
+            index.rename(habit, name)
+        if schedule:
+            habit["schedule"] = schedule
+        if start_date:
+            habit["start_date"] = start_date
+        return True, f"Habit '{matched}' updated."
+    return False, f"Unknown action '{action}'."
+
+@timed
+def apply_batch(operations, username=None, all_or_nothing=False):
+    """Apply a list of habit operations with a single load and a single atomic write.
+
+    Each operation is a dict with an action (add, edit, remove, remove_all) and the
+    fields name, schedule, start_date and old_name (for edit; missing fields keep
+    their current value). Names are matched case-insensitively. Invalid operations
+    are skipped and reported; with all_or_nothing=True any invalid operation cancels
+    the whole batch. Returns a list of {"action", "success", "message"} dicts.
+    """
+    outcome = {}
+    def apply(data):
+        index = HabitIndex(data)
+        results = []
+        for op in operations:
+            success, message = apply_operation(index, op)
+            results.append({"action": op.get("action"), "success": success, "message": message})
+        outcome["results"] = results
+        if all_or_nothing and not all(r["success"] for r in results):
+            return False
+        return any(r["success"] for r in results)
+    update_data(apply, username)
+    return outcome.get("results", [])
+
+@timed
 def get_habits(username=None):
     """Return the list of habits for the user."""
-    data = load_data(username)
-    return data["habits"]
+    return get_storage().get_habits(username)
 
+@timed
 def mark_habit(habit_name, date, done, username=None):
     """Mark a habit as done or not done for a specific date."""
-    data = load_data(username)
-    if habit_name not in data["records"]:
-        data["records"][habit_name] = {}
-    data["records"][habit_name][date] = done
-    save_data(data, username)
+    stamps = get_storage().set_record(habit_name, date, done, username)
+    get_aggregates().record_mark(username, habit_name, date, done, stamps)
+    get_events().publish(username, "mark", {"habit": habit_name, "date": date, "done": bool(done)},
+                         get_versions().bump(username))
     return True
 
+@timed
 def get_agenda(selected_date, username=None):
     """Return a list of (habit, done) tuples for the selected date, based on each habit's schedule and start date."""
-    data = load_data(username)
-    habits = data["habits"]
+    data = get_storage().load_range(selected_date, selected_date, username)
     records = data["records"]
+    sel_date = datetime.strptime(selected_date, "%Y-%m-%d").date()
     agenda = []
-    sel_date = datetime.strptime(selected_date, "%Y-%m-%d")
-    for habit in habits:
-        name = habit["name"]
-        schedule = habit["schedule"]
-        start_date = habit.get("start_date", datetime.now().strftime("%Y-%m-%d"))
-        start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-        show = False
-        if sel_date >= start_dt:
-            if schedule == "Daily":
-                show = True
-            elif schedule == "Bi-daily":
-                show = (sel_date - start_dt).days % 2 == 0
-            elif schedule == "Weekly":
-                show = (sel_date - start_dt).days % 7 == 0
-            elif schedule == "Bi-weekly":
-                show = (sel_date - start_dt).days % 14 == 0
-            elif schedule == "Monthly":
-                show = sel_date.day == start_dt.day
-        if show:
-            done = records.get(name, {}).get(selected_date, False)
-            agenda.append((name, done))
+    for habit in data["habits"]:
+        if compile_habit(habit).occurs_on(sel_date):
+            name = habit["name"]
+            agenda.append((name, records.get(name, {}).get(selected_date, False)))
     return agenda
 
+def completion_color(scheduled, done):
+    """Return the calendar color for a day with `scheduled` habits of which `done` were completed."""
+    if not scheduled:
+        return 'gray'  # No tasks for this day
+    if done >= scheduled:
+        return 'green'
+    if done:
+        return 'orange'
+    return 'red'
+
+@timed
 def get_monthly_completion(year, month, username=None):
     """Return a list of dicts for each day in the month, indicating completion color for the user's habits."""
-    data = load_data(username)
-    habits = data["habits"]
-    records = data["records"]
     month_days = calendar.monthrange(year, month)[1]
-    result = []
-    for day in range(1, month_days+1):
-        date_str = f"{year:04d}-{month:02d}-{day:02d}"
-        agenda = []
-        for habit in habits:
-            name = habit["name"]
-            schedule = habit["schedule"]
-            start_date = habit.get("start_date", datetime.now().strftime("%Y-%m-%d"))
-            start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-            sel_date = datetime(year, month, day)
-            show = False
-            if sel_date >= start_dt:
-                if schedule == "Daily":
-                    show = True
-                elif schedule == "Bi-daily":
-                    show = (sel_date - start_dt).days % 2 == 0
-                elif schedule == "Weekly":
-                    show = (sel_date - start_dt).days % 7 == 0
-                elif schedule == "Bi-weekly":
-                    show = (sel_date - start_dt).days % 14 == 0
-                elif schedule == "Monthly":
-                    show = sel_date.day == start_dt.day
-            if show:
-                done = records.get(name, {}).get(date_str, False)
-                agenda.append(done)
-        if not agenda:
-            color = 'gray'  # No tasks for this day
-        elif all(agenda):
-            color = 'green'
-        elif any(agenda):
-            color = 'orange'
-        else:
-            color = 'red'
-        result.append({"day": day, "color": color})
-    return result
+    counts = get_aggregates().day_counts(username, date(year, month, 1), date(year, month, month_days))
+    return [{"day": day.day, "color": completion_color(scheduled, done)} for day, scheduled, done in counts]
+
+@timed
+def get_habit_stats(username=None):
+    """Return completion rate, current streak and longest streak for each of the user's habits."""
+    return get_aggregates().habit_stats(username)
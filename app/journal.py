@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+import time
+from metrics import record_read, record_write
+from records import HabitRecords
+
+# Write-ahead journal for habit marks.
+# A mark is appended as one JSON line ({"habit": ..., "date": ..., "done": ...})
+# to a per-user journal next to data.json and fsync'd, instead of rewriting the
+# whole document. Readers replay the journal over the data.json snapshot, and a
+# background JournalCompactor folds the journal back into the snapshot once it
+# grows past a size or age threshold. Replaying a mark is idempotent, so after
+# a crash (even mid-compaction) the journal is simply replayed again.
+
+def journal_path(data_file):
+    """Return the journal file that belongs to a data file."""
+    return os.path.splitext(data_file)[0] + ".journal"
+
+def append(path, habit_name, date, done):
+    """Durably append one mark to the journal."""
+    line = json.dumps({"habit": habit_name, "date": date, "done": done}) + "\n"
+    with open(path, "a") as f:
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+    record_write(path, len(line))
+
+def replay(path, data):
+    """Apply every mark in the journal to data["records"] in place. Returns the number of marks applied.
+
+    A torn last line (a crash during append) is ignored.
+    """
+    try:
+        f = open(path, "r")
+    except FileNotFoundError:
+        return 0
+    applied = 0
+    nbytes = 0
+    with f:
+        for line in f:
+            nbytes += len(line)
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            try:
+                data["records"].setdefault(entry["habit"], HabitRecords())[entry["date"]] = entry["done"]
+            except ValueError:
+                # Not a valid date (marks are validated now, but older journals may hold some).
+                continue
+            applied += 1
+    record_read(path, nbytes)
+    return applied
+
+def truncate(path):
+    """Drop every entry in the journal (after it has been folded into the snapshot)."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class JournalCompactor(threading.Thread):
+    """Daemon thread that compacts user journals once they exceed max_bytes or max_age seconds."""
+
+    def __init__(self, storage, max_bytes=64 * 1024, max_age=300, interval=5):
+        super().__init__(name="journal-compactor", daemon=True)
+        self.storage = storage
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.interval = interval
+        self._pending = {}  # username -> time of the first uncompacted append
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def notify(self, username, journal_size):
+        """Record an append for the user; wakes the thread immediately if the journal is too big."""
+        with self._lock:
+            self._pending.setdefault(username, time.monotonic())
+        if journal_size >= self.max_bytes:
+            self._wake.set()
+
+    def due(self):
+        """Return the users whose journal should be compacted now."""
+        now = time.monotonic()
+        with self._lock:
+            pending = list(self._pending.items())
+        return [username for username, since in pending
+                if now - since >= self.max_age or self.storage.journal_size(username) >= self.max_bytes]
+
+    def run_once(self):
+        """Compact every due journal. Returns the number of users compacted."""
+        users = self.due()
+        for username in users:
+            with self._lock:
+                self._pending.pop(username, None)
+            try:
+                self.storage.compact(username)
+            except Exception:
+                # Leave the journal in place; it is replayed on read and retried later.
+                with self._lock:
+                    self._pending.setdefault(username, time.monotonic())
+        return len(users)
+
+    def run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.run_once()
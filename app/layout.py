@@ -0,0 +1,125 @@
+import hashlib
+import os
+import threading
+from urllib.parse import quote, unquote
+
+# On-disk layout of per-user files.
+# Users live in a hashed, two-level sharded tree so no directory holds more
+# than a few hundred entries, even with millions of users:
+#   user_data/shards/<h[0:2]>/<h[2:4]>/<quoted username>/   (h = sha256(username))
+# The directory name is the percent-encoded username, so any username maps
+# to exactly one safe path component.
+#
+# Older installs keep users directly in user_data/<username>/. Such a
+# directory is still used until `python app/layout.py migrate` moves it into
+# the sharded tree (stop the app while migrating).
+#
+# Paths are computed without touching the disk; writers call
+# ensure_user_dir() before creating files, readers never create directories.
+
+DATA_ROOT = os.getenv("HABIT_DATA_ROOT", "user_data")
+SHARDS_DIR = "shards"
+
+_resolved = {}  # username -> sharded dir known to exist
+_resolved_lock = threading.Lock()
+
+def sharded_user_dir(username, root=None):
+    """Return the user's directory in the sharded tree."""
+    digest = hashlib.sha256(username.encode()).hexdigest()
+    name = quote(username, safe="").replace(".", "%2E")
+    return os.path.join(root or DATA_ROOT, SHARDS_DIR, digest[:2], digest[2:4], name)
+
+def legacy_user_dir(username, root=None):
+    """Return the user's directory in the old flat layout."""
+    return os.path.join(root or DATA_ROOT, username)
+
+def get_user_dir(username):
+    """Return the directory holding the user's files (not created)."""
+    with _resolved_lock:
+        path = _resolved.get(username)
+    if path is not None:
+        return path
+    path = sharded_user_dir(username)
+    if os.path.isdir(path):
+        with _resolved_lock:
+            _resolved[username] = path
+        return path
+    # Only plain names can have had a flat directory of their own.
+    if username == os.path.basename(username) and username not in (".", "..", SHARDS_DIR):
+        legacy = legacy_user_dir(username)
+        if os.path.isdir(legacy):
+            return legacy
+    return path
+
+def ensure_user_dir(username):
+    """Create the user's directory if needed (write paths only) and return it."""
+    path = get_user_dir(username)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def iter_users(root=None):
+    """Yield (username, directory) for every user under root, sharded and legacy, one at a time."""
+    root = root or DATA_ROOT
+    shards = os.path.join(root, SHARDS_DIR)
+    if os.path.isdir(shards):
+        for first in sorted(os.listdir(shards)):
+            first_dir = os.path.join(shards, first)
+            if not os.path.isdir(first_dir):
+                continue
+            for second in sorted(os.listdir(first_dir)):
+                second_dir = os.path.join(first_dir, second)
+                if not os.path.isdir(second_dir):
+                    continue
+                for name in sorted(os.listdir(second_dir)):
+                    path = os.path.join(second_dir, name)
+                    if os.path.isdir(path):
+                        yield unquote(name), path
+    for username, path in iter_legacy_users(root):
+        yield username, path
+
+def iter_legacy_users(root=None):
+    """Yield (username, directory) for users still in the flat layout."""
+    root = root or DATA_ROOT
+    if not os.path.isdir(root):
+        return
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name)
+        if name != SHARDS_DIR and not name.startswith(".") and os.path.isdir(path):
+            yield name, path
+
+def migrate(root=None):
+    """Move every flat user_data/<username>/ directory into the sharded tree.
+
+    Returns (moved usernames, conflicts): a conflict is a user that already has a
+    sharded directory; it is left in place for manual inspection.
+    """
+    moved, conflicts = [], []
+    for username, path in list(iter_legacy_users(root)):
+        target = sharded_user_dir(username, root)
+        if os.path.exists(target):
+            conflicts.append(username)
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # A rename within one file system is atomic: a user is never half-migrated.
+        os.rename(path, target)
+        moved.append(username)
+    with _resolved_lock:
+        _resolved.clear()
+    return moved, conflicts
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Habit tracker user_data layout tools")
+    parser.add_argument("command", choices=["migrate", "list"],
+                        help="migrate: move flat user directories into the sharded tree; list: print user directories")
+    parser.add_argument("--root", default=None, help="user data directory (defaults to HABIT_DATA_ROOT or user_data)")
+    args = parser.parse_args()
+    if args.command == "migrate":
+        moved, conflicts = migrate(args.root)
+        print(f"Moved {len(moved)} user(s) into the sharded layout.")
+        for username in conflicts:
+            print(f"Skipped {username}: a sharded directory already exists")
+    else:
+        for username, path in iter_users(args.root):
+            print(f"{username}\t{path}")
@@ -0,0 +1,98 @@
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from metrics import record_write
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+# Locking and atomic file replacement for user data.
+# file_lock(path) serializes writers of `path` across threads (an in-process
+# lock per path) and across worker processes (an fcntl advisory lock on
+# `path + ".lock"`). atomic_write_json writes to a temp file in the same
+# directory and os.replace()s it over the target, so readers only ever see
+# the old or the new document, never a truncated one.
+
+class _PathLock:
+    """Re-entrant in-process lock for one path, tracking this thread's nesting depth."""
+
+    def __init__(self):
+        self.rlock = threading.RLock()
+        self.local = threading.local()
+
+_path_locks = {}
+_path_locks_guard = threading.Lock()
+
+def _path_lock(path):
+    with _path_locks_guard:
+        return _path_locks.setdefault(os.path.abspath(path), _PathLock())
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on `path` for the duration of the block (re-entrant within a thread)."""
+    lock = _path_lock(path)
+    with lock.rlock:
+        depth = getattr(lock.local, "depth", 0)
+        # Only the outermost holder in this thread takes the process lock.
+        if depth or fcntl is None:
+            lock.local.depth = depth + 1
+            try:
+                yield
+            finally:
+                lock.local.depth = depth
+            return
+        with open(path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            lock.local.depth = 1
+            try:
+                yield
+            finally:
+                lock.local.depth = 0
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+@contextmanager
+def try_process_lock(path):
+    """Try to take the process-level lock on `path` without waiting; yields True if it was acquired.
+
+    Used by periodic jobs that only need to run in one worker process at a time.
+    """
+    if fcntl is None:
+        yield True
+        return
+    with open(path + ".lock", "a") as lock_file:
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+def atomic_write_json(path, data, indent=None, durable=True):
+    """Write data as JSON to path atomically (temp file + fsync + os.replace).
+
+    durable=False skips the fsync: readers still never see a torn file, but the
+    write may be lost (the old contents come back) if the machine crashes.
+    """
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=indent)
+            f.flush()
+            if durable:
+                os.fsync(f.fileno())
+            record_write(path, f.tell())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
@@ -0,0 +1,231 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from habit_data import save_data, update_data
+from layout import DATA_ROOT
+from locking import try_process_lock
+from records import decode_records, encode_records
+from schedule import Recurrence, compile_habit
+from storage import get_storage
+
+# Bulk export/import and background maintenance of user data.
+#
+# export_users / import_users stream every user's habits and records as NDJSON,
+# one {"username", "habits", "records"} line per user (records in the compact
+# form of records.py; the old per-day dicts are accepted on import), holding
+# only one user in memory at a time:
+#   python app/maintenance.py export --output backup.ndjson
+#   python app/maintenance.py import --input backup.ndjson [--skip-existing]
+#
+# check_user validates one user's document: habits without a name or with an
+# unknown schedule or bad start date, names that collide (exactly or only by
+# case, e.g. after a rename), records of habits that no longer exist
+# (orphans) and records with invalid dates. With fix=True orphaned and invalid
+# records are garbage-collected; records whose name differs from a habit only
+# by case are reported but kept, since they most likely belong to it.
+#
+# MaintenanceWorker runs a pass over all users every HABIT_MAINTENANCE_INTERVAL
+# seconds (default 3600, 0 disables it): compact leftover journals, validate,
+# and GC orphaned records. Only one worker process runs a pass at a time, and
+# a pass is skipped if another process finished one within the interval.
+#   python app/maintenance.py check [--fix]
+
+INTERVAL = float(os.getenv("HABIT_MAINTENANCE_INTERVAL", 3600))
+
+logger = logging.getLogger("habit_tracker.maintenance")
+
+def _backend():
+    """Return the storage backend without the read cache (bulk scans would only evict hot users)."""
+    storage = get_storage()
+    return getattr(storage, "storage", storage)
+
+def export_users(out):
+    """Write every user's habits and records to `out` as NDJSON lines. Returns the number of users."""
+    backend = _backend()
+    count = 0
+    for username in backend.usernames():
+        data = backend.load(username)
+        line = {"username": username, "habits": data["habits"], "records": encode_records(data["records"])}
+        out.write(json.dumps(line) + "\n")
+        count += 1
+    return count
+
+def import_users(lines, skip_existing=False):
+    """Load users from NDJSON lines (see export_users), replacing their data. Returns (imported, skipped, errors)."""
+    backend = _backend()
+    imported, skipped, errors = 0, 0, []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            username = record["username"]
+            data = {"habits": record["habits"], "records": record["records"]}
+            if not username or not isinstance(data["habits"], list) or not isinstance(data["records"], dict):
+                raise ValueError("username, habits (list) and records (object) are required")
+        except (ValueError, KeyError, TypeError) as e:
+            errors.append(f"line {number}: {e}")
+            continue
+        if skip_existing and backend.load(username)["habits"]:
+            skipped += 1
+            continue
+        decode_records(data["records"])
+        save_data(data, username)
+        imported += 1
+    return imported, skipped, errors
+
+def _valid_date(value):
+    try:
+        datetime.strptime(value, "%Y-%m-%d")
+        return True
+    except (TypeError, ValueError):
+        return False
+
+def find_problems(data):
+    """Return a list of {"kind", "detail"} problems in a user document."""
+    problems = []
+    by_lower_name = {}
+    for i, habit in enumerate(data.get("habits", [])):
+        if not isinstance(habit, dict) or not habit.get("name"):
+            problems.append({"kind": "invalid_habit", "detail": f"habit #{i} has no name"})
+            continue
+        by_lower_name.setdefault(habit["name"].lower(), []).append(habit["name"])
+        if not isinstance(habit.get("schedule"), str):
+            problems.append({"kind": "invalid_habit", "detail": f"{habit['name']}: no schedule"})
+        elif habit.get("start_date") and not _valid_date(habit["start_date"]):
+            problems.append({"kind": "invalid_habit", "detail": f"{habit['name']}: bad start date {habit['start_date']!r}"})
+        elif type(compile_habit(habit)) is Recurrence:
+            problems.append({"kind": "unknown_schedule", "detail": f"{habit['name']}: {habit.get('schedule')!r}"})
+    for names in by_lower_name.values():
+        if len(names) > 1:
+            problems.append({"kind": "name_collision", "detail": f"{len(names)} habits named {sorted(names)}"})
+    habit_names = {name for names in by_lower_name.values() for name in names}
+    for name, records in data.get("records", {}).items():
+        if name not in habit_names:
+            if name.lower() in by_lower_name:
+                problems.append({"kind": "case_mismatched_records",
+                                 "detail": f"records for {name!r} but the habit is {by_lower_name[name.lower()]}"})
+            else:
+                problems.append({"kind": "orphaned_records", "detail": f"{len(records)} record(s) for {name!r}",
+                                 "habit": name})
+            continue
+        bad = [day for day in records if not _valid_date(day)]
+        if bad:
+            problems.append({"kind": "invalid_records", "detail": f"{name}: dates {bad[:5]}", "habit": name})
+    return problems
+
+def collect_garbage(data):
+    """Remove orphaned records and records with invalid dates in place. Returns False if nothing was removed."""
+    changed = False
+    for problem in find_problems(data):
+        if problem["kind"] == "orphaned_records":
+            del data["records"][problem["habit"]]
+            changed = True
+        elif problem["kind"] == "invalid_records":
+            records = data["records"][problem["habit"]]
+            for day in [d for d in records if not _valid_date(d)]:
+                del records[day]
+            changed = True
+    return changed
+
+def check_user(username, fix=False):
+    """Compact the user's journal, validate their data and optionally GC it. Returns a report dict."""
+    backend = _backend()
+    report = {"username": username, "compacted": False, "problems": [], "fixed": False}
+    if getattr(backend, "journal", False) and backend.journal_size(username):
+        backend.compact(username)
+        report["compacted"] = True
+    report["problems"] = [{"kind": p["kind"], "detail": p["detail"]} for p in find_problems(backend.load(username))]
+    if fix and any(p["kind"] in ("orphaned_records", "invalid_records") for p in report["problems"]):
+        report["fixed"] = update_data(collect_garbage, username) is not False
+    return report
+
+def run_pass(fix=True):
+    """Check every user once. Returns the reports of users that had something to report."""
+    reports = []
+    for username in list(_backend().usernames()):
+        report = check_user(username, fix)
+        if report["compacted"] or report["problems"]:
+            reports.append(report)
+            for problem in report["problems"]:
+                logger.warning("%s: %s (%s)", username, problem["kind"], problem["detail"])
+    return reports
+
+class MaintenanceWorker(threading.Thread):
+    """Daemon thread running run_pass every `interval` seconds, in at most one process at a time."""
+
+    def __init__(self, interval=INTERVAL, fix=True):
+        super().__init__(name="maintenance", daemon=True)
+        self.interval = interval
+        self.fix = fix
+        self.marker = os.path.join(DATA_ROOT, "maintenance.last")
+
+    def run_once(self):
+        """Run a pass unless another process is running one or finished one recently. Returns the reports or None."""
+        os.makedirs(DATA_ROOT, exist_ok=True)
+        with try_process_lock(os.path.join(DATA_ROOT, "maintenance")) as acquired:
+            if not acquired:
+                return None
+            try:
+                if time.time() - os.path.getmtime(self.marker) < self.interval * 0.9:
+                    return None
+            except FileNotFoundError:
+                pass
+            started = time.perf_counter()
+            reports = run_pass(self.fix)
+            with open(self.marker, "w") as f:
+                f.write(datetime.now().isoformat() + "\n")
+            logger.info("maintenance pass: %d user(s) with findings, %.1f s", len(reports),
+                        time.perf_counter() - started)
+            return reports
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("maintenance pass failed")
+
+_worker = None
+_worker_lock = threading.Lock()
+
+def start_maintenance_worker():
+    """Start this process's MaintenanceWorker once (no-op if HABIT_MAINTENANCE_INTERVAL is 0)."""
+    global _worker
+    with _worker_lock:
+        if _worker is None and INTERVAL > 0:
+            _worker = MaintenanceWorker()
+            _worker.start()
+    return _worker
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Habit tracker bulk export/import and maintenance")
+    parser.add_argument("command", choices=["export", "import", "check"],
+                        help="export/import: NDJSON of all users; check: validate (and with --fix GC) every user")
+    parser.add_argument("--output", help="export destination (default: stdout)")
+    parser.add_argument("--input", help="import source (default: stdin)")
+    parser.add_argument("--skip-existing", action="store_true", help="import: keep users that already have habits")
+    parser.add_argument("--fix", action="store_true", help="check: remove orphaned and invalid records")
+    args = parser.parse_args()
+    if args.command == "export":
+        out = open(args.output, "w") if args.output else sys.stdout
+        with out:
+            count = export_users(out)
+        print(f"Exported {count} user(s).", file=sys.stderr)
+    elif args.command == "import":
+        source = open(args.input, "r") if args.input else sys.stdin
+        with source:
+            imported, skipped, errors = import_users(source, args.skip_existing)
+        print(f"Imported {imported} user(s), skipped {skipped}.", file=sys.stderr)
+        for error in errors:
+            print(error, file=sys.stderr)
+    else:
+        for report in run_pass(args.fix):
+            print(json.dumps(report))
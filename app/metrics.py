@@ -0,0 +1,213 @@
+import cProfile
+import functools
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Built-in instrumentation, exposed in Prometheus text format on /metrics.
+#   habit_tracker_function_seconds       - every public habit_data function (@timed)
+#   habit_tracker_phase_seconds          - where a request spends its time: file reads,
+#                                          JSON parsing, template rendering
+#   habit_tracker_openai_seconds         - each outbound OpenAI call (chat / extract)
+#   habit_tracker_http_request_seconds   - Flask request latency per endpoint
+#   habit_tracker_file_*_bytes_total     - bytes read / written per kind of user file
+#   habit_tracker_cache_*                - hits, misses, evictions and size of the data and page caches
+#   habit_tracker_events_total           - live update events published (events.py)
+#   habit_tracker_event_streams_total    - /events connections, held open or answered at once
+# Metrics are kept per process; with several workers each one reports its own
+# (the pid label tells them apart).
+#
+# HABIT_PROFILE_EVERY=N runs every N-th request under cProfile and writes the
+# stats to HABIT_PROFILE_DIR (load them with pstats or snakeviz).
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """Return the current value for the given labels."""
+        with self._lock:
+            return self._values.get(tuple(labels.get(name, "") for name in self.labels), 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in items]
+
+class Gauge(Counter):
+    """Value that can go up and down, with optional labels."""
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram:
+    """Latency histogram (seconds) with optional labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, list(entry)) for key, entry in self._values.items())
+        lines = []
+        for key, entry in items:
+            for bound, count in zip(self.buckets, entry):
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [('le', bound)])} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [('le', '+Inf')])} {entry[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {entry[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {entry[-1]}")
+        return lines
+
+REGISTRY = []
+
+FUNCTION_SECONDS = Histogram("habit_tracker_function_seconds", "Time spent in habit_data functions.",
+                             ("function",))
+PHASE_SECONDS = Histogram("habit_tracker_phase_seconds",
+                          "Time spent in file reads, JSON parsing and template rendering.", ("phase",))
+OPENAI_SECONDS = Histogram("habit_tracker_openai_seconds", "Latency of outbound OpenAI calls.", ("call",))
+OPENAI_PROMPT_TOKENS = Counter("habit_tracker_openai_prompt_tokens_total", "Prompt tokens sent to OpenAI.",
+                               ("call",))
+HTTP_SECONDS = Histogram("habit_tracker_http_request_seconds", "Flask request latency.",
+                         ("endpoint", "method", "status"))
+FILE_READ_BYTES = Counter("habit_tracker_file_read_bytes_total", "Bytes read from user files.", ("kind",))
+FILE_WRITTEN_BYTES = Counter("habit_tracker_file_written_bytes_total", "Bytes written to user files.", ("kind",))
+CACHE_LOOKUPS = Counter("habit_tracker_cache_lookups_total", "Cache lookups by result (hit or miss).",
+                        ("cache", "result"))
+CACHE_EVICTIONS = Counter("habit_tracker_cache_evictions_total", "Entries evicted to stay under the size cap.",
+                          ("cache",))
+CACHE_BYTES = Gauge("habit_tracker_cache_bytes", "Current cache size (source bytes).", ("cache",))
+EVENTS_PUBLISHED = Counter("habit_tracker_events_total", "Live update events published.", ("type",))
+EVENT_STREAMS = Counter("habit_tracker_event_streams_total",
+                        "Event stream connections, held open for events or answered at once.", ("mode",))
+
+def render():
+    """Return every metric in Prometheus text exposition format."""
+    pid = os.getpid()
+    lines = ["# HELP habit_tracker_process_info Worker process serving these metrics.",
+             "# TYPE habit_tracker_process_info gauge",
+             f'habit_tracker_process_info{{pid="{pid}"}} 1']
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+def timed(function):
+    """Decorator recording the function's duration in habit_tracker_function_seconds."""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with FUNCTION_SECONDS.time(function=function.__name__):
+            return function(*args, **kwargs)
+    return wrapper
+
+def file_kind(path):
+    """Classify a user file for the byte counters (data, journal, chat, users, version, other)."""
+    name = os.path.basename(path)
+    if name.endswith(".journal"):
+        return "journal"
+    if name in ("data.json", "habits_data.json"):
+        return "data"
+    if name == "version.json":
+        return "version"
+    if name.startswith("users."):
+        return "users"
+    if name.endswith(".ndjson") or name == "chat.json":
+        return "chat"
+    return "other"
+
+def record_read(path, nbytes):
+    FILE_READ_BYTES.inc(nbytes, kind=file_kind(path))
+
+def record_write(path, nbytes):
+    FILE_WRITTEN_BYTES.inc(nbytes, kind=file_kind(path))
+
+class SamplingProfiler:
+    """Profiles every N-th request with cProfile and dumps the stats to a directory."""
+
+    def __init__(self, every=0, directory="profiles"):
+        self.every = every
+        self.directory = directory
+        self._counter = itertools.count(1)
+
+    def start(self):
+        """Return a running profiler if this request is sampled, else None."""
+        if not self.every or next(self._counter) % self.every:
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is active (e.g. a concurrent sampled request on Python 3.12+).
+            return None
+        return profiler
+
+    def stop(self, profiler, label):
+        """Stop a profiler returned by start() and write its stats to <directory>/<time>-<label>-<pid>.prof."""
+        profiler.disable()
+        os.makedirs(self.directory, exist_ok=True)
+        safe_label = "".join(c if c.isalnum() or c in "-_" else "_" for c in label)
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{safe_label}-{os.getpid()}.prof")
+        profiler.dump_stats(path)
+        return path
+
+profiler = SamplingProfiler(int(os.getenv("HABIT_PROFILE_EVERY", 0)), os.getenv("HABIT_PROFILE_DIR", "profiles"))
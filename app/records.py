@@ -0,0 +1,195 @@
+import base64
+from collections.abc import Mapping, MutableMapping
+from datetime import date
+
+# Compact encoding of a habit's completion records.
+# In memory and on disk, the days a habit was done are a bitmap: bit i (least
+# significant bit first) is set if the habit was done on origin + i days.
+# In data.json each habit's records are one string:
+#   "records": {"Read": "2026-01-01:/38B", ...}
+# i.e. "<origin>:<base64 bitmap>", about one byte per 8 days instead of ~20
+# bytes per marked day. HabitRecords is a mapping of "YYYY-MM-DD" -> True over
+# that bitmap, so code written for the old {"YYYY-MM-DD": bool} dicts keeps
+# working; the base64 text is only decoded when a habit's records are first
+# used, and day lookups never build per-day objects. Setting a day to False
+# clears its bit (a missing day and a False day already meant the same thing).
+#
+# The old dict format is still read: decode_records turns such dicts into
+# HabitRecords, so a legacy data.json is rewritten compactly on its next save.
+
+def _ordinal(day):
+    """Return the proleptic ordinal of a date, ordinal or "YYYY-MM-DD" string; ValueError if it is not a valid day."""
+    if isinstance(day, int):
+        return day
+    if isinstance(day, date):
+        return day.toordinal()
+    if not isinstance(day, str) or len(day) != 10:
+        raise ValueError(f"invalid date: {day!r}")
+    return date.fromisoformat(day).toordinal()
+
+class HabitRecords(MutableMapping):
+    """Days a habit was done, as a bitmap indexed by day offset from `origin`."""
+
+    __slots__ = ("_origin", "_bits", "_encoded")
+
+    def __init__(self, origin=None, bits=b"", encoded=None):
+        self._origin = origin.toordinal() if isinstance(origin, date) else origin
+        self._bits = bytearray(bits) if encoded is None else None
+        self._encoded = encoded
+
+    @classmethod
+    def decode(cls, text):
+        """Parse the "<origin>:<base64>" form; the bitmap itself is decoded lazily."""
+        origin, _, encoded = text.partition(":")
+        return cls(_ordinal(origin), encoded=encoded)
+
+    @classmethod
+    def from_dict(cls, days, strict=True):
+        """Build from a legacy {"YYYY-MM-DD": bool} dict.
+
+        A key that is not a valid date raises ValueError, or is skipped with strict=False.
+        """
+        records = cls()
+        for day, done in days.items():
+            try:
+                records[day] = done
+            except ValueError:
+                if strict:
+                    raise
+        return records
+
+    def encode(self):
+        """Return the "<origin>:<base64>" form (trailing empty bytes dropped)."""
+        if self._encoded is not None:
+            return f"{date.fromordinal(self._origin).isoformat()}:{self._encoded}"
+        bits = self._bits.rstrip(b"\0")
+        if not bits:
+            return ""
+        return f"{date.fromordinal(self._origin).isoformat()}:{base64.b64encode(bits).decode()}"
+
+    @property
+    def bits(self):
+        # Cached documents are shared between threads: decoding twice is harmless, so no lock.
+        bits = self._bits
+        if bits is None:
+            bits = self._bits = bytearray(base64.b64decode(self._encoded))
+        return bits
+
+    @property
+    def origin(self):
+        """Date of bit 0 (None while no day has been set)."""
+        return date.fromordinal(self._origin) if self._origin is not None else None
+
+    def to_bytes(self):
+        """Return a copy of the bitmap (bit i = origin + i days)."""
+        return bytes(self.bits)
+
+    def is_done(self, day):
+        """Return True if the habit was done on `day` (a date or "YYYY-MM-DD")."""
+        if self._origin is None:
+            return False
+        offset = _ordinal(day) - self._origin
+        bits = self.bits
+        return 0 <= offset < len(bits) * 8 and bool(bits[offset >> 3] & (1 << (offset & 7)))
+
+    def set_done(self, day, done=True):
+        """Set or clear one day, growing the bitmap as needed."""
+        ordinal = _ordinal(day)
+        bits = self.bits
+        self._encoded = None  # the bitmap is about to diverge from the stored text
+        if not done:
+            if self.is_done(ordinal):
+                offset = ordinal - self._origin
+                bits[offset >> 3] &= ~(1 << (offset & 7)) & 0xFF
+            return
+        if self._origin is None:
+            self._origin = ordinal
+        elif ordinal < self._origin:
+            # Grow by whole bytes at the front so existing bits keep their positions within a byte.
+            grow = (self._origin - ordinal + 7) // 8
+            bits[0:0] = bytes(grow)
+            self._origin -= grow * 8
+        offset = ordinal - self._origin
+        if offset >> 3 >= len(bits):
+            bits.extend(bytes((offset >> 3) - len(bits) + 1))
+        bits[offset >> 3] |= 1 << (offset & 7)
+
+    def done_between(self, first, last):
+        """Yield the dates in first..last (inclusive) on which the habit was done, without scanning other days."""
+        if self._origin is None:
+            return
+        bits = self.bits
+        start = max(_ordinal(first) - self._origin, 0)
+        stop = min(_ordinal(last) - self._origin + 1, len(bits) * 8)
+        offset = start
+        while offset < stop:
+            byte = bits[offset >> 3]
+            if not byte:
+                offset = (offset | 7) + 1
+                continue
+            if byte & (1 << (offset & 7)):
+                yield date.fromordinal(self._origin + offset)
+            offset += 1
+
+    def __getitem__(self, day):
+        try:
+            if self.is_done(day):
+                return True
+        except ValueError:
+            pass
+        raise KeyError(day)
+
+    def __setitem__(self, day, done):
+        self.set_done(day, done)
+
+    def __delitem__(self, day):
+        if not self.is_done(day):
+            raise KeyError(day)
+        self.set_done(day, False)
+
+    def __contains__(self, day):
+        try:
+            return self.is_done(day)
+        except ValueError:
+            return False
+
+    def __iter__(self):
+        if self._origin is None:
+            return
+        for day in self.done_between(self._origin, self._origin + len(self.bits) * 8 - 1):
+            yield day.isoformat()
+
+    def __len__(self):
+        return bin(int.from_bytes(self.bits, "little")).count("1")
+
+    def __repr__(self):
+        return f"HabitRecords({self.encode()!r})"
+
+def decode_records(records):
+    """Turn a stored records object into {habit name: HabitRecords}, in place. Returns it.
+
+    Values may be the compact string form or a legacy dict; a dict with keys that
+    are not valid dates is kept as it is (maintenance.py reports and cleans those).
+    """
+    for name, value in list(records.items()):
+        if isinstance(value, str):
+            records[name] = HabitRecords.decode(value) if value else HabitRecords()
+        elif isinstance(value, Mapping) and not isinstance(value, HabitRecords):
+            try:
+                records[name] = HabitRecords.from_dict(value)
+            except ValueError:
+                pass
+    return records
+
+def encode_records(records):
+    """Return a JSON-ready copy of a records object with every habit in the compact string form."""
+    encoded = {}
+    for name, value in records.items():
+        if isinstance(value, Mapping) and not isinstance(value, HabitRecords):
+            try:
+                value = HabitRecords.from_dict(value)
+            except ValueError:
+                encoded[name] = dict(value)
+                continue
+        encoded[name] = value.encode() if isinstance(value, HabitRecords) else value
+    return encoded
@@ -0,0 +1,143 @@
+import re
+from datetime import date, datetime
+from functools import lru_cache
+
+# Schedule engine: each habit's (schedule, start_date) pair is compiled once
+# into a recurrence object that can answer "does it occur on this day?" and
+# "which days in [a, b] does it occur on?" without re-parsing any strings.
+#
+# New recurrence kinds are added by registering a fixed schedule name in
+# SCHEDULES or a pattern in SCHEDULE_PATTERNS (see register_schedule /
+# register_schedule_pattern below).
+
+class Recurrence:
+    """Base recurrence: never occurs. Used for unknown schedule names."""
+
+    def __init__(self, start):
+        self.start = start
+
+    def occurs_on(self, day):
+        """Return True if the habit is scheduled on the given date."""
+        return False
+
+    def occurrences(self, first, last):
+        """Yield every scheduled date between first and last (inclusive), in order."""
+        return iter(())
+
+class PeriodicRecurrence(Recurrence):
+    """Occurs every `period` days counted from the start date (Daily, Bi-daily, Weekly, ...)."""
+
+    def __init__(self, start, period):
+        super().__init__(start)
+        self.period = period
+
+    def occurs_on(self, day):
+        return day >= self.start and (day - self.start).days % self.period == 0
+
+    def occurrences(self, first, last):
+        if first < self.start:
+            first = self.start
+        # Stepping over ordinals rather than dates cannot overflow past date.max.
+        begin = first.toordinal() + (self.start.toordinal() - first.toordinal()) % self.period
+        for ordinal in range(begin, last.toordinal() + 1, self.period):
+            yield date.fromordinal(ordinal)
+
+class MonthlyRecurrence(Recurrence):
+    """Occurs on the start date's day of the month (months without that day are skipped)."""
+
+    def __init__(self, start):
+        super().__init__(start)
+        self.day = start.day
+
+    def occurs_on(self, day):
+        return day >= self.start and day.day == self.day
+
+    def occurrences(self, first, last):
+        if first < self.start:
+            first = self.start
+        year, month = first.year, first.month
+        while (year, month) <= (last.year, last.month):
+            try:
+                day = date(year, month, self.day)
+            except ValueError:
+                day = None
+            if day is not None and first <= day <= last:
+                yield day
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+class WeekdayRecurrence(Recurrence):
+    """Occurs on a fixed set of weekdays (0 = Monday ... 6 = Sunday) from the start date on."""
+
+    def __init__(self, start, weekdays):
+        super().__init__(start)
+        self.weekdays = frozenset(weekdays)
+
+    def occurs_on(self, day):
+        return day >= self.start and day.weekday() in self.weekdays
+
+    def occurrences(self, first, last):
+        if first < self.start:
+            first = self.start
+        # One 7-day stride per selected weekday, merged back into date order.
+        days = []
+        for weekday in self.weekdays:
+            begin = first.toordinal() + (weekday - first.weekday()) % 7
+            days.extend(range(begin, last.toordinal() + 1, 7))
+        return (date.fromordinal(ordinal) for ordinal in sorted(days))
+
+SCHEDULES = {
+    "Daily": lambda start: PeriodicRecurrence(start, 1),
+    "Bi-daily": lambda start: PeriodicRecurrence(start, 2),
+    "Weekly": lambda start: PeriodicRecurrence(start, 7),
+    "Bi-weekly": lambda start: PeriodicRecurrence(start, 14),
+    "Monthly": MonthlyRecurrence,
+}
+
+SCHEDULE_PATTERNS = []
+
+WEEKDAY_NAMES = {"mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6}
+
+def register_schedule(name, factory):
+    """Register a fixed schedule name; factory(start_date) returns a Recurrence."""
+    SCHEDULES[name] = factory
+    compile_schedule.cache_clear()
+
+def register_schedule_pattern(pattern, factory):
+    """Register a schedule pattern; factory(start_date, match) returns a Recurrence."""
+    SCHEDULE_PATTERNS.append((re.compile(pattern, re.IGNORECASE), factory))
+    compile_schedule.cache_clear()
+
+def is_known_schedule(schedule):
+    """Return True if the schedule is a registered name or matches a registered pattern."""
+    if not isinstance(schedule, str):
+        return False
+    return schedule in SCHEDULES or any(pattern.fullmatch(schedule.strip()) for pattern, _ in SCHEDULE_PATTERNS)
+
+@lru_cache(maxsize=4096)
+def compile_schedule(schedule, start_date):
+    """Compile a schedule string and 'YYYY-MM-DD' start date into a Recurrence (cached)."""
+    start = datetime.strptime(start_date, "%Y-%m-%d").date()
+    factory = SCHEDULES.get(schedule)
+    if factory is not None:
+        return factory(start)
+    for pattern, pattern_factory in SCHEDULE_PATTERNS:
+        match = pattern.fullmatch((schedule or "").strip())
+        if match:
+            return pattern_factory(start, match)
+    return Recurrence(start)
+
+def compile_habit(habit):
+    """Return the Recurrence for a habit dict; a missing start date means today."""
+    start_date = habit.get("start_date") or datetime.now().strftime("%Y-%m-%d")
+    return compile_schedule(habit["schedule"], start_date)
+
+# "Every 3 days"
+register_schedule_pattern(
+    r"every\s+(\d+)\s+days?",
+    lambda start, m: PeriodicRecurrence(start, int(m.group(1))) if int(m.group(1)) > 0 else Recurrence(start))
+# "Weekdays: Mon, Wed, Fri"
+register_schedule_pattern(
+    r"weekdays:\s*([a-z,\s]+)",
+    lambda start, m: WeekdayRecurrence(
+        start, {WEEKDAY_NAMES[w.strip()[:3].lower()] for w in m.group(1).split(",")
+                if w.strip()[:3].lower() in WEEKDAY_NAMES}))
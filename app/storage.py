@@ -0,0 +1,499 @@
+import json
+import os
+import sqlite3
+import threading
+import journal
+from locking import atomic_write_json, file_lock
+from cache import DEFAULT_MAX_BYTES, CachedStorage, DataCache
+from metrics import PHASE_SECONDS, record_read
+from layout import DATA_ROOT, ensure_user_dir, get_user_dir, iter_users
+from records import decode_records, encode_records
+
+# Storage backends for per-user habit data.
+# Every backend exposes the same small interface so habit_data does not care
+# where the habits and records actually live:
+#   load / save          - whole document {"habits": [...], "records": {...}}
+#   get_habits           - list of habit dicts
+#   set_record           - mark one (habit, date) as done / not done
+#   load_range           - habits plus (at least) the records in an inclusive date range
+#   update               - atomic read-modify-write: update(mutate, username, written=None)
+#   usernames            - iterate over every user with stored data
+# Backends that can cheaply tell whether a user's data changed also implement
+#   stamp                - tuple that changes whenever the user's data changes, ending
+#                          with the data size in bytes; used by cache.CachedStorage
+#                          (JSON only) and aggregates.py. Their set_record returns the (before, after)
+#                          stamps around its write, read under the write lock, and
+#                          update calls written(before, after) likewise once it writes.
+
+def get_data_file(username=None):
+    """Return the path to the user's data file (see layout.py). Defaults to global data if username is None."""
+    if username:
+        return os.path.join(get_user_dir(username), "data.json")
+    return "habits_data.json"
+
+def empty_data():
+    """Return the default (empty) data structure for a user."""
+    return {"habits": [], "records": {}}
+
+class JSONStorage:
+    """Original layout: one pretty-printed data.json document per user.
+
+    Records are stored in the compact bitmap form of records.py; documents with
+    the older {"YYYY-MM-DD": bool} records are read too and converted on save.
+
+    With journal=True, marks are appended to a per-user write-ahead journal
+    (see journal.py) and merged over data.json on read, so a mark no longer
+    rewrites the whole document.
+    """
+
+    name = "json"
+
+    # Read-modify-write cycles (update) retry this many times when another writer got in first.
+    MAX_RETRIES = 10
+
+    def __init__(self, journal=False, compactor=None):
+        self.journal = journal
+        self.compactor = compactor
+
+    def _lock(self, username):
+        """Return the lock that orders snapshot writes and journal appends for a user, across threads and processes.
+
+        Only writers take it, so this is where the user's directory is created.
+        """
+        if username:
+            ensure_user_dir(username)
+        return file_lock(get_data_file(username))
+
+    def _write_snapshot(self, data_file, data):
+        atomic_write_json(data_file, dict(data, records=encode_records(data["records"])), indent=2)
+
+    def _load_snapshot(self, data_file):
+        if not os.path.exists(data_file):
+            return empty_data()
+        with PHASE_SECONDS.time(phase="file_read"):
+            with open(data_file, "r") as f:
+                text = f.read()
+        record_read(data_file, len(text))
+        with PHASE_SECONDS.time(phase="json_parse"):
+            data = json.loads(text)
+        decode_records(data["records"])
+        return data
+
+    def load(self, username=None):
+        """Load habit and record data for the given user. Returns default structure if file does not exist."""
+        data_file = get_data_file(username)
+        data = self._load_snapshot(data_file)
+        if self.journal:
+            journal.replay(journal.journal_path(data_file), data)
+        return data
+
+    def save(self, data, username=None):
+        """Save the given data dict to the user's data file. The document supersedes any journaled marks."""
+        data_file = get_data_file(username)
+        with self._lock(username):
+            self._write_snapshot(data_file, data)
+            if self.journal:
+                journal.truncate(journal.journal_path(data_file))
+
+    def compare_and_save(self, data, expected, username=None, written=None):
+        """Save data only if the user's stamp still equals `expected`. Returns True if it was saved.
+
+        written(before, after), if given, is called under the lock with the stamps around the save.
+        """
+        with self._lock(username):
+            if self.stamp(username) != expected:
+                return False
+            self.save(data, username)
+            if written is not None:
+                written(expected, self.stamp(username))
+            return True
+
+    def update(self, mutate, username=None, written=None):
+        """Atomically apply mutate(data) to the user's document and return its result.
+
+        The document is not written if mutate returns False. Concurrent writers are
+        detected with compare_and_save and the cycle is retried on a fresh copy.
+        written(before, after) is called under the lock with the stamps around the write.
+        """
+        for _ in range(self.MAX_RETRIES):
+            expected = self.stamp(username)
+            data = self.load(username)
+            result = mutate(data)
+            if result is False or self.compare_and_save(data, expected, username, written):
+                return result
+        # Heavy contention: do the whole cycle under the lock.
+        with self._lock(username):
+            before = self.stamp(username)
+            data = self.load(username)
+            result = mutate(data)
+            if result is not False:
+                self.save(data, username)
+                if written is not None:
+                    written(before, self.stamp(username))
+            return result
+
+    def get_habits(self, username=None):
+        """Return the list of habits for the user."""
+        return self.load(username)["habits"]
+
+    def set_record(self, habit_name, date, done, username=None):
+        """Mark a habit as done or not done for a specific date. Returns the (before, after) stamps around the write."""
+        if not self.journal:
+            stamps = []
+            def mark(data):
+                data["records"].setdefault(habit_name, {})[date] = done
+            self.update(mark, username, lambda before, after: stamps.append((before, after)))
+            return stamps[-1]
+        path = journal.journal_path(get_data_file(username))
+        with self._lock(username):
+            before = self.stamp(username)
+            journal.append(path, habit_name, date, done)
+            after = self.stamp(username)
+        if self.compactor is not None:
+            self.compactor.notify(username, self.journal_size(username))
+        return before, after
+
+    def load_range(self, start, end, username=None):
+        """Return the user's habits and records. The whole document is parsed anyway, so nothing is filtered out."""
+        return self.load(username)
+
+    def journal_size(self, username=None):
+        """Return the size in bytes of the user's journal (0 if there is none)."""
+        try:
+            return os.path.getsize(journal.journal_path(get_data_file(username)))
+        except FileNotFoundError:
+            return 0
+
+    def compact(self, username=None):
+        """Fold the user's journal into data.json and remove it."""
+        data_file = get_data_file(username)
+        path = journal.journal_path(data_file)
+        with self._lock(username):
+            if not os.path.exists(path):
+                return
+            data = self._load_snapshot(data_file)
+            journal.replay(path, data)
+            self._write_snapshot(data_file, data)
+            journal.truncate(path)
+
+    def usernames(self):
+        """Yield every user with a data directory, one at a time."""
+        for username, _ in iter_users():
+            yield username
+
+    def stamp(self, username=None):
+        """Return (data inode, data mtime_ns, journal mtime_ns, total size) for the user's files; zeros if missing."""
+        data_file = get_data_file(username)
+        result = []
+        size = 0
+        for path in (data_file, journal.journal_path(data_file)):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                result.extend((0, 0) if path == data_file else (0,))
+                continue
+            if path == data_file:
+                # os.replace gives every saved snapshot a new inode.
+                result.append(st.st_ino)
+            result.append(st.st_mtime_ns)
+            size += st.st_size
+        return tuple(result) + (size,)
+
+class SQLiteStorage:
+    """Embedded SQLite database with records indexed by (user, habit, date).
+
+    Marking a habit is a single indexed upsert and a month query is a range
+    scan over the (user, date) index, so neither depends on history length.
+    """
+
+    name = "sqlite"
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS habits (
+        username   TEXT NOT NULL,
+        position   INTEGER NOT NULL,
+        name       TEXT NOT NULL,
+        schedule   TEXT,
+        start_date TEXT,
+        PRIMARY KEY (username, name)
+    );
+    CREATE TABLE IF NOT EXISTS records (
+        username TEXT NOT NULL,
+        habit    TEXT NOT NULL,
+        date     TEXT NOT NULL,
+        done     INTEGER NOT NULL,
+        PRIMARY KEY (username, habit, date)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS records_by_date ON records (username, date);
+    CREATE TABLE IF NOT EXISTS changes (
+        username TEXT PRIMARY KEY,
+        version  INTEGER NOT NULL,
+        rows     INTEGER NOT NULL
+    );
+    """
+
+    # Rough in-memory size of one loaded habit or record, for the size element of stamp().
+    ROW_BYTES = 64
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.getenv("HABIT_DB_PATH", os.path.join(DATA_ROOT, "habits.db"))
+        self._local = threading.local()
+
+    def _connect(self):
+        """Return this thread's connection, opening it (and creating the schema) on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            db_dir = os.path.dirname(self.db_path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            created = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'changes'").fetchone() is None
+            conn.executescript(self.SCHEMA)
+            if created:
+                # Databases from before the changes table: count every user's rows once.
+                with conn:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO changes (username, version, rows) SELECT username, 0, COUNT(*) "
+                        "FROM (SELECT username FROM habits UNION ALL SELECT username FROM records) GROUP BY username")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _user(username):
+        # The global (username=None) data set is stored under the empty name.
+        return username or ""
+
+    def usernames(self):
+        """Yield every user with habits or records (the global data set excluded)."""
+        for (username,) in self._connect().execute(
+                "SELECT username FROM habits UNION SELECT username FROM records ORDER BY 1"):
+            if username:
+                yield username
+
+    def stamp(self, username=None):
+        """Return (change counter, approximate size in bytes) for the user's data; (0, 0) if there is none.
+
+        The counter is bumped in the same transaction as every write, so writes
+        from other processes change it too.
+        """
+        row = self._connect().execute(
+            "SELECT version, rows FROM changes WHERE username = ?", (self._user(username),)).fetchone()
+        return (row[0], row[1] * self.ROW_BYTES) if row else (0, 0)
+
+    @staticmethod
+    def _changed(conn, user, rows=None, added=0):
+        """Bump the user's change counter and set (rows) or adjust (added) their row count (caller manages the transaction)."""
+        conn.execute(
+            "INSERT INTO changes (username, version, rows) VALUES (?, 1, ?) ON CONFLICT (username) DO UPDATE "
+            "SET version = version + 1, rows = COALESCE(?, rows + ?)",
+            (user, rows if rows is not None else added, rows, added))
+
+    def load(self, username=None):
+        """Load habit and record data for the given user as a full document."""
+        conn = self._connect()
+        user = self._user(username)
+        data = {"habits": self.get_habits(username), "records": {}}
+        for habit, date, done in conn.execute(
+                "SELECT habit, date, done FROM records WHERE username = ? ORDER BY habit, date", (user,)):
+            data["records"].setdefault(habit, {})[date] = bool(done)
+        return data
+
+    def save(self, data, username=None):
+        """Replace the user's habits and records with the given document (only changed record rows are written)."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._write(conn, data, self._user(username))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def update(self, mutate, username=None, written=None):
+        """Apply mutate(data) to the user's document inside one write transaction and return its result.
+
+        The document is not written if mutate returns False. written(before, after)
+        is called inside the transaction with the stamps around the write.
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            before = self.stamp(username)
+            data = self.load(username)
+            old = self._rows(data)
+            result = mutate(data)
+            if result is not False:
+                self._write(conn, data, self._user(username), old)
+                if written is not None:
+                    written(before, self.stamp(username))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return result
+
+    @staticmethod
+    def _rows(data):
+        """Return {(habit, date): done} for a document's records."""
+        return {(habit, date): int(bool(done))
+                for habit, days in data.get("records", {}).items()
+                for date, done in days.items()}
+
+    @staticmethod
+    def _write(conn, data, user, old=None):
+        """Make the user's rows match the document (caller manages the transaction).
+
+        Habits (a handful of rows) are rewritten; records are diffed against `old`
+        ({(habit, date): done} as stored, read from the table if not given) and only
+        the rows that differ are deleted or upserted.
+        """
+        conn.execute("DELETE FROM habits WHERE username = ?", (user,))
+        habits = [(user, i, h["name"], h.get("schedule"), h.get("start_date"))
+                  for i, h in enumerate(data.get("habits", []))]
+        conn.executemany(
+            "INSERT OR REPLACE INTO habits (username, position, name, schedule, start_date) VALUES (?, ?, ?, ?, ?)",
+            habits)
+        if old is None:
+            old = {(habit, date): done for habit, date, done in conn.execute(
+                "SELECT habit, date, done FROM records WHERE username = ?", (user,))}
+        new = SQLiteStorage._rows(data)
+        conn.executemany("DELETE FROM records WHERE username = ? AND habit = ? AND date = ?",
+                         [(user, habit, date) for habit, date in old.keys() - new.keys()])
+        conn.executemany(
+            "INSERT INTO records (username, habit, date, done) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (username, habit, date) DO UPDATE SET done = excluded.done",
+            [(user, habit, date, done) for (habit, date), done in new.items() if old.get((habit, date)) != done])
+        SQLiteStorage._changed(conn, user, rows=len(habits) + len(new))
+
+    def get_habits(self, username=None):
+        """Return the list of habits for the user, in insertion order."""
+        rows = self._connect().execute(
+            "SELECT name, schedule, start_date FROM habits WHERE username = ? ORDER BY position",
+            (self._user(username),))
+        habits = []
+        for name, schedule, start_date in rows:
+            habit = {"name": name, "schedule": schedule}
+            if start_date is not None:
+                habit["start_date"] = start_date
+            habits.append(habit)
+        return habits
+
+    def set_record(self, habit_name, date, done, username=None):
+        """Upsert a single (habit, date) record. Returns the (before, after) stamps around the write."""
+        conn = self._connect()
+        user = self._user(username)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            before = self.stamp(username)
+            updated = conn.execute(
+                "UPDATE records SET done = ? WHERE username = ? AND habit = ? AND date = ?",
+                (int(bool(done)), user, habit_name, date)).rowcount
+            if not updated:
+                conn.execute("INSERT INTO records (username, habit, date, done) VALUES (?, ?, ?, ?)",
+                             (user, habit_name, date, int(bool(done))))
+            self._changed(conn, user, added=0 if updated else 1)
+            after = self.stamp(username)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return before, after
+
+    def load_range(self, start, end, username=None):
+        """Return the user's habits and the records between start and end (inclusive, 'YYYY-MM-DD')."""
+        data = {"habits": self.get_habits(username), "records": {}}
+        for habit, date, done in self._connect().execute(
+                "SELECT habit, date, done FROM records WHERE username = ? AND date BETWEEN ? AND ?",
+                (self._user(username), start, end)):
+            data["records"].setdefault(habit, {})[date] = bool(done)
+        return data
+
+BACKENDS = {
+    JSONStorage.name: JSONStorage,
+    SQLiteStorage.name: SQLiteStorage,
+}
+
+_storage = None
+_storage_lock = threading.Lock()
+
+def create_json_storage():
+    """Create the JSON backend, with the mark journal and its compactor unless HABIT_JOURNAL=0."""
+    if os.getenv("HABIT_JOURNAL", "1") == "0":
+        return JSONStorage()
+    # Journals left behind by a crash are replayed on every read; the user's next
+    # mark or the maintenance pass (maintenance.py) compacts them, so workers do
+    # not scan every user directory at start-up.
+    storage = JSONStorage(journal=True)
+    storage.compactor = journal.JournalCompactor(
+        storage,
+        max_bytes=int(os.getenv("HABIT_JOURNAL_MAX_BYTES", 64 * 1024)),
+        max_age=float(os.getenv("HABIT_JOURNAL_MAX_AGE", 300)))
+    storage.compactor.start()
+    return storage
+
+def get_storage():
+    """Return the process-wide storage backend selected by the HABIT_STORAGE env var (json or sqlite).
+
+    The JSON backend is wrapped in a CachedStorage bounded by HABIT_CACHE_MAX_BYTES (0 disables it):
+    its reads parse the whole document anyway. SQLite is not, so agenda and calendar reads keep
+    using its indexed range queries instead of a cached whole document.
+    """
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                kind = os.getenv("HABIT_STORAGE", JSONStorage.name).lower()
+                if kind not in BACKENDS:
+                    raise ValueError(f"Unknown HABIT_STORAGE backend: {kind}")
+                if kind == JSONStorage.name:
+                    storage = create_json_storage()
+                else:
+                    storage = BACKENDS[kind]()
+                cache_bytes = int(os.getenv("HABIT_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+                if kind == JSONStorage.name and cache_bytes > 0:
+                    storage = CachedStorage(storage, DataCache(cache_bytes))
+                _storage = storage
+    return _storage
+
+def set_storage(storage):
+    """Replace the process-wide storage backend (used by the migrator and for testing)."""
+    global _storage
+    _storage = storage
+
+def migrate_json_to_sqlite(root=None, db_path=None):
+    """Copy every user's data.json (and the global habits_data.json) into a SQLite database.
+
+    The JSON files are left in place, so the migration can be re-run safely.
+    Returns the list of migrated usernames (None for the global data set).
+    """
+    target = SQLiteStorage(db_path)
+    migrated = []
+
+    def copy(path, username):
+        with open(path, "r") as f:
+            data = json.load(f)
+        decode_records(data["records"])
+        journal.replay(journal.journal_path(path), data)
+        target.save(data, username)
+        migrated.append(username)
+
+    for username, user_dir in iter_users(root):
+        path = os.path.join(user_dir, "data.json")
+        if os.path.exists(path):
+            copy(path, username)
+    if os.path.exists(get_data_file(None)):
+        copy(get_data_file(None), None)
+    return migrated
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Habit tracker storage tools")
+    parser.add_argument("command", choices=["migrate"], help="migrate: copy JSON user data into SQLite")
+    parser.add_argument("--root", default=None, help="directory holding per-user data (defaults to HABIT_DATA_ROOT)")
+    parser.add_argument("--db", default=None, help="SQLite database path (defaults to HABIT_DB_PATH)")
+    args = parser.parse_args()
+    users = migrate_json_to_sqlite(args.root, args.db)
+    print(f"Migrated {len(users)} data set(s) to SQLite.")
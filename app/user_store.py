@@ -0,0 +1,196 @@
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from locking import file_lock
+from metrics import record_read, record_write
+
+# User directory: an append-only users.ndjson file (one JSON record per line,
+# later lines win) mirrored into an in-memory dict for O(1) lookups.
+# Registrations append a single line instead of rewriting the whole file, and
+# every worker process picks up other workers' appends by reading only the
+# bytes added since its last refresh.
+#
+# Passwords are hashed with scrypt and a per-user salt. Records from the old
+# users.json (unsalted SHA-256) are imported once and upgraded to scrypt the
+# next time that user logs in.
+
+USERS_FILE = os.getenv("HABIT_USERS_FILE", "users.ndjson")
+LEGACY_USERS_FILE = "users.json"
+
+SCRYPT_N = int(os.getenv("HABIT_SCRYPT_N", 2 ** 14))
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+def hash_password(password, n=None, salt=None):
+    """Return an encoded 'scrypt$n$r$p$salt$hash' string for the password."""
+    n = n or SCRYPT_N
+    salt = salt or os.urandom(16)
+    digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=SCRYPT_R, p=SCRYPT_P,
+                            maxmem=256 * n * SCRYPT_R, dklen=32)
+    return f"scrypt${n}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${digest.hex()}"
+
+def check_password(password, encoded):
+    """Return True if the password matches an encoded hash (scrypt or legacy unsalted SHA-256)."""
+    if not encoded.startswith("scrypt$"):
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, encoded)
+    _, n, r, p, salt, digest = encoded.split("$")
+    candidate = hashlib.scrypt(password.encode(), salt=bytes.fromhex(salt), n=int(n), r=int(r), p=int(p),
+                               maxmem=256 * int(n) * int(r), dklen=len(digest) // 2)
+    return hmac.compare_digest(candidate.hex(), digest)
+
+def dummy_check(password):
+    """Run one scrypt check at the configured cost against a fixed salt, so an unknown username costs as much as a wrong password."""
+    check_password(password, f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${'00' * 16}${'00' * 32}")
+    return False
+
+def needs_rehash(encoded):
+    """Return True if the hash is legacy or uses different cost parameters than configured."""
+    return not encoded.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+
+class UserStore:
+    """Username -> user record index backed by an append-only NDJSON file."""
+
+    def __init__(self, path=USERS_FILE, legacy_path=LEGACY_USERS_FILE):
+        self.path = path
+        self.legacy_path = legacy_path
+        self._users = {}
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        """Read any records appended (by this or another process) since the last refresh."""
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return
+        if size < self._offset:
+            # The file was replaced (e.g. restored from a backup): start over.
+            self._users, self._offset = {}, 0
+        if size == self._offset:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            chunk = f.read(size - self._offset)
+        record_read(self.path, len(chunk))
+        # Only consume complete lines; a partial last line is picked up next time.
+        end = chunk.rfind(b"\n") + 1
+        for line in chunk[:end].splitlines():
+            if line.strip():
+                record = json.loads(line)
+                self._users[record["username"]] = record
+        self._offset += end
+
+    def _append(self, record):
+        line = json.dumps(record) + "\n"
+        with open(self.path, "a") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        record_write(self.path, len(line))
+
+    def get(self, username):
+        """Return the stored record for username, or None."""
+        with self._lock:
+            self._refresh()
+            return self._users.get(username)
+
+    def exists(self, username):
+        """Return True if the username is taken."""
+        return self.get(username) is not None
+
+    def register(self, username, password):
+        """Create a user. Returns False if the username already exists."""
+        encoded = hash_password(password)
+        with file_lock(self.path), self._lock:
+            self._refresh()
+            if username in self._users:
+                return False
+            record = {"username": username, "password": encoded}
+            self._append(record)
+            self._users[username] = record
+            return True
+
+    def verify(self, username, password):
+        """Return True if the credentials are valid. Legacy or outdated hashes are upgraded on success."""
+        record = self.get(username)
+        if record is None:
+            return dummy_check(password)
+        if not check_password(password, record["password"]):
+            return False
+        if needs_rehash(record["password"]):
+            upgraded = dict(record, password=hash_password(password))
+            with file_lock(self.path), self._lock:
+                self._append(upgraded)
+                self._users[username] = upgraded
+        return True
+
+    def migrate(self):
+        """Import the legacy users.json list into the NDJSON file (once). Returns the number of users imported."""
+        with file_lock(self.path):
+            if os.path.exists(self.path) or not os.path.exists(self.legacy_path):
+                return 0
+            with open(self.legacy_path, "r") as f:
+                users = json.load(f)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                for user in users:
+                    f.write(json.dumps({"username": user["username"], "password": user["password"]}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            return len(users)
+
+def benchmark_kdf(budget_ms=50.0, samples=20, candidates=(2 ** 12, 2 ** 13, 2 ** 14, 2 ** 15, 2 ** 16)):
+    """Time check_password for each scrypt cost and return (recommended n, {n: p99 ms}).
+
+    The recommendation is the highest cost whose p99 stays within budget_ms.
+    """
+    results = {}
+    recommended = candidates[0]
+    for n in candidates:
+        encoded = hash_password("benchmark-password", n=n)
+        timings = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            check_password("benchmark-password", encoded)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        results[n] = round(p99, 2)
+        if p99 <= budget_ms:
+            recommended = n
+    return recommended, results
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_user_store():
+    """Return the process-wide UserStore, importing a legacy users.json on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = UserStore()
+                store.migrate()
+                _store = store
+    return _store
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Habit tracker user store tools")
+    parser.add_argument("command", choices=["migrate", "bench"],
+                        help="migrate: import users.json; bench: time scrypt costs against a login budget")
+    parser.add_argument("--budget-ms", type=float, default=50.0, help="p99 budget for one password check")
+    args = parser.parse_args()
+    if args.command == "migrate":
+        print(f"Imported {UserStore().migrate()} user(s) into {USERS_FILE}.")
+    else:
+        n, timings = benchmark_kdf(args.budget_ms)
+        for cost, p99 in timings.items():
+            print(f"n={cost}: p99 {p99} ms")
+        print(f"Recommended HABIT_SCRYPT_N={n} for a {args.budget_ms} ms budget.")
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import threading
+from locking import atomic_write_json, file_lock
+from metrics import record_read
+from layout import get_user_dir
+
+# Per-user data version stamps for HTTP caching.
+# Every write to a user's habits/records (habit_data) or chat history bumps a
+# counter in the user's version.json (see layout.py). Read endpoints turn the
+# counters into strong ETags, so a conditional GET is answered with a stat()
+# of this small file instead of loading the user's data.
+#
+# The file also holds a random epoch chosen when it is created, so ETags
+# handed out before the file was deleted or restored never match again.
+# Reads never create the file: until the user's first write there is no
+# version to validate against, and etag() returns None (serve uncached).
+# Counters live on disk (not in memory) so that every worker process sees the
+# same version; parsed contents are cached per process by inode/mtime/size.
+
+KINDS = ("data", "chat")
+
+# Returned by get() while the user has no version file yet.
+MISSING = {"epoch": "", "data": 0, "chat": 0}
+
+def get_version_file(username):
+    """Return the path of the user's version file."""
+    return os.path.join(get_user_dir(username), "version.json") if username else "version.json"
+
+class VersionStore:
+    """Reads and bumps the per-user version counters."""
+
+    def __init__(self):
+        self._cache = {}  # username -> (file stamp, versions)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _file_stamp(path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _read(self, path):
+        try:
+            with open(path, "r") as f:
+                text = f.read()
+            record_read(path, len(text))
+            return json.loads(text)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def get(self, username):
+        """Return the user's {"epoch", "data", "chat"} versions, or MISSING if they have no version file."""
+        path = get_version_file(username)
+        stamp = self._file_stamp(path)
+        with self._lock:
+            cached = self._cache.get(username)
+            if cached is not None and stamp is not None and cached[0] == stamp:
+                return cached[1]
+        versions = self._read(path) if stamp is not None else None
+        if versions is None:
+            return MISSING
+        with self._lock:
+            self._cache[username] = (stamp, versions)
+        return versions
+
+    def bump(self, username, kind="data"):
+        """Increment the counter for kind ("data" or "chat"), creating the file if needed. Returns the new versions."""
+        path = get_version_file(username)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with file_lock(path):
+            versions = self._read(path)
+            if versions is None:
+                versions = {"epoch": os.urandom(4).hex()}
+                versions.update({k: 0 for k in KINDS})
+            versions[kind] = versions.get(kind, 0) + 1
+            # Durable: a bump lost in a crash would hand the same counter (and
+            # so the same ETag) out again for different content.
+            atomic_write_json(path, versions)
+            stamp = self._file_stamp(path)
+        with self._lock:
+            self._cache[username] = (stamp, versions)
+        return versions
+
+    def etag(self, username, kinds, *extra):
+        """Return a strong ETag (unquoted) for the user's current versions of kinds plus any extra request inputs.
+
+        Returns None while the user has no version file.
+        """
+        versions = self.get(username)
+        if not versions["epoch"]:
+            return None
+        parts = [str(username), versions["epoch"]] + [str(versions.get(k, 0)) for k in kinds] + [str(e) for e in extra]
+        return hashlib.sha1("\x1f".join(parts).encode()).hexdigest()[:20]
+
+_store = VersionStore()
+
+def get_versions():
+    """Return the process-wide VersionStore."""
+    return _store
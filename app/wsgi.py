@@ -0,0 +1,7 @@
+from app_flask import create_app
+
+# WSGI entry point for production servers:
+#   gunicorn -c app/gunicorn.conf.py wsgi:app
+# Each worker process imports this module and builds its own app.
+
+app = create_app()
@@ -0,0 +1,15 @@
+import os
+import sys
+import pytest
+
+# The app modules import each other by their bare names (see app/wsgi.py), so put app/ on the path.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "app"))
+
+import layout
+
+@pytest.fixture
+def data_root(tmp_path, monkeypatch):
+    """Run the test in an empty directory: user_data/ and the global data files are created there."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(layout, "_resolved", {})
+    return tmp_path
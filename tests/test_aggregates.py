@@ -0,0 +1,138 @@
+import random
+import threading
+from datetime import date, timedelta
+import pytest
+import habit_data
+import storage
+from aggregates import AggregateStore, HabitAggregate, UserAggregates
+from cache import CachedStorage, DataCache
+from storage import JSONStorage, SQLiteStorage
+
+USER = "alice"
+TODAY = date(2026, 3, 18)
+
+@pytest.mark.parametrize("schedule", ["Daily", "Bi-daily", "Weekly", "Monthly", "Every 3 days", "Weekdays: Mon, Thu"])
+def test_incremental_streaks_match_full_recompute(schedule):
+    rng = random.Random(schedule)
+    start = TODAY - timedelta(days=90)
+    habit = {"name": "Read", "schedule": schedule, "start_date": start.isoformat()}
+    aggregate = HabitAggregate(habit, {})
+    aggregate.compute_stats(TODAY)
+    for _ in range(300):
+        day = start + timedelta(days=rng.randrange(-2, 93))
+        aggregate.mark(day, rng.random() < 0.7)
+        fresh = HabitAggregate(habit, aggregate.done)
+        fresh.compute_stats(TODAY)
+        assert aggregate.stats == fresh.stats, day
+
+def test_marking_today_extends_current_streak():
+    habit = {"name": "Read", "schedule": "Daily", "start_date": (TODAY - timedelta(days=3)).isoformat()}
+    aggregate = HabitAggregate(habit, {(TODAY - timedelta(days=d)).isoformat(): True for d in (1, 2)})
+    aggregate.compute_stats(TODAY)
+    assert (aggregate.stats["current_streak"], aggregate.stats["scheduled"]) == (2, 3)  # today is still open
+    aggregate.mark(TODAY, True)
+    assert (aggregate.stats["current_streak"], aggregate.stats["longest_streak"], aggregate.stats["scheduled"]) == (3, 3, 4)
+    aggregate.mark(TODAY - timedelta(days=1), False)
+    assert (aggregate.stats["current_streak"], aggregate.stats["longest_streak"]) == (1, 1)
+
+def test_far_future_months_are_not_kept():
+    data = {"habits": [{"name": "Read", "schedule": "Weekly", "start_date": "2026-01-05"}], "records": {}}
+    aggregates = UserAggregates(data, TODAY)
+    hi, kept = aggregates.hi, len(aggregates.scheduled)
+    counts = aggregates.day_counts(date(9999, 12, 1), date(9999, 12, 31))
+    assert [day.day for day, scheduled, _ in counts if scheduled] == [6, 13, 20, 27]
+    assert (aggregates.hi, len(aggregates.scheduled)) == (hi, kept)
+
+@pytest.mark.parametrize("kind", ["json", "sqlite"])
+def test_write_from_another_process_drops_cached_entry(data_root, monkeypatch, kind):
+    backend = JSONStorage(journal=True) if kind == "json" else SQLiteStorage(str(data_root / "habits.db"))
+    monkeypatch.setattr(storage, "_storage", CachedStorage(backend, DataCache()))
+    store = AggregateStore()
+    monkeypatch.setattr(habit_data, "get_aggregates", lambda: store)
+    today = date.today()
+    habit_data.add_habit("Read", "Daily", (today - timedelta(days=5)).isoformat(), USER)
+    assert store.habit_stats(USER)[0]["done"] == 0
+    backend.set_record("Read", (today - timedelta(days=1)).isoformat(), True, USER)  # not seen by this process
+    habit_data.mark_habit("Read", (today - timedelta(days=2)).isoformat(), True, USER)
+    assert store.habit_stats(USER)[0]["done"] == 2
+    assert store.verify(USER) == []
+
+@pytest.mark.parametrize("kind", ["json", "sqlite"])
+def test_write_from_another_process_after_ours_drops_cached_entry(data_root, monkeypatch, kind):
+    backend = JSONStorage(journal=True) if kind == "json" else SQLiteStorage(str(data_root / "habits.db"))
+    cached = CachedStorage(backend, DataCache())
+    monkeypatch.setattr(storage, "_storage", cached)
+    store = AggregateStore()
+    monkeypatch.setattr(habit_data, "get_aggregates", lambda: store)
+    today = date.today()
+    habit_data.add_habit("Read", "Daily", (today - timedelta(days=5)).isoformat(), USER)
+    store.habit_stats(USER)
+    ours = (today - timedelta(days=2)).isoformat()
+    stamps = cached.set_record("Read", ours, True, USER)
+    backend.set_record("Read", (today - timedelta(days=1)).isoformat(), True, USER)  # another process
+    store.record_mark(USER, "Read", ours, True, stamps)
+    assert USER not in store._entries
+    assert store.habit_stats(USER)[0]["done"] == 2
+    assert store.verify(USER) == []
+
+def test_backend_without_stamp_is_not_cached(data_root, monkeypatch):
+    class Unstamped:
+        def load(self, username=None):
+            return {"habits": [{"name": "Read", "schedule": "Daily", "start_date": "2026-01-01"}], "records": {}}
+    monkeypatch.setattr(storage, "_storage", Unstamped())
+    store = AggregateStore()
+    assert store.habit_stats(USER)[0]["name"] == "Read"
+    assert USER not in store._entries
+
+@pytest.mark.parametrize("query", ["year=10000&month=1", "year=0&month=1", "year=2026&month=13", "year=x"])
+def test_calendar_rejects_out_of_range_months(data_root, monkeypatch, query):
+    import user_store
+    from app_flask import create_app
+    monkeypatch.setattr(user_store, "_store", None)
+    monkeypatch.setattr(storage, "_storage", JSONStorage())
+    client = create_app().test_client()
+    client.post("/register", data={"username": USER, "password": "correct horse"})
+    assert client.get("/calendar?" + query).status_code == 400
+    assert client.get("/calendar?year=9999&month=12").status_code == 200
+
+def test_rebuild_does_not_block_other_users(data_root, monkeypatch):
+    backend = JSONStorage()
+    backend.save({"habits": [{"name": "Read", "schedule": "Daily", "start_date": "2026-01-01"}], "records": {}}, "slow")
+    backend.save({"habits": [{"name": "Run", "schedule": "Daily", "start_date": "2026-01-01"}], "records": {}}, "fast")
+    loading, release = threading.Event(), threading.Event()
+    class SlowLoads(JSONStorage):
+        def load(self, username=None):
+            if username == "slow":
+                loading.set()
+                release.wait(5)
+            return super().load(username)
+    monkeypatch.setattr(storage, "_storage", SlowLoads())
+    store = AggregateStore()
+    slow = threading.Thread(target=store.habit_stats, args=("slow",))
+    slow.start()
+    assert loading.wait(5)
+    try:
+        assert store.habit_stats("fast")[0]["name"] == "Run"  # would wait for the slow load under one store lock
+        assert slow.is_alive()
+    finally:
+        release.set()
+        slow.join()
+
+def test_concurrent_marks_and_reads_stay_consistent(data_root, monkeypatch):
+    monkeypatch.setattr(storage, "_storage", CachedStorage(JSONStorage(journal=True), DataCache()))
+    store = AggregateStore()
+    monkeypatch.setattr(habit_data, "get_aggregates", lambda: store)
+    today = date.today()
+    habit_data.add_habit("Read", "Daily", (today - timedelta(days=40)).isoformat(), USER)
+    def marks(seed):
+        rng = random.Random(seed)
+        for _ in range(40):
+            day = (today - timedelta(days=rng.randrange(40))).isoformat()
+            habit_data.mark_habit("Read", day, rng.random() < 0.6, USER)
+            store.habit_stats(USER)
+    threads = [threading.Thread(target=marks, args=(seed,)) for seed in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.verify(USER) == []
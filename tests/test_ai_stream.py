@@ -0,0 +1,71 @@
+import pytest
+import app_flask
+import storage
+import user_store
+import versions
+from chat_log import get_chat_log
+from storage import JSONStorage
+
+USER = "alice"
+
+class FakeTurn:
+    """Stands in for ai_pipeline.ChatTurn: streams fixed chunks and counts finish() calls."""
+
+    def __init__(self, chunks, fail=False):
+        self.chunks = chunks
+        self.fail = fail
+        self.chat_history = [{"sender": "user", "text": "plan my week"}]
+        self.finished = []
+
+    def stream_answer(self):
+        for chunk in self.chunks:
+            yield chunk
+        if self.fail:
+            raise RuntimeError("model went away")
+
+    def finish(self, answer):
+        self.finished.append(answer)
+        self.chat_history.append({"sender": "ai", "text": answer})
+        return []
+
+@pytest.fixture
+def client(data_root, monkeypatch):
+    monkeypatch.setattr(storage, "_storage", JSONStorage(journal=True))
+    monkeypatch.setattr(user_store, "_store", None)
+    monkeypatch.setattr(versions, "_store", versions.VersionStore())
+    client = app_flask.create_app().test_client()
+    client.post("/register", data={"username": USER, "password": "correct horse"})
+    return client
+
+def stream(client, monkeypatch, turn):
+    monkeypatch.setattr(app_flask, "start_chat_turn", lambda username, message: (turn, 0))
+    return client.post("/ai_planning/stream", json={"message": "plan my week"}, buffered=False)
+
+def saved():
+    return [m["text"] for m in get_chat_log(USER).recent(10)]
+
+def test_stream_finishes_the_turn_once(client, monkeypatch):
+    turn = FakeTurn(["Run ", "daily."])
+    response = stream(client, monkeypatch, turn)
+    body = b"".join(response.response).decode()
+    response.close()
+    assert "event: done" in body
+    assert turn.finished == ["Run daily."]
+    assert saved() == ["plan my week", "Run daily."]
+
+def test_disconnect_mid_answer_still_finishes_the_turn_once(client, monkeypatch):
+    turn = FakeTurn(["Run ", "daily", " and swim."])
+    response = stream(client, monkeypatch, turn)
+    events = iter(response.response)
+    next(events)  # the first token
+    response.close()  # the client goes away
+    assert turn.finished == ["Run "]
+    assert saved() == ["plan my week", "Run "]
+
+def test_model_error_still_finishes_the_turn_once(client, monkeypatch):
+    turn = FakeTurn(["Run "], fail=True)
+    response = stream(client, monkeypatch, turn)
+    body = b"".join(response.response).decode()
+    response.close()
+    assert "event: error" in body
+    assert turn.finished == ["Run "]
@@ -0,0 +1,125 @@
+import pytest
+import aggregates
+import habit_data
+import storage
+from storage import JSONStorage
+
+USER = "alice"
+
+@pytest.fixture(autouse=True)
+def backend(data_root, monkeypatch):
+    backend = JSONStorage(journal=True)
+    monkeypatch.setattr(storage, "_storage", backend)
+    monkeypatch.setattr(aggregates, "_store", aggregates.AggregateStore())
+    return backend
+
+def names():
+    return [h["name"] for h in habit_data.get_habits(USER)]
+
+@pytest.mark.parametrize("op, error", [
+    ({"action": "add", "name": "Run", "schedule": "Daily", "start_date": "next monday"}, "Invalid start date"),
+    ({"action": "add", "name": "Run", "schedule": "Daily", "start_date": "2026-02-30"}, "Invalid start date"),
+    ({"action": "add", "name": "Run", "schedule": "Daily", "start_date": 20260101}, "Invalid start date"),
+    ({"action": "add", "name": "Run", "schedule": "whenever I feel like it"}, "Unknown schedule"),
+    ({"action": "add", "name": 7, "schedule": "Daily"}, "Invalid name"),
+    ({"action": "edit", "name": "Read", "start_date": "tomorrow"}, "Invalid start date"),
+    ({"action": "edit", "name": "Read", "schedule": ["Daily"]}, "Unknown schedule"),
+])
+def test_invalid_fields_are_rejected_before_writing(op, error):
+    habit_data.add_habit("Read", "Daily", "2026-01-01", USER)
+    before = habit_data.get_habits(USER)
+    results = habit_data.apply_batch([op], USER)
+    assert not results[0]["success"]
+    assert results[0]["message"].startswith(error)
+    assert habit_data.get_habits(USER) == before
+    # Reads of the user's data keep working.
+    assert habit_data.get_agenda("2026-01-05", USER) == [("Read", False)]
+    assert habit_data.get_habit_stats(USER)[0]["name"] == "Read"
+
+def test_invalid_op_does_not_stop_the_rest_of_the_batch():
+    results = habit_data.apply_batch([
+        {"action": "add", "name": "Run", "schedule": "Daily", "start_date": "next monday"},
+        {"action": "add", "name": "Swim", "schedule": "Every 3 days", "start_date": "2026-01-01"},
+        {"action": "remove", "name": 3},
+    ], USER)
+    assert [r["success"] for r in results] == [False, True, False]
+    assert names() == ["Swim"]
+
+def test_all_or_nothing_cancels_on_invalid_field():
+    results = habit_data.apply_batch([
+        {"action": "add", "name": "Swim", "schedule": "Daily"},
+        {"action": "add", "name": "Run", "schedule": "Daily", "start_date": "soon"},
+    ], USER, all_or_nothing=True)
+    assert [r["success"] for r in results] == [True, False]
+    assert names() == []
+
+def test_rename_onto_existing_habit_is_refused():
+    habit_data.add_habit("Read", "Daily", "2026-01-01", USER)
+    habit_data.add_habit("Run", "Daily", "2026-01-01", USER)
+    habit_data.mark_habit("Read", "2026-01-02", True, USER)
+    habit_data.mark_habit("Run", "2026-01-03", True, USER)
+    assert habit_data.edit_habit("Read", "Run", "Weekly", "2026-01-01", USER) is False
+    results = habit_data.apply_batch([{"action": "edit", "old_name": "read", "name": "RUN"}], USER)
+    assert not results[0]["success"]
+    data = storage.get_storage().load(USER)
+    assert [(h["name"], h["schedule"]) for h in data["habits"]] == [("Read", "Daily"), ("Run", "Daily")]
+    assert (list(data["records"]["Read"]), list(data["records"]["Run"])) == (["2026-01-02"], ["2026-01-03"])
+    assert habit_data.edit_habit("Read", "Reading", "Weekly", "2026-01-01", USER) is not False
+    assert names() == ["Reading", "Run"]
+
+@pytest.fixture
+def client(monkeypatch):
+    import user_store
+    import versions
+    from app_flask import create_app
+    monkeypatch.setattr(user_store, "_store", None)
+    monkeypatch.setattr(versions, "_store", versions.VersionStore())
+    client = create_app().test_client()
+    client.post("/register", data={"username": USER, "password": "correct horse"})
+    return client
+
+def test_edit_route_rejects_invalid_start_date(client):
+    habit_data.add_habit("Read", "Daily", "2026-01-01", USER)
+    response = client.post("/edit_habit", json={"oldName": "Read", "name": "Read", "schedule": "Daily",
+                                                "start_date": "next monday"})
+    assert response.status_code == 400
+    assert habit_data.get_habits(USER)[0]["start_date"] == "2026-01-01"
+    assert client.get("/stats").status_code == 200
+
+def test_batch_route_reports_each_operation(client):
+    import versions
+    habit_data.add_habit("Read", "Daily", "2026-01-01", USER)
+    before = versions.get_versions().get(USER)["data"]
+    response = client.post("/habits/batch", json={"operations": [
+        {"action": "add", "name": "Swim", "schedule": "Every 3 days", "start_date": "2026-01-01"},
+        {"action": "add", "name": "swim", "schedule": "Daily"},
+        {"action": "edit", "old_name": "read", "name": "Reading", "schedule": "Weekly"},
+        {"action": "remove", "name": "Yoga"},
+        {"action": "fly", "name": "Read"},
+    ]})
+    body = response.get_json()
+    assert response.status_code == 200 and body["success"]
+    assert [(r["action"], r["success"]) for r in body["results"]] == [
+        ("add", True), ("add", False), ("edit", True), ("remove", False), ("fly", False)]
+    assert body["results"][1]["message"] == "Habit 'swim' already exists."
+    assert body["results"][3]["message"] == "No habit found matching 'Yoga' for removal."
+    assert body["results"][4]["message"] == "Unknown action 'fly'."
+    assert names() == ["Reading", "Swim"]
+    # One write for the whole batch.
+    assert versions.get_versions().get(USER)["data"] == before + 1
+
+def test_batch_route_all_or_nothing_writes_nothing(client):
+    response = client.post("/habits/batch", json={"all_or_nothing": True, "operations": [
+        {"action": "add", "name": "Swim", "schedule": "Daily"},
+        {"action": "add", "name": "Run", "schedule": "whenever"},
+    ]})
+    body = response.get_json()
+    assert not body["success"]
+    assert [r["success"] for r in body["results"]] == [True, False]
+    assert names() == []
+
+@pytest.mark.parametrize("payload", [{"operations": "add Swim"}, {"operations": [["add", "Swim"]]}, ["add"]])
+def test_batch_route_rejects_malformed_bodies(client, payload):
+    response = client.post("/habits/batch", json=payload)
+    assert response.status_code == 400
+    assert names() == []
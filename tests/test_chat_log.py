@@ -0,0 +1,88 @@
+import os
+import chat_log
+from chat_log import ChatLog
+
+def messages(first, count):
+    return [{"sender": "user" if i % 2 else "ai", "text": f"message {i}"} for i in range(first, first + count)]
+
+def ids(page):
+    return [m["id"] for m in page]
+
+def all_pages(log, limit):
+    """Return every page from the newest back, following the cursors."""
+    pages, before = [], None
+    while True:
+        page, before = log.page(before, limit)
+        pages.append(page)
+        if before is None:
+            return pages
+
+def test_pages_cross_segment_boundaries(tmp_path):
+    log = ChatLog(str(tmp_path / "chat"), segment_messages=5, max_segments=10)
+    log.append(messages(0, 12))
+    assert len(os.listdir(log.directory)) == 3 + 1  # segments 0, 5, 10 and the lock file
+    pages = all_pages(log, 4)
+    assert [ids(p) for p in pages] == [[8, 9, 10, 11], [4, 5, 6, 7], [0, 1, 2, 3]]
+    assert [m["text"] for m in pages[1]] == [f"message {i}" for i in range(4, 8)]
+    assert log.recent(3) == [dict(m, id=i) for i, m in zip(range(9, 12), messages(9, 3))]
+
+def test_rotation_drops_oldest_segments(tmp_path):
+    log = ChatLog(str(tmp_path / "chat"), segment_messages=5, max_segments=3)
+    for first in range(0, 27, 3):
+        log.append(messages(first, 3))
+    # 27 messages: segments 15, 20 and 25 are kept.
+    pages = all_pages(log, 4)
+    assert [i for page in reversed(pages) for i in ids(page)] == list(range(15, 27))
+    assert pages[-1][-1]["text"] == f"message {ids(pages[-1])[-1]}"
+
+def test_cursor_survives_rotation(tmp_path):
+    log = ChatLog(str(tmp_path / "chat"), segment_messages=5, max_segments=3)
+    log.append(messages(0, 15))
+    page, before = log.page(None, 4)
+    assert ids(page) == [11, 12, 13, 14] and before == 11
+    log.append(messages(15, 5))  # starts segment 15 and prunes segment 0
+    page, before = log.page(before, 4)
+    assert ids(page) == [7, 8, 9, 10]
+    page, before = log.page(before, 4)
+    assert ids(page) == [5, 6] and before is None
+
+def test_clear_keeps_ids_increasing(tmp_path):
+    log = ChatLog(str(tmp_path / "chat"), segment_messages=5, max_segments=3)
+    log.append(messages(0, 7))
+    log.clear()
+    assert log.page(None, 10) == ([], None)
+    log.append(messages(7, 2))
+    page, before = log.page(None, 10)
+    assert ids(page) == [7, 8] and before is None
+
+def test_torn_line_is_dropped_before_append(tmp_path):
+    log = ChatLog(str(tmp_path / "chat"), segment_messages=5, max_segments=3)
+    log.append(messages(0, 2))
+    with open(log._segment_path(0), "a") as f:
+        f.write('{"sender": "ai", "te')
+    assert ids(log.recent(10)) == [0, 1]
+    log.append(messages(2, 1))
+    assert [m["text"] for m in log.recent(10)] == ["message 0", "message 1", "message 2"]
+
+def test_index_reads_only_appended_bytes(tmp_path):
+    log = ChatLog(str(tmp_path / "chat"), segment_messages=100, max_segments=3)
+    log.append(messages(0, 10))
+    log.recent(1)
+    indexed = log._offsets[log._segment_path(0)][1]
+    log.append(messages(10, 1))
+    # A second reader (another process) sees the new message too.
+    assert ids(ChatLog(log.directory).recent(1)) == [10]
+    assert ids(log.recent(1)) == [10]
+    assert log._offsets[log._segment_path(0)][1] > indexed
+
+def test_log_cache_is_bounded(data_root, monkeypatch):
+    monkeypatch.setattr(chat_log, "_logs", type(chat_log._logs)())
+    monkeypatch.setattr(chat_log, "MAX_USERS", 2)
+    first = chat_log.get_chat_log("alice")
+    first.append(messages(0, 1))
+    chat_log.get_chat_log("bob")
+    chat_log.get_chat_log("carol")
+    assert list(chat_log._logs) == ["bob", "carol"]
+    again = chat_log.get_chat_log("alice")
+    assert again is not first
+    assert ids(again.recent(5)) == [0]
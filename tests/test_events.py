@@ -0,0 +1,80 @@
+import json
+import pytest
+import events
+import versions
+from events import EventBus
+
+USER = "alice"
+
+@pytest.fixture(autouse=True)
+def quick_streams(data_root, monkeypatch):
+    monkeypatch.setattr(events, "HOLD", 0)
+    monkeypatch.setattr(versions, "_store", versions.VersionStore())
+
+def publish(bus, event="mark", payload=None):
+    bus.publish(USER, event, payload or {}, versions.get_versions().bump(USER))
+
+def read(bus, last_event_id=None):
+    """Run one stream to its end and return its (event, id, data) tuples and its retry hint."""
+    parsed, retry = [], None
+    for text in bus.stream(USER, last_event_id):
+        fields = dict(line.split(": ", 1) for line in text.strip().splitlines() if not line.startswith(":"))
+        if "retry" in fields:
+            retry = int(fields["retry"])
+        elif fields:
+            parsed.append((fields["event"], fields.get("id"), json.loads(fields["data"])))
+    return parsed, retry
+
+def test_new_stream_says_hello_and_replays_from_its_id():
+    bus = EventBus(buffer=8, max_streams=1)
+    (hello, ), _ = read(bus)
+    assert hello[0] == "hello"
+    publish(bus, "mark", {"habit": "Read", "date": "2026-01-02", "done": True})
+    publish(bus, "habits")
+    replayed, _ = read(bus, hello[1])
+    assert [(e, data) for e, _, data in replayed] == [
+        ("mark", {"habit": "Read", "date": "2026-01-02", "done": True}), ("habits", {})]
+    # Reconnecting with the last id replays nothing.
+    assert read(bus, replayed[-1][1])[0] == []
+
+def test_stream_that_fell_behind_the_ring_gets_one_resync():
+    bus = EventBus(buffer=3, max_streams=1)
+    (hello, ), _ = read(bus)
+    for _ in range(5):
+        publish(bus)
+    (resync, ), _ = read(bus, hello[1])
+    assert resync[0] == "resync"
+    assert read(bus, resync[1])[0] == []
+
+def test_evicted_user_gets_a_resync():
+    bus = EventBus(buffer=8, max_streams=1, max_users=1)
+    (hello, ), _ = read(bus)
+    publish(bus)
+    bus.publish("bob", "habits", {}, versions.get_versions().bump("bob"))
+    assert [e for e, _, _ in read(bus, hello[1])[0]] == ["resync"]
+
+def test_writes_seen_only_through_the_version_trigger_a_resync():
+    bus = EventBus(buffer=8, max_streams=1)
+    publish(bus)
+    (hello, ), _ = read(bus)
+    # An id from another worker process: only the data version can be compared.
+    other = f"{bus.pid + 1}-99-" + hello[1].split("-", 2)[2]
+    assert read(bus, other)[0] == []
+    # A write handled by another process bumps the version without an event here.
+    versions.get_versions().bump(USER)
+    assert [e for e, _, _ in read(bus, other)[0]] == ["resync"]
+    assert [e for e, _, _ in read(bus, hello[1])[0]] == ["resync"]
+
+def test_streams_beyond_the_cap_end_at_once():
+    bus = EventBus(buffer=8, max_streams=1)
+    held = bus.stream(USER)
+    assert next(held) == f"retry: {events.HELD_RETRY_MS}\n\n"
+    (hello, ), retry = read(bus)
+    assert retry == events.RETRY_MS and hello[0] == "hello"
+    held.close()  # the client went away: its slot is released
+    assert read(bus)[1] == events.HELD_RETRY_MS
+
+def test_no_cap_holds_every_stream():
+    bus = EventBus(buffer=8, max_streams=None)
+    held = [bus.stream(USER) for _ in range(3)]
+    assert [next(s) for s in held] == [f"retry: {events.HELD_RETRY_MS}\n\n"] * 3
@@ -0,0 +1,74 @@
+import json
+import os
+import pytest
+import journal
+import maintenance
+import storage
+from storage import JSONStorage, get_data_file
+
+USER = "alice"
+
+@pytest.fixture
+def backend(data_root, monkeypatch):
+    backend = JSONStorage(journal=True)
+    monkeypatch.setattr(storage, "_storage", backend)
+    backend.save({"habits": [{"name": "Read", "schedule": "Daily", "start_date": "2024-01-01"}], "records": {}}, USER)
+    return backend
+
+def journal_file(username=USER):
+    return journal.journal_path(get_data_file(username))
+
+def done_days(data, habit="Read"):
+    return sorted(data["records"].get(habit, {}))
+
+def test_marks_are_journaled_and_replayed(backend):
+    backend.set_record("Read", "2024-01-01", True, USER)
+    backend.set_record("Read", "2024-01-02", True, USER)
+    backend.set_record("Read", "2024-01-01", False, USER)
+    with open(get_data_file(USER)) as f:
+        assert json.load(f)["records"] == {}  # the snapshot was not rewritten
+    assert done_days(JSONStorage(journal=True).load(USER)) == ["2024-01-02"]
+
+def test_torn_last_line_is_ignored(backend):
+    backend.set_record("Read", "2024-01-01", True, USER)
+    backend.set_record("Read", "2024-01-02", True, USER)
+    # A crash in the middle of an append leaves half a line behind.
+    with open(journal_file(), "a") as f:
+        f.write('{"habit": "Read", "date": "2024-01-0')
+    assert done_days(JSONStorage(journal=True).load(USER)) == ["2024-01-01", "2024-01-02"]
+
+def test_replay_applies_every_mark_in_order(tmp_path):
+    path = tmp_path / "data.journal"
+    path.write_text("".join(json.dumps(entry) + "\n" for entry in (
+        {"habit": "Read", "date": "2024-01-01", "done": True},
+        {"habit": "Read", "date": "2024-13-01", "done": True},  # invalid date: skipped
+        {"habit": "Run", "date": "2024-01-03", "done": True},
+        {"habit": "Read", "date": "2024-01-01", "done": False},
+    )) + "{not json\n")
+    data = {"habits": [], "records": {}}
+    assert journal.replay(str(path), data) == 3
+    assert done_days(data) == []
+    assert done_days(data, "Run") == ["2024-01-03"]
+    assert journal.replay(str(tmp_path / "missing.journal"), data) == 0
+
+def test_compaction_folds_journal_into_snapshot(backend):
+    backend.set_record("Read", "2024-01-05", True, USER)
+    with open(journal_file(), "a") as f:
+        f.write('{"habit": "Read"')
+    backend.compact(USER)
+    assert not os.path.exists(journal_file())
+    assert done_days(JSONStorage().load(USER)) == ["2024-01-05"]
+
+def test_maintenance_compacts_leftover_journal(backend):
+    # Journals are no longer compacted at start-up; a leftover one is picked up by the maintenance pass.
+    backend.set_record("Read", "2024-01-07", True, USER)
+    report = maintenance.check_user(USER)
+    assert report["compacted"]
+    assert not os.path.exists(journal_file())
+    assert done_days(backend.load(USER)) == ["2024-01-07"]
+
+def test_save_supersedes_journal(backend):
+    backend.set_record("Read", "2024-01-01", True, USER)
+    backend.save({"habits": [], "records": {}}, USER)
+    assert not os.path.exists(journal_file())
+    assert backend.load(USER) == {"habits": [], "records": {}}
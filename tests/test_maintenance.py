@@ -0,0 +1,126 @@
+import io
+import json
+import os
+import pytest
+import aggregates
+import habit_data
+import layout
+import maintenance
+import storage
+import versions
+from storage import JSONStorage
+
+@pytest.fixture(autouse=True)
+def backend(data_root, monkeypatch):
+    backend = JSONStorage(journal=True)
+    monkeypatch.setattr(storage, "_storage", backend)
+    monkeypatch.setattr(aggregates, "_store", aggregates.AggregateStore())
+    monkeypatch.setattr(versions, "_store", versions.VersionStore())
+    return backend
+
+def write_legacy_user(username, data):
+    path = os.path.join(layout.DATA_ROOT, username)
+    os.makedirs(path)
+    with open(os.path.join(path, "data.json"), "w") as f:
+        json.dump(data, f)
+    return path
+
+def habits(username):
+    return [h["name"] for h in habit_data.get_habits(username)]
+
+def test_flat_users_are_read_until_migrated(backend):
+    legacy = write_legacy_user("alice", {"habits": [{"name": "Read", "schedule": "Daily"}],
+                                         "records": {"Read": {"2026-01-02": True}}})
+    assert layout.get_user_dir("alice") == legacy
+    assert habits("alice") == ["Read"]
+    assert layout.migrate() == (["alice"], [])
+    assert not os.path.exists(legacy)
+    assert layout.get_user_dir("alice") == layout.sharded_user_dir("alice")
+    assert dict(backend.load("alice")["records"]["Read"]) == {"2026-01-02": True}
+    assert list(backend.usernames()) == ["alice"]
+    assert layout.migrate() == ([], [])
+
+def test_migrate_leaves_conflicting_users_in_place():
+    legacy = write_legacy_user("alice", {"habits": [], "records": {}})
+    os.makedirs(layout.sharded_user_dir("alice"))
+    assert layout.migrate() == ([], ["alice"])
+    assert os.path.isdir(legacy)
+
+def test_reads_do_not_create_user_directories(backend):
+    assert backend.load("bob") == storage.empty_data()
+    assert habit_data.get_agenda("2026-01-05", "bob") == []
+    assert not os.path.exists(layout.DATA_ROOT)
+
+@pytest.mark.parametrize("username", ["a/b", "..", "shards", "Ünïcode name"])
+def test_any_username_maps_to_one_sharded_directory(username):
+    path = layout.sharded_user_dir(username)
+    shards = os.path.join(layout.DATA_ROOT, layout.SHARDS_DIR)
+    assert os.path.dirname(os.path.dirname(os.path.dirname(path))) == shards
+    habit_data.add_habit("Read", "Daily", "2026-01-01", username)
+    assert layout.get_user_dir(username) == path
+    assert list(layout.iter_users()) == [(username, path)]
+
+def test_export_import_round_trip(backend, data_root, monkeypatch):
+    habit_data.add_habit("Read", "Daily", "2026-01-01", "alice")
+    habit_data.mark_habit("Read", "2026-01-02", True, "alice")
+    habit_data.mark_habit("Read", "2026-01-05", True, "alice")
+    habit_data.add_habit("Swim", "Every 3 days", "2026-01-01", "bob")
+    out = io.StringIO()
+    assert maintenance.export_users(out) == 2
+    lines = out.getvalue().splitlines()
+    assert sorted(json.loads(line)["username"] for line in lines) == ["alice", "bob"]
+
+    restored = data_root / "restored"
+    restored.mkdir()
+    monkeypatch.chdir(restored)
+    monkeypatch.setattr(layout, "_resolved", {})
+    assert habits("alice") == []
+    assert maintenance.import_users(lines) == (2, 0, [])
+    assert habits("alice") == ["Read"] and habits("bob") == ["Swim"]
+    assert dict(backend.load("alice")["records"]["Read"]) == {"2026-01-02": True, "2026-01-05": True}
+
+def test_import_reports_bad_lines_and_skips_existing_users():
+    habit_data.add_habit("Read", "Daily", "2026-01-01", "alice")
+    lines = [
+        json.dumps({"username": "alice", "habits": [{"name": "Run", "schedule": "Daily"}], "records": {}}),
+        "not json",
+        json.dumps({"username": "carol", "habits": "Run", "records": {}}),
+        "",
+        json.dumps({"username": "bob", "habits": [{"name": "Swim", "schedule": "Daily"}],
+                    "records": {"Swim": {"2026-01-03": True}}}),
+    ]
+    imported, skipped, errors = maintenance.import_users(lines, skip_existing=True)
+    assert (imported, skipped) == (1, 1)
+    assert [e.split(":")[0] for e in errors] == ["line 2", "line 3"]
+    assert habits("alice") == ["Read"] and habits("bob") == ["Swim"] and habits("carol") == []
+
+def test_check_user_reports_and_collects_garbage(backend):
+    write_legacy_user("alice", {
+        "habits": [{"name": "Read", "schedule": "Daily"}, {"name": "read", "schedule": "Daily"},
+                   {"name": "Swim", "schedule": "whenever"}, {"name": "Run", "schedule": "Daily"}],
+        "records": {"Read": {"2026-01-02": True}, "Gone": {"2026-01-02": True},
+                    "RUN": {"2026-01-03": True}, "Swim": {"2026-01-02": True, "someday": True}},
+    })
+    report = maintenance.check_user("alice")
+    kinds = sorted(p["kind"] for p in report["problems"])
+    assert kinds == ["case_mismatched_records", "invalid_records", "name_collision", "orphaned_records",
+                     "unknown_schedule"]
+    assert not report["fixed"]
+    assert "Gone" in backend.load("alice")["records"]
+
+    report = maintenance.check_user("alice", fix=True)
+    assert report["fixed"]
+    records = backend.load("alice")["records"]
+    assert sorted(records) == ["RUN", "Read", "Swim"]  # case-mismatched records are kept
+    assert dict(records["Swim"]) == {"2026-01-02": True}
+    kinds = sorted(p["kind"] for p in maintenance.check_user("alice")["problems"])
+    assert kinds == ["case_mismatched_records", "name_collision", "unknown_schedule"]
+
+def test_check_user_compacts_leftover_journals(backend):
+    habit_data.add_habit("Read", "Daily", "2026-01-01", "alice")
+    habit_data.mark_habit("Read", "2026-01-02", True, "alice")
+    assert backend.journal_size("alice")
+    report = maintenance.check_user("alice")
+    assert report["compacted"] and report["problems"] == []
+    assert not backend.journal_size("alice")
+    assert dict(backend.load("alice")["records"]["Read"]) == {"2026-01-02": True}
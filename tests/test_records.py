@@ -0,0 +1,72 @@
+import random
+from datetime import date, timedelta
+import pytest
+from records import HabitRecords, decode_records, encode_records
+
+def random_days(rng, count, first=date(2024, 1, 1), span=800):
+    return [(first + timedelta(days=rng.randrange(span))).isoformat() for _ in range(count)]
+
+def test_matches_plain_dict_under_random_marks():
+    rng = random.Random(1)
+    records, plain = HabitRecords(), {}
+    for day in random_days(rng, 2000):
+        done = rng.random() < 0.6
+        records[day] = done
+        if done:
+            plain[day] = True
+        else:
+            plain.pop(day, None)
+        assert (day in records) == (day in plain)
+    assert dict(records) == plain
+    assert len(records) == len(plain)
+    assert list(records) == sorted(plain)
+
+@pytest.mark.parametrize("seed", range(5))
+def test_encode_decode_round_trip(seed):
+    rng = random.Random(seed)
+    plain = {day: True for day in random_days(rng, rng.randrange(1, 300))}
+    records = HabitRecords.from_dict(plain)
+    decoded = HabitRecords.decode(records.encode())
+    assert dict(decoded) == plain
+    assert len(decoded) == len(plain)
+    assert decoded.encode() == records.encode()
+
+def test_false_days_are_not_stored():
+    records = HabitRecords.from_dict({"2024-03-01": True, "2024-03-02": False})
+    assert dict(records) == {"2024-03-01": True}
+    assert "2024-03-02" not in records
+    with pytest.raises(KeyError):
+        records["2024-03-02"]
+
+def test_growing_before_origin_keeps_days():
+    records = HabitRecords.from_dict({"2024-03-10": True})
+    records["2023-12-25"] = True
+    assert list(records) == ["2023-12-25", "2024-03-10"]
+    assert dict(HabitRecords.decode(records.encode())) == {"2023-12-25": True, "2024-03-10": True}
+
+def test_clearing_every_day_encodes_empty():
+    records = HabitRecords.from_dict({"2024-03-10": True})
+    del records["2024-03-10"]
+    assert len(records) == 0
+    assert records.encode() == ""
+
+def test_done_between_skips_other_days():
+    records = HabitRecords.from_dict({d: True for d in ("2024-01-01", "2024-01-15", "2024-02-01")})
+    assert list(records.done_between(date(2024, 1, 2), date(2024, 1, 31))) == [date(2024, 1, 15)]
+
+def test_invalid_dates():
+    with pytest.raises(ValueError):
+        HabitRecords.from_dict({"2024-02-30": True})
+    assert dict(HabitRecords.from_dict({"2024-02-30": True, "2024-02-28": True}, strict=False)) == {"2024-02-28": True}
+    assert "not a date" not in HabitRecords()
+
+def test_decode_and_encode_records_documents():
+    legacy = {"Read": {"2024-01-01": True, "2024-01-02": False}, "Run": {}, "Bad": {"yesterday": True}}
+    records = decode_records(dict(legacy))
+    assert isinstance(records["Read"], HabitRecords)
+    assert dict(records["Read"]) == {"2024-01-01": True}
+    assert records["Bad"] == {"yesterday": True}  # left for maintenance.py to report
+    encoded = encode_records(records)
+    assert encoded["Run"] == ""
+    assert encoded["Bad"] == {"yesterday": True}
+    assert dict(decode_records(encoded)["Read"]) == {"2024-01-01": True}
@@ -0,0 +1,110 @@
+import threading
+import pytest
+import habit_data
+import storage
+from cache import CachedStorage, DataCache
+from storage import JSONStorage, SQLiteStorage
+
+USER = "alice"
+
+def habit(name):
+    return {"name": name, "schedule": "Daily", "start_date": "2024-01-01"}
+
+def names(data):
+    return [h["name"] for h in data["habits"]]
+
+def interfering(backend, times):
+    """Return a mutate that adds "Mine", letting another writer add a habit during its first `times` calls."""
+    calls = []
+    def mutate(data):
+        calls.append(names(data))
+        if len(calls) <= times:
+            other = backend.load(USER)
+            other["habits"].append(habit(f"Other {len(calls)}"))
+            backend.save(other, USER)
+        data["habits"].append(habit("Mine"))
+        return "added"
+    return mutate, calls
+
+@pytest.fixture(params=["plain", "cached"])
+def backend(request, data_root):
+    backend = JSONStorage(journal=True)
+    if request.param == "cached":
+        backend = CachedStorage(backend, DataCache())
+    backend.save({"habits": [habit("Read")], "records": {}}, USER)
+    return backend
+
+def test_update_retries_when_another_writer_got_in_first(backend):
+    mutate, calls = interfering(backend, 1)
+    assert backend.update(mutate, USER) == "added"
+    assert calls == [["Read"], ["Read", "Other 1"]]
+    assert names(backend.load(USER)) == ["Read", "Other 1", "Mine"]
+
+def test_update_falls_back_to_locked_cycle_under_contention(backend, monkeypatch):
+    json_backend = getattr(backend, "storage", backend)
+    monkeypatch.setattr(json_backend, "MAX_RETRIES", 3)
+    mutate, calls = interfering(backend, 3)
+    assert backend.update(mutate, USER) == "added"
+    assert len(calls) == 4
+    assert names(backend.load(USER)) == ["Read", "Other 1", "Other 2", "Other 3", "Mine"]
+
+def test_update_writes_nothing_when_mutate_returns_false(backend):
+    before = backend.stamp(USER)
+    def mutate(data):
+        data["habits"].clear()
+        return False
+    assert backend.update(mutate, USER) is False
+    assert backend.stamp(USER) == before
+    assert names(backend.load(USER)) == ["Read"]
+
+def test_update_keeps_journaled_marks(backend):
+    backend.set_record("Read", "2024-01-02", True, USER)
+    backend.update(lambda data: data["habits"].append(habit("Run")), USER)
+    data = backend.load(USER)
+    assert names(data) == ["Read", "Run"]
+    assert list(data["records"]["Read"]) == ["2024-01-02"]
+
+@pytest.mark.parametrize("kind", ["json", "sqlite"])
+def test_concurrent_adds_are_all_kept(data_root, monkeypatch, kind):
+    backend = JSONStorage(journal=True) if kind == "json" else SQLiteStorage(str(data_root / "habits.db"))
+    monkeypatch.setattr(storage, "_storage", CachedStorage(backend, DataCache()))
+    threads = [threading.Thread(target=habit_data.add_habit, args=(f"Habit {i}", "Daily", "2024-01-01", USER))
+               for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(names(backend.load(USER))) == sorted(f"Habit {i}" for i in range(8))
+
+def test_sqlite_reads_use_range_queries(data_root, monkeypatch):
+    monkeypatch.setenv("HABIT_STORAGE", "sqlite")
+    monkeypatch.setenv("HABIT_DB_PATH", str(data_root / "habits.db"))
+    monkeypatch.setattr(storage, "_storage", None)
+    backend = storage.get_storage()
+    assert isinstance(backend, SQLiteStorage)
+    backend.save({"habits": [habit("Read")], "records": {"Read": {"2024-01-01": True, "2024-03-01": True}}}, USER)
+    assert backend.load_range("2024-02-01", "2024-03-31", USER)["records"] == {"Read": {"2024-03-01": True}}
+
+def test_sqlite_writes_only_changed_record_rows(data_root):
+    backend = SQLiteStorage(str(data_root / "habits.db"))
+    days = {f"2024-{month:02d}-{day:02d}": True for month in range(1, 13) for day in range(1, 29)}
+    backend.save({"habits": [habit("Read")], "records": {"Read": dict(days)}}, USER)
+    conn = backend._connect()
+
+    def rows_touched(write):
+        before = conn.total_changes
+        write()
+        return conn.total_changes - before
+
+    # Adding a habit rewrites the habit rows and the change counter, not the 336 records.
+    assert rows_touched(lambda: backend.update(lambda data: data["habits"].append(habit("Run")), USER)) <= 5
+    def rename(data):
+        data["habits"][0]["name"] = "Reading"
+        data["records"]["Reading"] = data["records"].pop("Read")
+    assert rows_touched(lambda: backend.update(rename, USER)) > 2 * len(days)
+    changed = dict(days, **{"2024-01-01": False, "2025-01-01": True})
+    assert rows_touched(lambda: backend.save({"habits": [habit("Reading")], "records": {"Reading": changed}}, USER)) <= 6
+    data = backend.load(USER)
+    assert names(data) == ["Reading"]
+    assert data["records"]["Reading"] == changed
+    assert backend.stamp(USER)[1] == (1 + len(changed)) * SQLiteStorage.ROW_BYTES
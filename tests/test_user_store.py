@@ -0,0 +1,67 @@
+import hashlib
+import json
+import pytest
+import user_store
+from user_store import UserStore
+
+@pytest.fixture(autouse=True)
+def cheap_scrypt(data_root, monkeypatch):
+    monkeypatch.setattr(user_store, "SCRYPT_N", 2 ** 10)
+
+def test_register_and_verify():
+    store = UserStore()
+    assert store.register("alice", "correct horse")
+    assert not store.register("alice", "other")
+    assert store.verify("alice", "correct horse")
+    assert not store.verify("alice", "wrong")
+    assert not store.verify("bob", "correct horse")
+    assert store.get("alice")["password"].startswith(f"scrypt${2 ** 10}$")
+
+def test_same_password_gets_a_different_salt():
+    store = UserStore()
+    store.register("alice", "correct horse")
+    store.register("bob", "correct horse")
+    assert store.get("alice")["password"] != store.get("bob")["password"]
+
+def test_other_processes_see_appended_users():
+    UserStore().register("alice", "correct horse")
+    other = UserStore()
+    assert other.verify("alice", "correct horse")
+    UserStore().register("bob", "battery staple")
+    assert other.exists("bob")
+
+def test_unknown_user_still_runs_the_kdf(monkeypatch):
+    store = UserStore()
+    store.register("alice", "correct horse")
+    calls = []
+    real_scrypt = hashlib.scrypt
+    monkeypatch.setattr(hashlib, "scrypt", lambda *a, **kw: calls.append(kw["n"]) or real_scrypt(*a, **kw))
+    assert not store.verify("bob", "correct horse")
+    assert not store.verify("alice", "wrong")
+    assert calls == [2 ** 10, 2 ** 10]
+
+def test_legacy_users_are_imported_and_upgraded_on_login(data_root):
+    legacy = hashlib.sha256(b"correct horse").hexdigest()
+    (data_root / "users.json").write_text(json.dumps([{"username": "alice", "password": legacy}]))
+    store = UserStore()
+    assert store.migrate() == 1
+    assert store.migrate() == 0
+    assert store.get("alice")["password"] == legacy
+    assert not store.verify("alice", "wrong")
+    assert store.get("alice")["password"] == legacy
+    assert store.verify("alice", "correct horse")
+    upgraded = store.get("alice")["password"]
+    assert upgraded.startswith("scrypt$")
+    assert not user_store.needs_rehash(upgraded)
+    # The upgrade is appended, so a fresh process reads it too.
+    other = UserStore()
+    assert other.get("alice")["password"] == upgraded
+    assert other.verify("alice", "correct horse")
+
+def test_outdated_cost_is_rehashed_on_login(monkeypatch):
+    store = UserStore()
+    store.register("alice", "correct horse")
+    monkeypatch.setattr(user_store, "SCRYPT_N", 2 ** 11)
+    assert store.verify("alice", "correct horse")
+    assert store.get("alice")["password"].startswith(f"scrypt${2 ** 11}$")
+    assert store.verify("alice", "correct horse")
@@ -0,0 +1,76 @@
+import os
+import pytest
+import aggregates
+import habit_data
+import storage
+import user_store
+import versions
+from storage import JSONStorage
+
+USER = "alice"
+
+@pytest.fixture(autouse=True)
+def store(data_root, monkeypatch):
+    monkeypatch.setattr(storage, "_storage", JSONStorage(journal=True))
+    monkeypatch.setattr(aggregates, "_store", aggregates.AggregateStore())
+    monkeypatch.setattr(user_store, "_store", None)
+    store = versions.VersionStore()
+    monkeypatch.setattr(versions, "_store", store)
+    return store
+
+@pytest.fixture
+def client():
+    from app_flask import create_app
+    client = create_app().test_client()
+    client.post("/register", data={"username": USER, "password": "correct horse"})
+    return client
+
+def test_get_does_not_create_the_version_file(store):
+    assert store.get(USER) == versions.MISSING
+    assert store.etag(USER, ("data",)) is None
+    assert not os.path.exists(versions.get_version_file(USER))
+
+def test_bump_is_durable(store, monkeypatch):
+    synced = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: synced.append(fd) or real_fsync(fd))
+    store.bump(USER)
+    assert synced
+
+def test_etag_changes_with_each_bump_and_with_a_new_epoch(store):
+    store.bump(USER)
+    first = store.etag(USER, ("data",))
+    assert store.etag(USER, ("data",)) == first
+    store.bump(USER, "chat")
+    assert store.etag(USER, ("data",)) == first
+    store.bump(USER)
+    second = store.etag(USER, ("data",))
+    assert second != first
+    # A fresh file (deleted or restored) starts from the same counters but a new epoch.
+    os.remove(versions.get_version_file(USER))
+    store.bump(USER)
+    assert store.etag(USER, ("data",)) not in (first, second)
+
+def test_get_habits_answers_304_until_the_next_write(client):
+    habit_data.add_habit("Read", "Daily", "2026-01-01", USER)
+    response = client.get("/get_habits")
+    etag = response.headers["ETag"]
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "private, no-cache"
+    response = client.get("/get_habits", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    habit_data.mark_habit("Read", "2026-01-02", True, USER)
+    response = client.get("/get_habits", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+def test_reads_before_the_first_write_are_not_cached(client):
+    path = versions.get_version_file(USER)
+    if os.path.exists(path):
+        os.remove(path)
+    response = client.get("/get_habits")
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
+    assert client.get("/calendar?year=2026&month=1").status_code == 200
+    assert not os.path.exists(path)
@@ -0,0 +1,260 @@
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+# Benchmark and load-test harness for the habit tracker.
+# Generates synthetic users in a scratch directory, micro-benchmarks the
+# habit_data hot paths, then drives the Flask app through its test client at
+# increasing concurrency (one thread and one logged-in user per worker), with
+# /ai_planning answered by the local fake OpenAI server. Results are written as
+# JSON and can be compared against a stored baseline; the exit status is 1 if
+# any metric regressed beyond the tolerance, so deploys can be gated on it.
+# Timings depend on the machine, so no baseline is shipped: record one on the
+# machine that runs the comparison (e.g. from the last release), then compare:
+#
+#   python tools/bench.py --output baseline.json --save-baseline bench_baseline.json
+#   python tools/bench.py --output bench.json --baseline bench_baseline.json --tolerance 0.25
+#
+# The app modules are imported after switching into the scratch directory
+# (they use relative paths), so user data on disk is never touched.
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+DEFAULT_SCHEDULE_MIX = "Daily:4,Weekly:2,Bi-daily:1,Monthly:1,Every 3 days:1,Weekdays: Mon, Wed, Fri:1"
+HTTP_ROUTES = ["get_habits", "agenda", "calendar", "calendar_year", "get_chat_history", "mark", "ai_planning"]
+
+def parse_schedule_mix(text):
+    """Parse 'Daily:4,Weekly:2' into [(schedule, weight)]. Schedules may contain ':' and ',' ('Weekdays: Mon, Wed:1')."""
+    mix = [(name.strip(), int(weight)) for name, weight in re.findall(r"\s*(.+?):\s*(\d+)\s*(?:,|$)", text)]
+    if not mix:
+        raise ValueError(f"invalid schedule mix: {text}")
+    return mix
+
+def synthetic_user(rng, habits, history_days, schedule_mix, today):
+    """Return a user document with `habits` habits started history_days ago and ~70% of occurrences marked done."""
+    from schedule import compile_habit
+    names = [name for name, _ in schedule_mix]
+    weights = [weight for _, weight in schedule_mix]
+    start = today - timedelta(days=history_days)
+    data = {"habits": [], "records": {}}
+    for i in range(habits):
+        habit = {"name": f"Habit {i}", "schedule": rng.choices(names, weights)[0],
+                 "start_date": (start + timedelta(days=rng.randrange(7))).isoformat()}
+        data["habits"].append(habit)
+        records = {}
+        for day in compile_habit(habit).occurrences(start, today - timedelta(days=1)):
+            if rng.random() < 0.7:
+                records[day.isoformat()] = True
+        data["records"][habit["name"]] = records
+    return data
+
+def percentiles(samples):
+    """Return count, mean, p50, p95 and p99 (milliseconds) of a list of durations in seconds."""
+    ordered = sorted(samples)
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000, 3)
+    return {"count": len(ordered), "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+            "p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+def time_calls(fn, iterations):
+    """Call fn() iterations times and return percentiles of the durations."""
+    samples = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - started)
+    return percentiles(samples)
+
+def micro_benchmarks(users, iterations, today):
+    """Time the habit_data hot paths for the first synthetic user."""
+    import habit_data
+    username = users[0]
+    data = habit_data.load_data(username)
+    names = [h["name"] for h in data["habits"]]
+    def agenda_date(i):
+        return (today - timedelta(days=i % 60)).isoformat()
+    def month(i):
+        first = today.replace(day=1) - timedelta(days=31 * (i % 12))
+        return first.year, first.month
+    return {
+        "load_data": time_calls(lambda i: habit_data.load_data(username), iterations),
+        "save_data": time_calls(lambda i: habit_data.save_data(data, username), iterations),
+        "mark_habit": time_calls(lambda i: habit_data.mark_habit(names[i % len(names)], agenda_date(i), i % 2 == 0,
+                                                                 username), iterations),
+        "get_agenda": time_calls(lambda i: habit_data.get_agenda(agenda_date(i), username), iterations),
+        "get_monthly_completion": time_calls(lambda i: habit_data.get_monthly_completion(*month(i), username=username),
+                                             iterations),
+    }
+
+def route_request(client, route, i, today, habit_names):
+    """Issue one request for the named route and return the response."""
+    day = (today - timedelta(days=i % 30)).isoformat()
+    if route == "get_habits":
+        return client.get("/get_habits")
+    if route == "agenda":
+        return client.get(f"/agenda?date={day}")
+    if route == "calendar":
+        return client.get(f"/calendar?year={today.year}&month={today.month}")
+    if route == "calendar_year":
+        return client.get(f"/calendar/year?year={today.year}")
+    if route == "get_chat_history":
+        return client.get("/get_chat_history?limit=50")
+    if route == "mark":
+        return client.post("/mark", json={"habit": habit_names[i % len(habit_names)], "date": day, "done": i % 2 == 0})
+    if route == "ai_planning":
+        return client.post("/ai_planning", json={"message": "What should I focus on this week?"})
+    raise ValueError(f"unknown route {route}")
+
+def load_test(app, users, passwords, routes, concurrency_levels, requests_per_level, today, habit_names):
+    """Drive each route at each concurrency level. Returns {route: {concurrency: stats}}."""
+    results = {}
+    for route in routes:
+        results[route] = {}
+        for concurrency in concurrency_levels:
+            clients = []
+            for worker in range(concurrency):
+                client = app.test_client()
+                username = users[worker % len(users)]
+                client.post("/login", data={"username": username, "password": passwords[username]})
+                clients.append(client)
+            samples = []
+            errors = [0]
+            lock = threading.Lock()
+            def worker_loop(worker):
+                local = []
+                for i in range(worker, requests_per_level, concurrency):
+                    started = time.perf_counter()
+                    response = route_request(clients[worker], route, i, today, habit_names)
+                    local.append(time.perf_counter() - started)
+                    if response.status_code >= 400:
+                        with lock:
+                            errors[0] += 1
+                with lock:
+                    samples.extend(local)
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(worker_loop, range(concurrency)))
+            elapsed = time.perf_counter() - started
+            stats = percentiles(samples)
+            stats["throughput_rps"] = round(len(samples) / elapsed, 1)
+            stats["errors"] = errors[0]
+            results[route][str(concurrency)] = stats
+            print(f"{route:>18} x{concurrency:<3} {stats['throughput_rps']:>8} req/s  "
+                  f"p50 {stats['p50_ms']} ms  p95 {stats['p95_ms']} ms  p99 {stats['p99_ms']} ms", file=sys.stderr)
+    return results
+
+def compare(results, baseline, tolerance):
+    """Return a list of regressions of results against baseline (latency up or throughput down by more than tolerance)."""
+    if baseline.get("config") != results.get("config"):
+        # Numbers from different workloads are not comparable.
+        return [f"config differs from baseline: {results.get('config')} vs {baseline.get('config')}"]
+    regressions = []
+    for name, stats in baseline.get("micro", {}).items():
+        current = results.get("micro", {}).get(name)
+        if current and current["p95_ms"] > stats["p95_ms"] * (1 + tolerance):
+            regressions.append(f"micro {name}: p95 {current['p95_ms']} ms vs baseline {stats['p95_ms']} ms")
+    for route, levels in baseline.get("http", {}).items():
+        for concurrency, stats in levels.items():
+            current = results.get("http", {}).get(route, {}).get(concurrency)
+            if not current:
+                continue
+            if current["p95_ms"] > stats["p95_ms"] * (1 + tolerance):
+                regressions.append(f"http {route} x{concurrency}: p95 {current['p95_ms']} ms "
+                                   f"vs baseline {stats['p95_ms']} ms")
+            if current["throughput_rps"] < stats["throughput_rps"] * (1 - tolerance):
+                regressions.append(f"http {route} x{concurrency}: {current['throughput_rps']} req/s "
+                                   f"vs baseline {stats['throughput_rps']} req/s")
+    return regressions
+
+def run(args):
+    """Set up the scratch environment, run every benchmark and return the results dict."""
+    workdir = tempfile.mkdtemp(prefix="habit-bench-")
+    os.chdir(workdir)
+    os.environ["HABIT_STORAGE"] = args.backend
+    os.environ.setdefault("HABIT_SCRYPT_N", "1024")  # registration cost is not what we measure
+    sys.path.insert(0, os.path.abspath(APP_DIR))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from fake_openai import start_fake_openai
+    server, base_url = start_fake_openai(latency_ms=args.openai_latency_ms)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+    from storage import get_storage
+    from user_store import get_user_store
+    rng = random.Random(args.seed)
+    today = date.today()
+    schedule_mix = parse_schedule_mix(args.schedule_mix)
+    users, passwords = [], {}
+    for u in range(args.users):
+        username = f"bench{u}"
+        passwords[username] = f"pw-{u}"
+        get_user_store().register(username, passwords[username])
+        get_storage().save(synthetic_user(rng, args.habits, args.days, schedule_mix, today), username)
+        users.append(username)
+    habit_names = [f"Habit {i}" for i in range(args.habits)]
+
+    results = {"config": {"users": args.users, "habits": args.habits, "days": args.days,
+                          "schedule_mix": args.schedule_mix, "backend": args.backend, "seed": args.seed,
+                          "iterations": args.iterations, "concurrency": args.concurrency,
+                          "requests": args.requests, "openai_latency_ms": args.openai_latency_ms},
+               "started": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    print(f"Synthetic data in {workdir}", file=sys.stderr)
+    results["micro"] = micro_benchmarks(users, args.iterations, today)
+    for name, stats in results["micro"].items():
+        print(f"{name:>24}: mean {stats['mean_ms']} ms  p95 {stats['p95_ms']} ms", file=sys.stderr)
+    from app_flask import create_app
+    routes = [r for r in HTTP_ROUTES if r in args.routes.split(",")]
+    results["http"] = load_test(create_app(), users, passwords, routes, args.concurrency, args.requests,
+                                today, habit_names)
+    server.shutdown()
+    return results
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Habit tracker benchmark and load test")
+    parser.add_argument("--users", type=int, default=8, help="number of synthetic users")
+    parser.add_argument("--habits", type=int, default=20, help="habits per user")
+    parser.add_argument("--days", type=int, default=365, help="days of history per user")
+    parser.add_argument("--schedule-mix", default=DEFAULT_SCHEDULE_MIX,
+                        help="weighted schedules, e.g. 'Daily:4,Weekly:2,Every 3 days:1'")
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--iterations", type=int, default=200, help="calls per micro-benchmark")
+    parser.add_argument("--concurrency", type=lambda s: [int(c) for c in s.split(",")], default=[1, 4, 16],
+                        help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="requests per route and concurrency level")
+    parser.add_argument("--routes", default=",".join(HTTP_ROUTES), help="comma-separated routes to load-test")
+    parser.add_argument("--openai-latency-ms", type=float, default=50, help="fake OpenAI response delay")
+    parser.add_argument("--output", help="write results JSON here (default: stdout)")
+    parser.add_argument("--baseline", help="compare against this results JSON and exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown before failing")
+    parser.add_argument("--save-baseline", help="also write the results to this baseline file")
+    args = parser.parse_args()
+    for path in ("output", "baseline", "save_baseline"):
+        if getattr(args, path):
+            setattr(args, path, os.path.abspath(getattr(args, path)))
+
+    results = run(args)
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        results["regressions"] = regressions
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            f.write(text + "\n")
+    if results.get("regressions"):
+        print("Regressions:\n  " + "\n  ".join(results["regressions"]), file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,101 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Minimal OpenAI-compatible stub for local testing and benchmarks.
+# Serves POST /v1/chat/completions (plain and stream=true) with canned answers
+# after a configurable delay, so /ai_planning can run without network access:
+#
+#   python tools/fake_openai.py --port 8001 --latency-ms 300
+#   OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=test python app/app_flask.py
+#
+# Requests whose system prompt mentions extracting actions get `actions`
+# (a JSON array string); every other request gets `answer`.
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    answer = "Sure! Here is a plan: 1. Stretch - five minutes every morning."
+    actions = "[]"
+    latency = 0.0
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        messages = body.get("messages", [])
+        is_extractor = any("extract" in m.get("content", "") for m in messages if m.get("role") == "system")
+        content = self.actions if is_extractor else self.answer
+        prompt_chars = sum(len(m.get("content", "")) for m in messages)
+        time.sleep(self.latency)
+        if body.get("stream"):
+            self._stream(body, content)
+        else:
+            self._send_json({
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+                "model": body.get("model", "fake"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": prompt_chars // 4, "completion_tokens": len(content) // 4,
+                          "total_tokens": (prompt_chars + len(content)) // 4},
+            })
+
+    def _send_json(self, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, body, content):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        words = content.split(" ")
+        for i, word in enumerate(words):
+            chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": body.get("model", "fake"),
+                     "choices": [{"index": 0, "delta": {"content": word + (" " if i < len(words) - 1 else "")},
+                                  "finish_reason": None}]}
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text):
+        data = text.encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+def start_fake_openai(port=0, latency_ms=0, answer=None, actions=None):
+    """Start the stub in a daemon thread. Returns (server, base_url)."""
+    attrs = {"latency": latency_ms / 1000.0}
+    if answer is not None:
+        attrs["answer"] = answer
+    if actions is not None:
+        attrs["actions"] = actions
+    handler = type("Handler", (FakeOpenAIHandler,), attrs)
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub server")
+    parser.add_argument("--port", type=int, default=int(os.getenv("FAKE_OPENAI_PORT", 8001)))
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--actions", default=None, help="JSON array returned to the action extractor")
+    args = parser.parse_args()
+    server, url = start_fake_openai(args.port, args.latency_ms, actions=args.actions)
+    print(f"Fake OpenAI listening on {url}", file=sys.stderr)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
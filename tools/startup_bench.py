@@ -0,0 +1,116 @@
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+# Start-up benchmark for the serving stack.
+#   python tools/startup_bench.py                  # cold import + first request, in fresh interpreters
+#   python tools/startup_bench.py --gunicorn 4     # time until gunicorn with 4 workers answers, RSS per worker
+# Reports medians as JSON; "openai_loaded" shows whether openai was imported
+# before any AI request (it should not be).
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+PROBE = r"""
+import json, sys, time
+started = time.perf_counter()
+import wsgi
+imported = time.perf_counter()
+response = wsgi.app.test_client().get("/login")
+first = time.perf_counter()
+rss_kb = 0
+with open("/proc/self/status") as f:
+    for line in f:
+        if line.startswith("VmRSS:"):
+            rss_kb = int(line.split()[1])
+print(json.dumps({"import_ms": (imported - started) * 1000, "first_request_ms": (first - imported) * 1000,
+                  "rss_mb": rss_kb / 1024, "status": response.status_code, "openai_loaded": "openai" in sys.modules}))
+"""
+
+def rss_mb(pid):
+    """Return a process's resident set size in MB (Linux /proc)."""
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def children(pid):
+    """Return the child pids of a process (Linux /proc)."""
+    found = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as f:
+            found.extend(int(child) for child in f.read().split())
+    return found
+
+def cold_start(runs, env):
+    """Run the probe in `runs` fresh interpreters and return median figures."""
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", PROBE], cwd=env["HABIT_BENCH_DIR"], env=env,
+                                capture_output=True, text=True, check=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {"runs": runs,
+            "import_ms": round(statistics.median(s["import_ms"] for s in samples), 1),
+            "first_request_ms": round(statistics.median(s["first_request_ms"] for s in samples), 1),
+            "rss_mb": round(statistics.median(s["rss_mb"] for s in samples), 1),
+            "openai_loaded": any(s["openai_loaded"] for s in samples)}
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def gunicorn_start(workers, env, timeout=60):
+    """Start gunicorn with the given worker count; return time until it answers and RSS of master and workers."""
+    port = free_port()
+    env = dict(env, HABIT_WORKERS=str(workers), HABIT_BIND=f"127.0.0.1:{port}")
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", os.path.join(APP_DIR, "gunicorn.conf.py"),
+                                "--access-logfile", "/dev/null", "wsgi:app"],
+                               cwd=env["HABIT_BENCH_DIR"], env=env, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            if time.perf_counter() - started > timeout or process.poll() is not None:
+                raise RuntimeError("gunicorn did not start")
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/login", timeout=1).read()
+                break
+            except OSError:
+                time.sleep(0.02)
+        ready_ms = (time.perf_counter() - started) * 1000
+        # Let every worker finish booting before measuring memory.
+        deadline = time.perf_counter() + timeout
+        while len(children(process.pid)) < workers and time.perf_counter() < deadline:
+            time.sleep(0.05)
+        time.sleep(0.5)
+        worker_rss = [round(rss_mb(pid), 1) for pid in children(process.pid)]
+        return {"workers": workers, "ready_ms": round(ready_ms, 1), "master_rss_mb": round(rss_mb(process.pid), 1),
+                "worker_rss_mb": worker_rss}
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=30)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure cold start time and per-worker memory")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters for the cold-start measurement")
+    parser.add_argument("--gunicorn", type=int, metavar="WORKERS", help="also start gunicorn with this many workers")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="habit-startup-")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [APP_DIR, os.getenv("PYTHONPATH")])),
+               HABIT_BENCH_DIR=workdir,
+               FLASK_SECRET_KEY=os.getenv("FLASK_SECRET_KEY", "startup-bench"))
+    results = {"cold_start": cold_start(args.runs, env)}
+    if args.gunicorn:
+        results["gunicorn"] = gunicorn_start(args.gunicorn, env)
+    print(json.dumps(results, indent=2))